@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from detect_changes import change_categories, compare_diagrams
+from records_cache import RecordsCache
+
+def pair_name(original_path, changed_path):
+    """Default result name for a pair of diagram files."""
+    original_stem = os.path.splitext(os.path.basename(original_path))[0]
+    changed_stem = os.path.splitext(os.path.basename(changed_path))[0]
+    if original_stem == changed_stem:
+        return changed_stem
+    return f'{original_stem}__{changed_stem}'
+
+def read_manifest(manifest_path):
+    """
+    Read diagram pairs from a manifest.
+
+    JSON manifests contain a list of {"original", "changed", "name"} objects or [original, changed]
+    lists. Any other file is read as one tab-separated "original<TAB>changed[<TAB>name]" pair per line.
+    Relative paths are resolved against the manifest's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    pairs = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        if manifest_path.endswith('.json'):
+            for entry in json.load(f):
+                if isinstance(entry, dict):
+                    pairs.append((entry['original'], entry['changed'], entry.get('name')))
+                else:
+                    pairs.append((entry[0], entry[1], entry[2] if len(entry) > 2 else None))
+        else:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                fields = line.split('\t')
+                pairs.append((fields[0], fields[1], fields[2] if len(fields) > 2 else None))
+
+    return [(os.path.join(base_dir, original), os.path.join(base_dir, changed),
+             name or pair_name(original, changed))
+            for original, changed, name in pairs]
+
+def pair_directories(original_dir, changed_dir):
+    """Pair XML files with the same relative path in two directories."""
+    pairs = []
+    for dirpath, _, filenames in os.walk(changed_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith('.xml'):
+                continue
+            changed_path = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(changed_path, changed_dir)
+            original_path = os.path.join(original_dir, relative_path)
+            if os.path.exists(original_path):
+                pairs.append((original_path, changed_path, os.path.splitext(relative_path)[0]))
+    return sorted(pairs, key=lambda pair: pair[2])
+
+def pair_revisions(revision_paths):
+    """Pair each revision with the next one."""
+    return [(original, changed, f'{index:04d}_{pair_name(original, changed)}')
+            for index, (original, changed) in enumerate(zip(revision_paths, revision_paths[1:]))]
+
+def unique_names(pairs):
+    """Make result names unique so no result file overwrites another."""
+    seen = {}
+    result = []
+    for original, changed, name in pairs:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        result.append((original, changed, name if count == 0 else f'{name}_{count}'))
+    return result
+
+# Per-process cache, created on first use in each worker
+_worker_cache = None
+
+def _get_worker_cache(cache_dir, streaming):
+    global _worker_cache
+    if cache_dir is None:
+        return None
+    if _worker_cache is None or _worker_cache.cache_dir != cache_dir:
+        _worker_cache = RecordsCache(cache_dir, streaming=streaming)
+    return _worker_cache
+
+def diff_pair(job):
+    """Compare one pair of diagrams, write its JSON result and return a summary entry."""
+    original_path, changed_path, name, output_path, streaming, cache_dir, indent = job
+    summary = {
+        'name': name,
+        'original': original_path,
+        'changed': changed_path,
+    }
+    start = time.perf_counter()
+    try:
+        cache = _get_worker_cache(cache_dir, streaming)
+        changes = compare_diagrams(original_path, changed_path, streaming=streaming, cache=cache)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(changes, f, indent=indent)
+        summary['output'] = output_path
+        summary['counts'] = {category: len(changes[category]) for category in change_categories}
+        summary['total'] = sum(summary['counts'].values())
+    except Exception as e:
+        summary['error'] = f'{type(e).__name__}: {e}'
+    summary['seconds'] = round(time.perf_counter() - start, 4)
+    return summary
+
+def run_batch(pairs, output_dir, workers=None, chunksize=1, streaming=False, cache_dir=None, indent=2):
+    """
+    Compare all (original, changed, name) pairs across a process pool.
+
+    Writes one <name>.json per pair plus summary.json to output_dir and returns the summary.
+    """
+    pairs = unique_names(pairs)
+    jobs = [(original, changed, name, os.path.join(output_dir, f'{name}.json'), streaming, cache_dir, indent)
+            for original, changed, name in pairs]
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [diff_pair(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(diff_pair, jobs, chunksize=chunksize))
+
+    summary = {
+        'pairs': len(results),
+        'failed': sum(1 for result in results if 'error' in result),
+        'changed': sum(1 for result in results if result.get('total')),
+        'seconds': round(time.perf_counter() - start, 4),
+        'results': results,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect changes for many pairs of draw.io XML diagrams in parallel')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help='JSON or tab-separated file listing original/changed pairs')
+    source.add_argument('--dirs', nargs=2, metavar=('ORIGINAL_DIR', 'CHANGED_DIR'),
+                        help='Pair XML files with the same relative path in two directories')
+    source.add_argument('--revisions', nargs='+', metavar='XML',
+                        help='Ordered revisions; each one is compared with the next')
+    parser.add_argument('--output-dir', required=True, help='Directory for the per-pair JSON results and summary.json')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs, 1 runs in-process)')
+    parser.add_argument('--chunksize', type=int, default=1, help='Pairs handed to a worker at a time (default: 1)')
+    parser.add_argument('--stream', action='store_true', help='Read the diagrams with a streaming parser')
+    parser.add_argument('--cache-dir', help='Reuse extracted records from this records cache directory')
+    parser.add_argument('--compact', action='store_true', help='Write the per-pair JSON results without indentation')
+    args = parser.parse_args()
+
+    if args.manifest:
+        pairs = read_manifest(args.manifest)
+    elif args.dirs:
+        pairs = pair_directories(*args.dirs)
+    else:
+        pairs = pair_revisions(args.revisions)
+
+    summary = run_batch(pairs, args.output_dir, workers=args.workers, chunksize=args.chunksize,
+                        streaming=args.stream, cache_dir=args.cache_dir,
+                        indent=None if args.compact else 2)
+
+    print(f"Compared {summary['pairs']} pairs in {summary['seconds']}s: "
+          f"{summary['changed']} with changes, {summary['failed']} failed")
+    for result in summary['results']:
+        if 'error' in result:
+            print(f"  {result['name']}: {result['error']}", file=sys.stderr)
+
+    if summary['failed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from detect_changes import compare_diagrams
+from diagram_index import DiagramIndex
+from diagram_records import load_records
+from generate_new_diagrams import ChangeIndex, diagram_file_names, generate_diagrams
+from print_changes import print_report
+from render_diagram import RenderCache
+from synthetic_diagram import generate_diagram_pair
+
+files_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+default_baseline = os.path.join(files_dir, 'benchmarks', 'baseline.json')
+
+default_sizes = [1000, 10000, 100000]
+benchmark_stages = ['parse', 'detect', 'report', 'generate', 'render-prep']
+
+class BenchmarkCase:
+    """
+    One synthetic diagram pair and the state handed from stage to stage.
+
+    Every stage is a method that only uses the state of earlier stages, so it can be repeated on
+    its own for timing and memory profiling.
+    """
+
+    def __init__(self, work_dir, size, seed=0):
+        self.work_dir = work_dir
+        self.original_xml = os.path.join(work_dir, 'original.xml')
+        self.changed_xml = os.path.join(work_dir, 'changed.xml')
+        generate_diagram_pair(size, self.original_xml, self.changed_xml, seed=seed)
+        self.output_paths = {name: os.path.join(work_dir, file_name) for name, file_name in diagram_file_names.items()}
+
+    def parse(self):
+        self.original_index = DiagramIndex.from_file(self.original_xml)
+        self.changed_index = DiagramIndex.from_file(self.changed_xml)
+
+    def detect(self):
+        original_records = load_records(self.original_index)
+        changed_records = load_records(self.changed_index)
+        self.changes = compare_diagrams(original_records, changed_records)
+
+    def report(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            print_report(self.changes)
+
+    def generate(self):
+        generate_diagrams(self.original_index, self.changed_index, ChangeIndex(self.changes), self.output_paths)
+
+    def render_prep(self):
+        # Everything the draw.io render does before starting the renderer: the cache key of every
+        # generated diagram and staging it in a batch input directory
+        stage_dir = os.path.join(self.work_dir, 'render_in')
+        os.makedirs(stage_dir, exist_ok=True)
+        for position, path in enumerate(self.output_paths.values()):
+            RenderCache.key(path, 'png', 'benchmark')
+            shutil.copyfile(path, os.path.join(stage_dir, f'job{position}.xml'))
+        shutil.rmtree(stage_dir)
+
+    def element_count(self):
+        return len(self.original_index.objects) + len(self.original_index.cells)
+
+def run_stage(function, repeat):
+    """Best wall time of `repeat` runs, then peak traced memory of one more run."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(best, 6), 'peak_bytes': peak}
+
+def run_benchmarks(sizes=default_sizes, repeat=3, seed=0, stages=benchmark_stages):
+    """Time and memory-profile the selected stages on synthetic diagrams of every size."""
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix='diagram_benchmark_') as work_dir:
+            case = BenchmarkCase(work_dir, size, seed=seed)
+            size_results = {}
+            # Stages after the last selected one are not needed
+            last = max(benchmark_stages.index(stage) for stage in stages)
+            for stage in benchmark_stages[:last + 1]:
+                # Stages that are not benchmarked still run once to provide the state of later stages
+                function = getattr(case, stage.replace('-', '_'))
+                if stage in stages:
+                    size_results[stage] = run_stage(function, repeat)
+                else:
+                    function()
+            results[str(size)] = {'elements': case.element_count(), 'stages': size_results}
+    return results
+
+def compare_results(results, baseline, tolerance=0.25, min_seconds=0.005):
+    """
+    Stages that got slower or use more memory than the baseline by more than `tolerance`.
+
+    Stages faster than min_seconds are not compared on time, as they are dominated by noise.
+    """
+    regressions = []
+    for size, size_results in results.items():
+        baseline_stages = baseline.get('results', {}).get(size, {}).get('stages', {})
+        for stage, measured in size_results['stages'].items():
+            reference = baseline_stages.get(stage)
+            if reference is None:
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                if metric == 'seconds' and reference[metric] < min_seconds:
+                    continue
+                if reference[metric] and measured[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append({'size': size, 'stage': stage, 'metric': metric,
+                                        'baseline': reference[metric], 'measured': measured[metric],
+                                        'ratio': round(measured[metric] / reference[metric], 2)})
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"{'size':>8}  {'stage':<12}  {'time':>10}  {'peak memory':>12}  {'vs. baseline':>12}")
+    for size, size_results in results.items():
+        baseline_stages = (baseline or {}).get('results', {}).get(size, {}).get('stages', {})
+        for stage, measured in size_results['stages'].items():
+            reference = baseline_stages.get(stage)
+            relative = f"{measured['seconds'] / reference['seconds']:.2f}x" if reference and reference['seconds'] else ''
+            print(f"{size:>8}  {stage:<12}  {measured['seconds'] * 1000:8.1f}ms  "
+                  f"{measured['peak_bytes'] / 1024 / 1024:10.1f}MB  {relative:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark detect, report, generate and render preparation on synthetic diagrams')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in default_sizes),
+                        help=f"Comma-separated diagram sizes in elements (default: {','.join(str(size) for size in default_sizes)})")
+    parser.add_argument('--stages', default=','.join(benchmark_stages),
+                        help=f"Comma-separated stages to benchmark (default: {','.join(benchmark_stages)})")
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage; the best is kept (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic diagrams (default: 0)')
+    parser.add_argument('--baseline', default=default_baseline,
+                        help='Baseline file, saved per machine and not committed (default: files/benchmarks/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare against the baseline and exit with status 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown or memory growth before a stage is flagged (default: 0.25)')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in benchmark_stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    baseline = None
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            parser.error(f"no baseline at {args.baseline}; run with --save-baseline first")
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(sizes, repeat=args.repeat, seed=args.seed, stages=stages)
+    print_results(results, baseline)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(),
+              'seed': args.seed, 'repeat': args.repeat, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if baseline is not None:
+        regressions = compare_results(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression['size']} elements, {regression['stage']}: {regression['metric']} "
+                      f"{regression['baseline']} -> {regression['measured']} ({regression['ratio']}x)")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
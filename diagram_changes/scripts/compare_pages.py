@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from detect_changes import compare_diagrams, count_changes
+from diagram_records import DiagramRecords
+from mxfile import match_pages, read_pages
+
+def compare_page_xml(job):
+    """Compare the <mxGraphModel> XML bytes of two matched pages."""
+    original_xml, changed_xml, streaming = job
+    return compare_diagrams(DiagramRecords.from_bytes(original_xml, streaming=streaming),
+                            DiagramRecords.from_bytes(changed_xml, streaming=streaming))
+
+def compare_mxfiles(original_path, changed_path, workers=None, streaming=False):
+    """
+    Compare two draw.io files page by page.
+
+    Pages are matched by id, then by name. Matched pages are diffed in parallel across a process
+    pool; pages that exist on one side only are reported as added or removed.
+    """
+    pairs = match_pages(read_pages(original_path), read_pages(changed_path))
+    matched = [(original_page, changed_page) for original_page, changed_page in pairs
+               if original_page is not None and changed_page is not None]
+    jobs = [(original_page.xml, changed_page.xml, streaming) for original_page, changed_page in matched]
+
+    if workers == 1 or len(jobs) <= 1:
+        results = [compare_page_xml(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(compare_page_xml, jobs))
+    changes_by_page = {id(changed_page): changes for (_, changed_page), changes in zip(matched, results)}
+
+    pages = []
+    for original_page, changed_page in pairs:
+        page = changed_page if changed_page is not None else original_page
+        entry = {'id': page.id, 'name': page.name}
+        if original_page is None:
+            entry['status'] = 'added'
+        elif changed_page is None:
+            entry['status'] = 'removed'
+        else:
+            changes = changes_by_page[id(changed_page)]
+            entry['status'] = 'changed' if count_changes(changes) else 'unchanged'
+            entry['changes'] = changes
+        pages.append(entry)
+    return {'pages': pages}
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect changes page by page between two draw.io files')
+    parser.add_argument('original', help='Original .drawio/.xml file')
+    parser.add_argument('changed', help='Changed .drawio/.xml file')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files/diagram_page_changes.json'),
+                        help='Output JSON file (default: files/diagram_page_changes.json)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes for diffing pages (default: number of CPUs)')
+    parser.add_argument('--stream', action='store_true', help='Read the pages with a streaming parser')
+    args = parser.parse_args()
+
+    result = compare_mxfiles(args.original, args.changed, workers=args.workers, streaming=args.stream)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    for page in result['pages']:
+        label = page['name'] or page['id'] or '(page)'
+        if 'changes' in page:
+            total = count_changes(page['changes'])
+            print(f"{label}: {page['status']} ({total} changes)")
+        else:
+            print(f"{label}: {page['status']}")
+
+if __name__ == '__main__':
+    main()
@@ -1,203 +1,93 @@
-import xml.etree.ElementTree as ET
+import argparse
 import json
 import os
 
-def extract_mxcell_info(mxcell_elem):
-    """Extract information from an mxCell element including its geometry."""
-    info = {
-        'style': mxcell_elem.get('style'),
-        'parent': mxcell_elem.get('parent'),
-        'vertex': mxcell_elem.get('vertex'),
-        'edge': mxcell_elem.get('edge'),
-        'source': mxcell_elem.get('source'),
-        'target': mxcell_elem.get('target'),
-        'id': mxcell_elem.get('id'),
-        'value': mxcell_elem.get('value')
-    }
-    
-    # Get geometry if it exists
-    geometry = mxcell_elem.find('mxGeometry')
-    if geometry is not None:
-        info['geometry'] = {
-            'x': geometry.get('x'),
-            'y': geometry.get('y'),
-            'width': geometry.get('width'),
-            'height': geometry.get('height'),
-            'relative': geometry.get('relative'),
-        }
-    
-    return {k: v for k, v in info.items() if v is not None}
+from diagram_index import DiagramIndex
+from diagram_records import load_records
+from instrumentation import add_metrics_arguments, enabled, instrument_from_args, span, timed_items
+from records_cache import RecordsCache, default_cache_dir
 
-def extract_standalone_mxcell_info(mxcell_elem):
-    """Extract information from a standalone mxCell element."""
-    info = extract_mxcell_info(mxcell_elem)
-    
-    # For standalone cells, we want to include any child elements that might contain text/labels
-    edge_label = mxcell_elem.find('.//mxGeometry//*[@value]')
-    if edge_label is not None:
-        info['label'] = edge_label.get('value')
-    
-    return info
-
-def extract_generic_object_info(object_elem, include_mxcell=False):
-    """Extract information from a generic object element."""
-    info = {
-        'label': object_elem.get('label'),
-        'objectId': object_elem.get('id')
-    }
-    
-    # Only include mxCell if specifically requested
-    if include_mxcell:
-        mxcell = object_elem.find('mxCell')
-        if mxcell is not None:
-            info['mxCell'] = extract_mxcell_info(mxcell)
-    
-    return info
-
-def extract_fact_sheet_info(object_elem, include_mxcell=False):
-    """Extract relevant information from a factSheet object element."""
-    info = {
-        'label': object_elem.get('label'),
-        'factSheetType': object_elem.get('factSheetType'),
-        'factSheetId': object_elem.get('factSheetId'),
-        'objectId': object_elem.get('id')
-    }
-    
-    # Only include mxCell if specifically requested
-    if include_mxcell:
-        mxcell = object_elem.find('mxCell')
-        if mxcell is not None:
-            info['mxCell'] = extract_mxcell_info(mxcell)
-    
-    return info
-
-def extract_relation_info(object_elem, include_mxcell=False):
-    """Extract relevant information from a relation object element."""
-    info = {
-        'dependencyRelation': object_elem.get('dependencyRelation'),
-        'relationId': object_elem.get('relationId'),
-        'sourceFactSheetId': object_elem.get('sourceFactSheetId'),
-        'targetFactSheetId': object_elem.get('targetFactSheetId'),
-        'objectId': object_elem.get('id')
-    }
-    
-    # Only include mxCell if specifically requested
-    if include_mxcell:
-        mxcell = object_elem.find('mxCell')
-        if mxcell is not None:
-            info['mxCell'] = extract_mxcell_info(mxcell)
-    
-    return info
+# Categories of the change set, in output order
+change_categories = [
+    'addedFactSheets', 'removedFactSheets', 'changedFactSheets',
+    'addedRelations', 'removedRelations', 'changedRelations',
+    'addedObjects', 'removedObjects', 'changedObjects',
+    'addedCells', 'removedCells', 'changedCells',
+]
 
 def compare_mxcells(original_mxcell, changed_mxcell):
-    """Compare two mxCell elements and return their differences."""
+    """Compare two CellRecords and return their differences."""
     if original_mxcell is None or changed_mxcell is None:
         return None
     
-    original_info = extract_mxcell_info(original_mxcell)
-    changed_info = extract_mxcell_info(changed_mxcell)
-    
-    differences = {}
-    
-    # Compare all attributes
-    for key in set(original_info.keys()) | set(changed_info.keys()):
-        original_value = original_info.get(key)
-        changed_value = changed_info.get(key)
-        
-        if original_value != changed_value:
-            if isinstance(original_value, dict) and isinstance(changed_value, dict):
-                # Handle nested geometry differences
-                geo_diff = {}
-                for geo_key in set(original_value.keys()) | set(changed_value.keys()):
-                    orig_geo = original_value.get(geo_key)
-                    changed_geo = changed_value.get(geo_key)
-                    if orig_geo != changed_geo:
-                        geo_diff[geo_key] = {'from': orig_geo, 'to': changed_geo}
-                if geo_diff:
-                    differences[key] = geo_diff
-            else:
-                differences[key] = {'from': original_value, 'to': changed_value}
-    
-    return differences if differences else None
+    return original_mxcell.diff(changed_mxcell)
 
-def compare_objects(original_obj, changed_obj, extract_info_func):
-    """Compare two objects and return their differences."""
-    original_info = extract_info_func(original_obj, include_mxcell=True)
-    changed_info = extract_info_func(changed_obj, include_mxcell=True)
-    
-    differences = {}
-    
-    # Compare regular attributes
-    for key in set(original_info.keys()) - {'mxCell'}:
-        if original_info.get(key) != changed_info.get(key):
-            differences[key] = {
-                'from': original_info.get(key),
-                'to': changed_info.get(key)
-            }
-    
-    # Compare mxCell elements if they exist
-    original_mxcell = original_obj.find('mxCell')
-    changed_mxcell = changed_obj.find('mxCell')
-    mxcell_differences = compare_mxcells(original_mxcell, changed_mxcell)
-    
-    if mxcell_differences:
-        differences['mxCell'] = mxcell_differences
-    
+def compare_objects(original_obj, changed_obj):
+    """Compare two object records and return the changed object, or None if they are equal."""
+    differences = original_obj.diff(changed_obj)
     if differences:
-        result = extract_info_func(changed_obj, include_mxcell=False)  # Get current state without mxCell
+        result = changed_obj.to_dict()  # Get current state without mxCell
         result['changes'] = differences
         return result
     return None
 
-def get_objects_by_type(root, object_type):
-    """Get all objects of a specific type from the XML root."""
-    if object_type == 'generic':
-        return [elem for elem in root.findall(".//object") 
-                if elem.get('factSheetType') is None 
-                and elem.get('dependencyRelation') is None
-                and elem.get('label') is not None]  # Must have a label to be a valid generic object
-    else:
-        return [elem for elem in root.findall(".//object") 
-                if object_type == 'factSheet' and elem.get('factSheetType') is not None
-                or object_type == 'relation' and elem.get('dependencyRelation') is not None]
+def compare_cells(original_cell, changed_cell):
+    """Compare two standalone CellRecords and return the changed cell, or None if they are equal."""
+    differences = compare_mxcells(original_cell, changed_cell)
+    if differences:
+        result = changed_cell.to_dict()
+        result['changes'] = differences
+        return result
+    return None
 
-def compare_diagrams(original_xml_path, changed_xml_path):
-    # Parse XML files
-    original_tree = ET.parse(original_xml_path)
-    changed_tree = ET.parse(changed_xml_path)
-    
-    original_root = original_tree.getroot()
-    changed_root = changed_tree.getroot()
-    
-    # Get standalone mxCells (direct children of root/1)
-    original_cells = original_root.findall(".//root/mxCell[@id!='0'][@id!='1']") + original_root.findall(".//root/mxCell[@value]")
-    changed_cells = changed_root.findall(".//root/mxCell[@id!='0'][@id!='1']") + changed_root.findall(".//root/mxCell[@value]")
-    
-    # Create dictionaries for standalone mxCells
-    original_cells_by_id = {elem.get('id'): elem for elem in original_cells}
-    changed_cells_by_id = {elem.get('id'): elem for elem in changed_cells}
-    
-    # Get fact sheets, relations, and generic objects from both XMLs
-    original_fact_sheets = get_objects_by_type(original_root, 'factSheet')
-    changed_fact_sheets = get_objects_by_type(changed_root, 'factSheet')
-    original_relations = get_objects_by_type(original_root, 'relation')
-    changed_relations = get_objects_by_type(changed_root, 'relation')
-    original_generic_objects = get_objects_by_type(original_root, 'generic')
-    changed_generic_objects = get_objects_by_type(changed_root, 'generic')
-    
-    # Create dictionaries for easy lookup by ID
-    original_fact_sheets_by_id = {elem.get('id'): elem for elem in original_fact_sheets}
-    changed_fact_sheets_by_id = {elem.get('id'): elem for elem in changed_fact_sheets}
-    original_relations_by_id = {elem.get('id'): elem for elem in original_relations}
-    changed_relations_by_id = {elem.get('id'): elem for elem in changed_relations}
-    original_generic_by_id = {elem.get('id'): elem for elem in original_generic_objects}
-    changed_generic_by_id = {elem.get('id'): elem for elem in changed_generic_objects}
-    
-    # Create dictionaries for factSheetId/relationId lookup for added/removed detection
-    original_fact_sheets_by_fs_id = {elem.get('factSheetId'): elem for elem in original_fact_sheets}
-    changed_fact_sheets_by_fs_id = {elem.get('factSheetId'): elem for elem in changed_fact_sheets}
-    original_relations_by_rel_id = {elem.get('relationId'): elem for elem in original_relations}
-    changed_relations_by_rel_id = {elem.get('relationId'): elem for elem in changed_relations}
+def empty_changes():
+    """Change set without any changes."""
+    changes = {category: [] for category in change_categories}
+    changes['factSheetLabels'] = {}
+    return changes
+
+def count_changes(changes):
+    """Total number of changes in a change set."""
+    return sum(len(changes[category]) for category in change_categories)
+
+def get_fact_sheet_label(fact_sheet_id, original_records, changed_records):
+    """Label of a fact sheet, preferring the original diagram, or None if it has no label."""
+    for records in (original_records, changed_records):
+        record = records.fact_sheets_by_fs_id.get(fact_sheet_id)
+        if record is not None and record.label:
+            return record.label
+    return None
+
+def iter_changes(original, changed, streaming=False, cache=None):
+    """
+    Compare two diagrams and yield the detected changes one record at a time.
+    
+    Every record is a dict with the change set 'category' (e.g. 'addedFactSheets'), its 'kind'
+    ('added', 'removed' or 'changed') and the changed 'item'. Records are yielded in category order.
+    Before a relation, 'label' records with the category 'factSheetLabels' and a
+    {'factSheetId', 'label'} item give the labels of the fact sheets it points to that have not
+    been yielded yet. Diagrams can be given like for compare_diagrams.
+    """
+    original_records = load_records(original, streaming=streaming, cache=cache)
+    changed_records = load_records(changed, streaming=streaming, cache=cache)
+    
+    # Standalone mxCells (direct children of root/1)
+    original_cells_by_id = original_records.cells
+    changed_cells_by_id = changed_records.cells
+    
+    # Fact sheets, relations, and generic objects by object ID
+    original_fact_sheets_by_id = original_records.fact_sheets
+    changed_fact_sheets_by_id = changed_records.fact_sheets
+    original_relations_by_id = original_records.relations
+    changed_relations_by_id = changed_records.relations
+    original_generic_by_id = original_records.generic_objects
+    changed_generic_by_id = changed_records.generic_objects
+    
+    # factSheetId/relationId lookup for added/removed detection
+    original_fact_sheets_by_fs_id = original_records.fact_sheets_by_fs_id
+    changed_fact_sheets_by_fs_id = changed_records.fact_sheets_by_fs_id
+    original_relations_by_rel_id = original_records.relations_by_rel_id
+    changed_relations_by_rel_id = changed_records.relations_by_rel_id
     
     # Find added and removed fact sheets (based on factSheetId)
     added_fact_sheet_ids = set(changed_fact_sheets_by_fs_id.keys()) - set(original_fact_sheets_by_fs_id.keys())
@@ -221,112 +111,186 @@ def compare_diagrams(original_xml_path, changed_xml_path):
     common_relation_ids = set(original_relations_by_id.keys()) & set(changed_relations_by_id.keys())
     common_generic_ids = set(original_generic_by_id.keys()) & set(changed_generic_by_id.keys())
     
-    # Create result lists
-    added_fact_sheets = [extract_fact_sheet_info(changed_fact_sheets_by_fs_id[id]) 
-                        for id in added_fact_sheet_ids]
-    removed_fact_sheets = [extract_fact_sheet_info(original_fact_sheets_by_fs_id[id]) 
-                          for id in removed_fact_sheet_ids]
-    added_relations = [extract_relation_info(changed_relations_by_rel_id[id]) 
-                      for id in added_relation_ids]
-    removed_relations = [extract_relation_info(original_relations_by_rel_id[id]) 
-                        for id in removed_relation_ids]
-    added_objects = [extract_generic_object_info(changed_generic_by_id[id])
-                    for id in added_generic_ids]
-    removed_objects = [extract_generic_object_info(original_generic_by_id[id])
-                      for id in removed_generic_ids]
-    added_cells = [extract_standalone_mxcell_info(changed_cells_by_id[id])
-                  for id in added_cell_ids]
-    removed_cells = [extract_standalone_mxcell_info(original_cells_by_id[id])
-                    for id in removed_cell_ids]
-    
-    # Find changed fact sheets and relations (comparing by object id)
-    changed_fact_sheets = []
-    for id in common_fact_sheet_ids:
-        diff = compare_objects(original_fact_sheets_by_id[id], 
-                             changed_fact_sheets_by_id[id],
-                             extract_fact_sheet_info)
-        if diff:
-            changed_fact_sheets.append(diff)
-    
-    changed_relations = []
-    for id in common_relation_ids:
-        diff = compare_objects(original_relations_by_id[id],
-                             changed_relations_by_id[id],
-                             extract_relation_info)
-        if diff:
-            changed_relations.append(diff)
-            
-    changed_objects = []
-    for id in common_generic_ids:
-        diff = compare_objects(original_generic_by_id[id],
-                             changed_generic_by_id[id],
-                             extract_generic_object_info)
-        if diff:
-            changed_objects.append(diff)
-            
-    # Find changed standalone mxCells
-    changed_cells = []
-    for id in common_cell_ids:
-        original_info = extract_standalone_mxcell_info(original_cells_by_id[id])
-        changed_info = extract_standalone_mxcell_info(changed_cells_by_id[id])
-        
-        differences = {}
-        for key in set(original_info.keys()) | set(changed_info.keys()):
-            if original_info.get(key) != changed_info.get(key):
-                if isinstance(original_info.get(key), dict) and isinstance(changed_info.get(key), dict):
-                    # Handle nested geometry differences
-                    geo_diff = {}
-                    for geo_key in set(original_info[key].keys()) | set(changed_info[key].keys()):
-                        if original_info[key].get(geo_key) != changed_info[key].get(geo_key):
-                            geo_diff[geo_key] = {
-                                'from': original_info[key].get(geo_key),
-                                'to': changed_info[key].get(geo_key)
-                            }
-                    if geo_diff:
-                        differences[key] = geo_diff
-                else:
-                    differences[key] = {
-                        'from': original_info.get(key),
-                        'to': changed_info.get(key)
-                    }
-        
-        if differences:
-            result = changed_info.copy()
-            result['changes'] = differences
-            changed_cells.append(result)
-    
-    # Create result dictionary
-    result = {
-        'addedFactSheets': added_fact_sheets,
-        'removedFactSheets': removed_fact_sheets,
-        'changedFactSheets': changed_fact_sheets,
-        'addedRelations': added_relations,
-        'removedRelations': removed_relations,
-        'changedRelations': changed_relations,
-        'addedObjects': added_objects,
-        'removedObjects': removed_objects,
-        'changedObjects': changed_objects,
-        'addedCells': added_cells,
-        'removedCells': removed_cells,
-        'changedCells': changed_cells
-    }
-    
-    return result
+    # Items of every category, computed lazily while the records are consumed
+    def added(records, ids):
+        return (records[id].to_dict() for id in ids)
+    
+    def compared(original_by_id, changed_by_id, ids, compare):
+        for id in ids:
+            original_record = original_by_id[id]
+            changed_record = changed_by_id[id]
+            if original_record == changed_record:
+                # Unchanged records are skipped without extracting their differences
+                continue
+            diff = compare(original_record, changed_record)
+            if diff:
+                yield diff
+    
+    categories = [
+        ('addedFactSheets', added(changed_fact_sheets_by_fs_id, added_fact_sheet_ids)),
+        ('removedFactSheets', added(original_fact_sheets_by_fs_id, removed_fact_sheet_ids)),
+        ('changedFactSheets', compared(original_fact_sheets_by_id, changed_fact_sheets_by_id,
+                                       common_fact_sheet_ids, compare_objects)),
+        ('addedRelations', added(changed_relations_by_rel_id, added_relation_ids)),
+        ('removedRelations', added(original_relations_by_rel_id, removed_relation_ids)),
+        ('changedRelations', compared(original_relations_by_id, changed_relations_by_id,
+                                      common_relation_ids, compare_objects)),
+        ('addedObjects', added(changed_generic_by_id, added_generic_ids)),
+        ('removedObjects', added(original_generic_by_id, removed_generic_ids)),
+        ('changedObjects', compared(original_generic_by_id, changed_generic_by_id,
+                                    common_generic_ids, compare_objects)),
+        ('addedCells', added(changed_cells_by_id, added_cell_ids)),
+        ('removedCells', added(original_cells_by_id, removed_cell_ids)),
+        ('changedCells', compared(original_cells_by_id, changed_cells_by_id, common_cell_ids, compare_cells)),
+    ]
+    
+    labelled = set()
+    for category, items in categories:
+        if enabled():
+            # Time spent finding and comparing the items of each category
+            items = timed_items(f'diff.{category}', items)
+        kind = change_kind(category)
+        is_relation = category.endswith('Relations')
+        for item in items:
+            # Labels of the fact sheets the relation points to, so reports do not need the diagrams
+            if is_relation:
+                for key in ('sourceFactSheetId', 'targetFactSheetId'):
+                    fact_sheet_id = item.get(key)
+                    if fact_sheet_id is None or fact_sheet_id in labelled:
+                        continue
+                    labelled.add(fact_sheet_id)
+                    label = get_fact_sheet_label(fact_sheet_id, original_records, changed_records)
+                    if label is not None:
+                        yield {'category': 'factSheetLabels', 'kind': 'label',
+                               'item': {'factSheetId': fact_sheet_id, 'label': label}}
+            yield {'category': category, 'kind': kind, 'item': item}
+
+def change_kind(category):
+    """'added', 'removed' or 'changed' for a change set category."""
+    for kind in ('added', 'removed', 'changed'):
+        if category.startswith(kind):
+            return kind
+    raise ValueError(f"Unknown change category: {category}")
+
+def collect_changes(records):
+    """Assemble change records into a change set dict."""
+    changes = empty_changes()
+    for record in records:
+        if record['kind'] == 'label':
+            changes['factSheetLabels'][record['item']['factSheetId']] = record['item']['label']
+        elif record['kind'] == 'match':
+            changes.setdefault('matchedChanges', []).append(record['item'])
+        else:
+            changes[record['category']].append(record['item'])
+    return changes
+
+def iter_change_records(changes):
+    """Records of a change set dict, in the order iter_changes yields them (labels first, matches last)."""
+    for fact_sheet_id, label in changes.get('factSheetLabels', {}).items():
+        yield {'category': 'factSheetLabels', 'kind': 'label', 'item': {'factSheetId': fact_sheet_id, 'label': label}}
+    for category in change_categories:
+        kind = change_kind(category)
+        for item in changes[category]:
+            yield {'category': category, 'kind': kind, 'item': item}
+    for match in changes.get('matchedChanges', []):
+        yield {'category': 'matchedChanges', 'kind': 'match', 'item': match}
+
+def compare_diagrams(original, changed, streaming=False, cache=None):
+    """
+    Compare two diagrams and return the detected changes.
+    
+    Diagrams can be given as XML file paths, DiagramIndex or DiagramRecords instances.
+    With streaming=True, file paths are read with ET.iterparse instead of building full trees.
+    With a RecordsCache, file paths whose content has been extracted before are not parsed again.
+    """
+    with span('detect'):
+        return collect_changes(iter_changes(original, changed, streaming=streaming, cache=cache))
+
+def write_change_records(records, f, compact=False):
+    """Write change records as NDJSON, one record per line, as they are produced."""
+    separators = (',', ':') if compact else (', ', ': ')
+    for record in records:
+        f.write(json.dumps(record, separators=separators))
+        f.write('\n')
+
+def read_change_records(path):
+    """Lazily read the records of an NDJSON change set."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def load_changes(path):
+    """Load a change set dict from a JSON or NDJSON (.ndjson/.jsonl) file."""
+    if path.endswith(('.ndjson', '.jsonl')):
+        return collect_changes(read_change_records(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
 def main():
+    parser = argparse.ArgumentParser(description='Detect changes between two draw.io XML diagrams')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read the diagrams with a streaming parser to bound memory on huge exports')
+    parser.add_argument('--cache', action='store_true',
+                        help='Reuse extracted diagram records from the on-disk cache')
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help='Directory of the records cache (default: files/cache/records)')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Remove all cached records before comparing')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Write files/diagram_changes.ndjson with one change record per line instead of the JSON file')
+    parser.add_argument('--compact', action='store_true', help='Write the output without indentation or extra spaces')
+    parser.add_argument('--match-moves', action='store_true',
+                        help='Pair removed and added elements that were moved, given a new id or replaced in place')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    
+    with instrument_from_args(args):
+        run_detection(args)
+
+def run_detection(args):
+    """Detect the changes of files/input as selected by the command line arguments."""
     # Get the directory containing the files
     input_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files/input')
     changes_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files')
-    
-    # Compare diagrams and get changes
-    changes = compare_diagrams(
-        os.path.join(input_dir, 'original.xml'),
-        os.path.join(input_dir, 'changed.xml')
-    )
-    
-    # Write results to JSON file
-    with open(os.path.join(changes_dir, 'diagram_changes.json'), 'w', encoding='utf-8') as f:
-        json.dump(changes, f, indent=2)
+    original_xml = os.path.join(input_dir, 'original.xml')
+    changed_xml = os.path.join(input_dir, 'changed.xml')
+    
+    cache = None
+    if args.cache or args.clear_cache:
+        cache = RecordsCache(args.cache_dir, streaming=args.stream)
+        if args.clear_cache:
+            cache.clear()
+    
+    # Compare diagrams; records are written as they are produced
+    if args.stream or cache is not None:
+        original, changed = original_xml, changed_xml
+    else:
+        original, changed = DiagramIndex.from_file(original_xml), DiagramIndex.from_file(changed_xml)
+    if args.match_moves:
+        # Extract the records once for detection and matching
+        original = load_records(original, streaming=args.stream, cache=cache)
+        changed = load_records(changed, streaming=args.stream, cache=cache)
+    records = iter_changes(original, changed, streaming=args.stream, cache=cache)
+    if args.match_moves:
+        # Imported here so plain detection does not depend on the matching stage
+        from match_moves import iter_with_matches
+        records = iter_with_matches(records, original, changed)
+    
+    # Records are produced while they are written, so the span covers detection and writing
+    with span('detect', ndjson=args.ndjson):
+        if args.ndjson:
+            with open(os.path.join(changes_dir, 'diagram_changes.ndjson'), 'w', encoding='utf-8') as f:
+                write_change_records(records, f, compact=args.compact)
+        else:
+            # Write results to JSON file
+            with open(os.path.join(changes_dir, 'diagram_changes.json'), 'w', encoding='utf-8') as f:
+                json.dump(collect_changes(records), f, indent=None if args.compact else 2)
+    
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Records cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evictions, {stats['entries']} entries ({stats['bytes']} bytes)")
 
 if __name__ == '__main__':
     main()
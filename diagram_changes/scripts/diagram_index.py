@@ -0,0 +1,129 @@
+import xml.etree.ElementTree as ET
+
+from instrumentation import span
+from mxfile import is_mxfile, is_mxfile_bytes, read_pages, read_pages_from_bytes, select_page
+
+def get_object_category(object_elem):
+    """Classify an object element as 'factSheet', 'relation', 'generic' or None."""
+    if object_elem.get('factSheetType') is not None:
+        return 'factSheet'
+    if object_elem.get('dependencyRelation') is not None:
+        return 'relation'
+    if object_elem.get('label') is not None:
+        # Must have a label to be a valid generic object
+        return 'generic'
+    return None
+
+def is_standalone_mxcell(mxcell_elem):
+    """
+    Whether a direct child mxCell of <root> is compared as a standalone cell: any cell with an id
+    other than the two default cells '0' and '1', and any cell carrying a value.
+    """
+    cell_id = mxcell_elem.get('id')
+    return (cell_id is not None and cell_id not in ('0', '1')) or mxcell_elem.get('value') is not None
+
+class DiagramIndex:
+    """Parsed diagram with every lookup the scripts need, built in a single tree walk."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.root = tree.getroot()
+
+        # All <object> elements in document order, and grouped by their 'type' attribute
+        self.objects = []
+        self.objects_by_type = {}
+
+        # Classified elements keyed by object/cell id
+        self.fact_sheets = {}
+        self.relations = {}
+        self.generic_objects = {}
+        self.cells = {}
+
+        # Direct child mxCells of <root> with an id other than '0' and '1', in document order and
+        # including cells that share an id (the cells the generated diagrams highlight)
+        self.standalone_cells = []
+
+        # Lookups by business identifiers (used for added/removed detection)
+        self.fact_sheets_by_fs_id = {}
+        self.relations_by_rel_id = {}
+
+        # XML structure: element -> parent element, built on the first get_parent call
+        self._parent_map = None
+
+        # Element holding the default layer (mxCell id="1"), i.e. where new cells are appended
+        self.layer_parent = None
+
+        self._build()
+
+    @classmethod
+    def from_file(cls, path, page=None):
+        """Parse an XML diagram file and index it; for draw.io <mxfile> files, one page is indexed."""
+        with span('parse') as timing:
+            if is_mxfile(path):
+                index = cls(ET.ElementTree(ET.fromstring(select_page(read_pages(path), page).xml)))
+            else:
+                index = cls(ET.parse(path))
+            timing.set(objects=len(index.objects), cells=len(index.cells))
+        return index
+
+    @classmethod
+    def from_string(cls, xml_text, page=None):
+        """Parse an XML diagram from a string or bytes and index it."""
+        if isinstance(xml_text, str):
+            xml_text = xml_text.encode('utf-8')
+        with span('parse') as timing:
+            if is_mxfile_bytes(xml_text):
+                xml_text = select_page(read_pages_from_bytes(xml_text), page).xml
+            index = cls(ET.ElementTree(ET.fromstring(xml_text)))
+            timing.set(objects=len(index.objects), cells=len(index.cells))
+        return index
+
+    def _build(self):
+        for parent in self.root.iter():
+            parent_tag = parent.tag
+            for elem in parent:
+                tag = elem.tag
+                if tag == 'object':
+                    self._add_object(elem)
+                elif tag == 'mxCell':
+                    self._add_mxcell(elem, parent, parent_tag)
+
+    def _add_object(self, elem):
+        obj_id = elem.get('id')
+        self.objects.append(elem)
+        self.objects_by_type.setdefault(elem.get('type'), []).append(elem)
+
+        category = get_object_category(elem)
+        if category == 'factSheet':
+            self.fact_sheets[obj_id] = elem
+            self.fact_sheets_by_fs_id[elem.get('factSheetId')] = elem
+        elif category == 'relation':
+            self.relations[obj_id] = elem
+            self.relations_by_rel_id[elem.get('relationId')] = elem
+        elif category == 'generic':
+            self.generic_objects[obj_id] = elem
+
+    def _add_mxcell(self, elem, parent, parent_tag):
+        if self.layer_parent is None and elem.get('id') == '1':
+            self.layer_parent = parent
+
+        # Standalone mxCells are direct children of <root>, excluding the two default cells
+        # unless they carry a value
+        if parent_tag == 'root':
+            cell_id = elem.get('id')
+            if cell_id is not None and cell_id not in ('0', '1'):
+                self.standalone_cells.append(elem)
+            if is_standalone_mxcell(elem):
+                self.cells[cell_id] = elem
+
+    def get_parent(self, elem):
+        """Return the XML parent of an element, or None for the root."""
+        if self._parent_map is None:
+            self._parent_map = {child: parent for parent in self.root.iter() for child in parent}
+        return self._parent_map.get(elem)
+
+def load_index(source):
+    """Return a DiagramIndex for a file path, or the index itself if one is passed."""
+    if isinstance(source, DiagramIndex):
+        return source
+    return DiagramIndex.from_file(source)
@@ -0,0 +1,345 @@
+import hashlib
+import io
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from diagram_index import DiagramIndex, get_object_category, is_standalone_mxcell
+from instrumentation import span
+from mxfile import is_mxfile, is_mxfile_bytes, read_pages, read_pages_from_bytes, select_page
+
+def parse_number(value):
+    """Parse a numeric attribute as float, keeping the raw string if it is not a number."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def content_digest(data):
+    """128-bit content hash used for records and whole diagrams."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def format_number(value):
+    """Format a parsed number the way draw.io writes it ('120', '12.5')."""
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    return value
+
+class Record:
+    """
+    Immutable record with a canonical content hash.
+
+    Subclasses are also namedtuples of their fields (see record_fields), so building a record is
+    a single tuple construction and attribute assignment is rejected. json_keys lists the JSON
+    key of every field. Records compare equal if their type and fields (including nested records)
+    are equal. content_hash covers the same and is only computed when asked for, e.g. to key
+    cached differences; comparing diagrams does not need it.
+    """
+    __slots__ = ()
+    json_keys = ()
+
+    @property
+    def content_hash(self):
+        # The namedtuple repr names the record type and every field, nested records included
+        return content_digest(repr(self).encode('utf-8'))
+
+    def values(self):
+        return tuple(self)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = tuple.__hash__
+
+def record_fields(name, fields):
+    """namedtuple base holding the fields of a record class."""
+    return namedtuple(f'{name}Fields', fields)
+
+class Geometry(Record, record_fields('Geometry', ('x', 'y', 'width', 'height', 'relative'))):
+    """Geometry of an mxCell, with coordinates and size parsed as floats."""
+    __slots__ = ()
+    json_keys = ('x', 'y', 'width', 'height', 'relative')
+
+    @classmethod
+    def from_element(cls, geometry_elem):
+        return cls(
+            parse_number(geometry_elem.get('x')),
+            parse_number(geometry_elem.get('y')),
+            parse_number(geometry_elem.get('width')),
+            parse_number(geometry_elem.get('height')),
+            geometry_elem.get('relative'),
+        )
+
+    def to_dict(self):
+        # Geometry keeps unset keys as None, like the JSON change format always has
+        return {key: format_number(value) for key, value in zip(self.json_keys, self.values())}
+
+    def diff(self, other):
+        """Field-wise differences to another Geometry, or None if they are equal."""
+        if self == other:
+            return None
+        differences = {}
+        for key, value, other_value in zip(self.json_keys, self.values(), other.values()):
+            if value != other_value:
+                differences[key] = {'from': format_number(value), 'to': format_number(other_value)}
+        return differences or None
+
+class CellRecord(Record, record_fields('Cell', ('style', 'parent', 'vertex', 'edge', 'source', 'target', 'id',
+                                                'value', 'geometry', 'label'))):
+    """An mxCell with its geometry; label is only set for standalone cells with an edge label."""
+    __slots__ = ()
+    json_keys = ('style', 'parent', 'vertex', 'edge', 'source', 'target', 'id', 'value', 'geometry', 'label')
+
+    @classmethod
+    def from_element(cls, mxcell_elem, standalone=False):
+        geometry = mxcell_elem.find('mxGeometry')
+        label = None
+        if standalone:
+            # For standalone cells, we want to include any child elements that might contain text/labels
+            edge_label = mxcell_elem.find('.//mxGeometry//*[@value]')
+            if edge_label is not None:
+                label = edge_label.get('value')
+        return cls(
+            mxcell_elem.get('style'),
+            mxcell_elem.get('parent'),
+            mxcell_elem.get('vertex'),
+            mxcell_elem.get('edge'),
+            mxcell_elem.get('source'),
+            mxcell_elem.get('target'),
+            mxcell_elem.get('id'),
+            mxcell_elem.get('value'),
+            Geometry.from_element(geometry) if geometry is not None else None,
+            label,
+        )
+
+    def to_dict(self):
+        info = {}
+        for key, value in zip(self.json_keys, self.values()):
+            if value is not None:
+                info[key] = value.to_dict() if key == 'geometry' else value
+        return info
+
+    def diff(self, other):
+        """Field-wise differences to another CellRecord, or None if they are equal."""
+        if self == other:
+            return None
+        differences = {}
+        for key, value, other_value in zip(self.json_keys, self.values(), other.values()):
+            if value == other_value:
+                continue
+            if key == 'geometry' and value is not None and other_value is not None:
+                # Handle nested geometry differences
+                geo_diff = value.diff(other_value)
+                if geo_diff:
+                    differences[key] = geo_diff
+            elif key == 'geometry':
+                differences[key] = {
+                    'from': value.to_dict() if value is not None else None,
+                    'to': other_value.to_dict() if other_value is not None else None,
+                }
+            else:
+                differences[key] = {'from': value, 'to': other_value}
+        return differences or None
+
+class ObjectRecord(Record):
+    """Base for <object> records. The last field is always the object's mxcell (a CellRecord or None)."""
+    __slots__ = ()
+
+    @classmethod
+    def from_element(cls, object_elem):
+        mxcell = object_elem.find('mxCell')
+        values = [object_elem.get(attribute) for attribute in cls.attributes]
+        values.append(CellRecord.from_element(mxcell) if mxcell is not None else None)
+        return cls(*values)
+
+    def to_dict(self, include_mxcell=False):
+        info = dict(zip(self.json_keys, self.values()[:-1]))
+        if include_mxcell and self.mxcell is not None:
+            info['mxCell'] = self.mxcell.to_dict()
+        return info
+
+    def diff(self, other):
+        """Field-wise differences to another record of the same type, or None if they are equal."""
+        if self == other:
+            return None
+        differences = {}
+        
+        # Compare regular attributes
+        for key, value, other_value in zip(self.json_keys, self.values()[:-1], other.values()[:-1]):
+            if value != other_value:
+                differences[key] = {'from': value, 'to': other_value}
+        
+        # Compare mxCells if both exist
+        if self.mxcell is not None and other.mxcell is not None:
+            mxcell_differences = self.mxcell.diff(other.mxcell)
+            if mxcell_differences:
+                differences['mxCell'] = mxcell_differences
+        
+        return differences or None
+
+class FactSheetRecord(ObjectRecord, record_fields('FactSheet', ('label', 'fact_sheet_type', 'fact_sheet_id',
+                                                                 'object_id', 'mxcell'))):
+    """A factSheet object."""
+    __slots__ = ()
+    json_keys = ('label', 'factSheetType', 'factSheetId', 'objectId')
+    attributes = ('label', 'factSheetType', 'factSheetId', 'id')
+
+class RelationRecord(ObjectRecord, record_fields('Relation', ('dependency_relation', 'relation_id',
+                                                               'source_fact_sheet_id', 'target_fact_sheet_id',
+                                                               'object_id', 'mxcell'))):
+    """A relation object between two fact sheets."""
+    __slots__ = ()
+    json_keys = ('dependencyRelation', 'relationId', 'sourceFactSheetId', 'targetFactSheetId', 'objectId')
+    attributes = ('dependencyRelation', 'relationId', 'sourceFactSheetId', 'targetFactSheetId', 'id')
+
+class GenericObjectRecord(ObjectRecord, record_fields('GenericObject', ('label', 'object_id', 'mxcell'))):
+    """A labelled object that is neither a fact sheet nor a relation."""
+    __slots__ = ()
+    json_keys = ('label', 'objectId')
+    attributes = ('label', 'id')
+
+class DiagramRecords:
+    """Extracted information of every compared element, without references to the XML tree."""
+
+    def __init__(self):
+        # FactSheetRecord, RelationRecord and GenericObjectRecord (with their mxCell), keyed by object id
+        self.fact_sheets = {}
+        self.relations = {}
+        self.generic_objects = {}
+        
+        # Standalone CellRecords keyed by cell id
+        self.cells = {}
+        
+        # Lookups by business identifiers (used for added/removed detection)
+        self.fact_sheets_by_fs_id = {}
+        self.relations_by_rel_id = {}
+        
+        self._content_hash = None
+
+    def add_object(self, object_elem):
+        """Extract and store an object element according to its category."""
+        category = get_object_category(object_elem)
+        obj_id = object_elem.get('id')
+        if category == 'factSheet':
+            record = FactSheetRecord.from_element(object_elem)
+            self.fact_sheets[obj_id] = record
+            self.fact_sheets_by_fs_id[record.fact_sheet_id] = record
+        elif category == 'relation':
+            record = RelationRecord.from_element(object_elem)
+            self.relations[obj_id] = record
+            self.relations_by_rel_id[record.relation_id] = record
+        elif category == 'generic':
+            self.generic_objects[obj_id] = GenericObjectRecord.from_element(object_elem)
+
+    def add_cell(self, mxcell_elem):
+        """Extract and store a standalone mxCell element."""
+        self.cells[mxcell_elem.get('id')] = CellRecord.from_element(mxcell_elem, standalone=True)
+
+    def element_counts(self):
+        return {'factSheets': len(self.fact_sheets), 'relations': len(self.relations),
+                'objects': len(self.generic_objects), 'cells': len(self.cells)}
+
+    @property
+    def content_hash(self):
+        """
+        Hash of all compared content, independent of element order.
+        
+        Two diagrams with the same content_hash have no differences for compare_diagrams.
+        """
+        if self._content_hash is None:
+            combined = 0
+            for category, records in (('factSheet', self.fact_sheets), ('relation', self.relations),
+                                      ('generic', self.generic_objects), ('cell', self.cells)):
+                prefix = category.encode() + b'|'
+                for record_id, record in records.items():
+                    entry = prefix + repr((record_id, record)).encode('utf-8')
+                    combined ^= int.from_bytes(content_digest(entry), 'big')
+            self._content_hash = combined.to_bytes(16, 'big')
+        return self._content_hash
+
+    @classmethod
+    def from_index(cls, index):
+        """Extract records from an already parsed DiagramIndex."""
+        with span('extract') as timing:
+            records = cls()
+            for obj in index.objects:
+                records.add_object(obj)
+            for cell in index.cells.values():
+                records.add_cell(cell)
+            timing.set(**records.element_counts())
+        return records
+
+    @classmethod
+    def from_file(cls, path, streaming=False, page=None):
+        """
+        Extract records from an XML file, optionally without building the full tree.
+        
+        For draw.io <mxfile> files, the selected page (the first by default) is extracted.
+        """
+        if is_mxfile(path):
+            return cls.from_bytes(select_page(read_pages(path), page).xml, streaming=streaming)
+        if streaming:
+            return cls.stream(path)
+        return cls.from_index(DiagramIndex.from_file(path))
+
+    @classmethod
+    def from_bytes(cls, data, streaming=False, page=None):
+        """Extract records from XML bytes."""
+        if is_mxfile_bytes(data):
+            data = select_page(read_pages_from_bytes(data), page).xml
+        if streaming:
+            return cls.stream(io.BytesIO(data))
+        return cls.from_index(DiagramIndex.from_string(data))
+
+    @classmethod
+    def stream(cls, source):
+        """
+        Extract records with ET.iterparse, discarding each element once it has been processed.
+        
+        Peak memory grows with the number of records rather than with the size of the document.
+        """
+        with span('extract', streaming=True) as timing:
+            records = cls._stream(source)
+            timing.set(**records.element_counts())
+        return records
+
+    @classmethod
+    def _stream(cls, source):
+        records = cls()
+        stack = []
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+            
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if elem.tag == 'object':
+                records.add_object(elem)
+            elif elem.tag == 'mxCell' and parent is not None and parent.tag == 'root' and is_standalone_mxcell(elem):
+                records.add_cell(elem)
+            
+            # Top-level cells are fully processed once they end, so drop them from the tree
+            if parent is not None and parent.tag == 'root':
+                del parent[:]
+        return records
+
+def load_records(source, streaming=False, cache=None):
+    """
+    Return DiagramRecords for a DiagramRecords, DiagramIndex or XML file path.
+    
+    File paths are looked up in the given RecordsCache first, if any.
+    """
+    if isinstance(source, DiagramRecords):
+        return source
+    if isinstance(source, DiagramIndex):
+        return DiagramRecords.from_index(source)
+    if cache is not None:
+        return cache.load(source)
+    return DiagramRecords.from_file(source, streaming=streaming)
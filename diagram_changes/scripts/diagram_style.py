@@ -0,0 +1,18 @@
+def parse_style(style):
+    """
+    Parse a draw.io style string into an ordered key -> value map.
+
+    Named styles without a value (e.g. 'ellipse' or 'leanix_fs_Application') map to None. For keys
+    that occur more than once, the last value wins, as in draw.io.
+    """
+    properties = {}
+    for part in (style or '').split(';'):
+        if not part:
+            continue
+        key, sep, value = part.partition('=')
+        properties[key] = value if sep else None
+    return properties
+
+def format_style(properties):
+    """Format a key -> value map as a draw.io style string."""
+    return ';'.join(key if value is None else f'{key}={value}' for key, value in properties.items())
@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from detect_changes import compare_diagrams
+from diagram_index import DiagramIndex
+from diagram_records import DiagramRecords
+from generate_new_diagrams import ChangeIndex, diagram_file_names, generate_diagrams
+from print_changes import print_report
+from records_cache import RecordsCache
+
+max_body_bytes = 256 * 1024 * 1024
+
+# Diagram keys are the SHA-256 hex digests of RecordsCache.key_for_bytes
+key_pattern = re.compile(r'[0-9a-f]{64}')
+
+class ServiceError(Exception):
+    """Error answered with an HTTP status and a JSON {"error": message} body."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class UnknownDiagram(Exception):
+    """A diagram was referenced by key only, but the worker does not hold it (anymore)."""
+
+class CachedDiagram:
+    """A parsed diagram kept by a worker process; its records are extracted on first use."""
+
+    __slots__ = ('index', '_records')
+
+    def __init__(self, index):
+        self.index = index
+        self._records = None
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = DiagramRecords.from_index(self.index)
+        return self._records
+
+# Parsed diagrams of a worker process by content key, least recently used first
+_worker_diagrams = OrderedDict()
+_worker_max_diagrams = 16
+
+def init_worker(max_diagrams):
+    global _worker_max_diagrams
+    _worker_max_diagrams = max_diagrams
+
+def get_diagram(source):
+    """
+    Parsed diagram of a (key, XML bytes) source, from the worker's cache if possible.
+
+    The bytes may be None if the service expects the worker to hold the diagram already.
+    """
+    key, data = source
+    diagram = _worker_diagrams.get(key)
+    if diagram is not None:
+        _worker_diagrams.move_to_end(key)
+        return diagram
+    if data is None:
+        raise UnknownDiagram(key)
+    diagram = CachedDiagram(DiagramIndex.from_string(data))
+    _worker_diagrams[key] = diagram
+    while len(_worker_diagrams) > _worker_max_diagrams:
+        _worker_diagrams.popitem(last=False)
+    return diagram
+
+def detect(original, changed, match_moves=False):
+    original_records = get_diagram(original).records
+    changed_records = get_diagram(changed).records
+    changes = compare_diagrams(original_records, changed_records)
+    if match_moves:
+        # Imported here so plain detection does not depend on the matching stage
+        from match_moves import match_moves as match
+        changes['matchedChanges'] = match(changes, original_records, changed_records)
+    return changes
+
+def run_compare(original, changed, match_moves=False):
+    """Worker task: the change set of two diagrams as JSON bytes."""
+    return json.dumps(detect(original, changed, match_moves)).encode('utf-8')
+
+def run_report(original, changed, match_moves=False):
+    """Worker task: the changelog of two diagrams as text."""
+    return report_changes(detect(original, changed, match_moves))
+
+def report_changes(changes):
+    """Worker task: the changelog of a change set as text."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        print_report(changes)
+    return out.getvalue().encode('utf-8')
+
+def run_generate(original, changed, outputs):
+    """Worker task: the highlighted diagrams as JSON bytes mapping each output to its XML."""
+    original_index = get_diagram(original).index
+    changed_index = get_diagram(changed).index
+    changes = detect(original, changed)
+    with tempfile.TemporaryDirectory(prefix='diff_service_') as work_dir:
+        output_paths = {name: os.path.join(work_dir, diagram_file_names[name]) for name in outputs}
+        generate_diagrams(original_index, changed_index, ChangeIndex(changes), output_paths)
+        diagrams = {}
+        for name, path in output_paths.items():
+            with open(path, 'r', encoding='utf-8') as f:
+                diagrams[name] = f.read()
+    return json.dumps({'diagrams': diagrams, 'changes': changes}).encode('utf-8')
+
+def noop():
+    return None
+
+class DiffService:
+    """
+    Answers compare, report and generate requests from a pool of warm worker processes.
+
+    Every worker is a single-process pool that keeps its own LRU of parsed diagrams keyed by the
+    SHA-256 of their content. Requests are routed by the key of their original diagram, so a hot
+    baseline is always served by the worker that already holds it parsed. The service mirrors each
+    worker's LRU to avoid sending diagrams a worker already holds. Identical requests in flight
+    share one computation, and finished results are kept in a small LRU of their own.
+
+    Diagrams can only be given as file paths if `root_dir` is set, and only below that directory.
+    """
+
+    def __init__(self, workers=2, max_diagrams=16, max_results=64, root_dir=None):
+        self.root_dir = os.path.realpath(root_dir) if root_dir else None
+        self.max_diagrams = max_diagrams
+        self.max_results = max_results
+        self.executors = [ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(max_diagrams,))
+                          for _ in range(workers)]
+        self.worker_keys = [OrderedDict() for _ in range(workers)]
+        self.inflight = {}
+        self.results = OrderedDict()
+        self.stats = {'requests': 0, 'coalesced': 0, 'result_hits': 0, 'errors': 0}
+
+    async def start(self):
+        """Start the worker processes so the first requests do not pay for it."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, noop) for executor in self.executors))
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
+
+    async def read_source(self, request, side):
+        """(key, XML bytes or None) of a diagram given as content, file path or a known key."""
+        if side in request:
+            data = request[side].encode('utf-8') if isinstance(request[side], str) else None
+            if data is None:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"'{side}' must be the diagram XML as a string")
+        elif f'{side}Path' in request:
+            path = self.resolve_path(request[f'{side}Path'], side)
+            try:
+                data = await asyncio.to_thread(read_file, path)
+            except OSError as e:
+                raise ServiceError(HTTPStatus.NOT_FOUND, f"Cannot read {side} diagram: {e}")
+        elif f'{side}Key' in request:
+            key = request[f'{side}Key']
+            if not isinstance(key, str) or not key_pattern.fullmatch(key):
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"'{side}Key' must be 64 lowercase hex characters")
+            return key, None
+        else:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"Missing '{side}', '{side}Path' or '{side}Key'")
+        return RecordsCache.key_for_bytes(data), data
+
+    def resolve_path(self, path, side):
+        """Absolute path of a diagram file given relative to root_dir, rejecting paths outside of it."""
+        if self.root_dir is None:
+            raise ServiceError(HTTPStatus.FORBIDDEN,
+                               f"'{side}Path' is disabled; start the service with --root to read diagram files")
+        if not isinstance(path, str):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"'{side}Path' must be a string")
+        # Symlinks are resolved first, so they cannot point outside of the root either
+        resolved = os.path.realpath(os.path.join(self.root_dir, path))
+        if os.path.commonpath([self.root_dir, resolved]) != self.root_dir:
+            raise ServiceError(HTTPStatus.FORBIDDEN, f"'{side}Path' is outside of the service root")
+        return resolved
+
+    def prepare_source(self, worker, source):
+        # Diagrams the worker holds according to the mirror of its LRU are sent by key only
+        key, data = source
+        keys = self.worker_keys[worker]
+        if key in keys:
+            keys.move_to_end(key)
+            return key, None
+        if data is not None:
+            keys[key] = True
+            while len(keys) > self.max_diagrams:
+                keys.popitem(last=False)
+        return key, data
+
+    async def submit(self, worker, task, sources, *args):
+        loop = asyncio.get_running_loop()
+        prepared = [self.prepare_source(worker, source) for source in sources]
+        try:
+            return await loop.run_in_executor(self.executors[worker], task, *prepared, *args)
+        except UnknownDiagram as e:
+            key = e.args[0]
+            if any(source[0] == key and source[1] is None for source in sources):
+                raise ServiceError(HTTPStatus.NOT_FOUND,
+                                   f"Unknown diagram key {key}; send the diagram content instead")
+        # The mirror was out of date (e.g. a diagram failed to parse before); send all content again
+        return await loop.run_in_executor(self.executors[worker], task, *sources, *args)
+
+    async def coalesced(self, key, compute):
+        """Result of compute() for a request key, shared by identical requests and kept in an LRU."""
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+            self.stats['result_hits'] += 1
+            return result
+        task = self.inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(compute())
+        self.inflight[key] = task
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            self.inflight.pop(key, None)
+        self.results[key] = result
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+        return result
+
+    def worker_for(self, key):
+        return zlib.crc32(key.encode('utf-8')) % len(self.executors)
+
+    async def handle(self, method, path, body):
+        """Answer a request with (status, content type, body bytes, extra headers)."""
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, 'application/json', b'{"status": "ok"}', {}
+        if method == 'GET' and path == '/stats':
+            stats = dict(self.stats, workers=len(self.executors), results=len(self.results),
+                         diagrams=[len(keys) for keys in self.worker_keys])
+            return HTTPStatus.OK, 'application/json', json.dumps(stats).encode('utf-8'), {}
+        if path not in ('/compare', '/report', '/generate'):
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"Unknown endpoint: {path}")
+        if method != 'POST':
+            raise ServiceError(HTTPStatus.METHOD_NOT_ALLOWED, f"{path} expects POST")
+
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError as e:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"Invalid JSON body: {e}")
+        if not isinstance(request, dict):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, 'The request body must be a JSON object')
+
+        if path == '/report' and 'changes' in request:
+            # Change sets carry the fact sheet labels, so no diagrams are needed
+            changes = request['changes']
+            key = ('report', RecordsCache.key_for_bytes(json.dumps(changes, sort_keys=True).encode('utf-8')))
+            worker = self.worker_for(key[1])
+            payload = await self.coalesced(key, lambda: self.submit(worker, report_changes, [], changes))
+            return HTTPStatus.OK, 'text/plain; charset=utf-8', payload, {}
+
+        original, changed = await asyncio.gather(self.read_source(request, 'original'),
+                                                 self.read_source(request, 'changed'))
+        worker = self.worker_for(original[0])
+        match = bool(request.get('matchMoves', False))
+        headers = {'X-Original-Key': original[0], 'X-Changed-Key': changed[0]}
+        if path == '/compare':
+            key = ('compare', original[0], changed[0], match)
+            compute = lambda: self.submit(worker, run_compare, [original, changed], match)
+            content_type = 'application/json'
+        elif path == '/report':
+            key = ('report', original[0], changed[0], match)
+            compute = lambda: self.submit(worker, run_report, [original, changed], match)
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            outputs = request.get('outputs') or list(diagram_file_names)
+            unknown = [output for output in outputs if output not in diagram_file_names]
+            if unknown:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"Unknown outputs: {', '.join(unknown)}")
+            outputs = [output for output in diagram_file_names if output in outputs]
+            key = ('generate', original[0], changed[0], tuple(outputs))
+            compute = lambda: self.submit(worker, run_generate, [original, changed], outputs)
+            content_type = 'application/json'
+        return HTTPStatus.OK, content_type, await self.coalesced(key, compute), headers
+
+    async def respond(self, method, path, body):
+        try:
+            return await self.handle(method, path, body)
+        except ServiceError as e:
+            status, message = e.status, str(e)
+        except ET.ParseError as e:
+            status, message = HTTPStatus.BAD_REQUEST, f"Invalid diagram XML: {e}"
+        except Exception as e:
+            status, message = HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}"
+        self.stats['errors'] += 1
+        return status, 'application/json', json.dumps({'error': message}).encode('utf-8'), {}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests of one connection, keeping it open between requests."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get('content-length') or '0'
+                length = int(length) if length.isascii() and length.isdigit() else None
+                if length is None:
+                    status, content_type, payload, extra = (HTTPStatus.BAD_REQUEST, 'application/json',
+                                                            b'{"error": "Invalid Content-Length"}', {})
+                    keep_alive = False
+                elif length > max_body_bytes:
+                    status, content_type, payload, extra = (HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'application/json',
+                                                            b'{"error": "Request body too large"}', {})
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    self.stats['requests'] += 1
+                    status, content_type, payload, extra = await self.respond(method, target.split('?')[0], body)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                head = [f'HTTP/1.1 {status.value} {status.phrase}', f'Content-Type: {content_type}',
+                        f'Content-Length: {len(payload)}', f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head.extend(f'{name}: {value}' for name, value in extra.items())
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def serve(host='127.0.0.1', port=8765, workers=2, max_diagrams=16, max_results=64, root_dir=None):
+    service = DiffService(workers=workers, max_diagrams=max_diagrams, max_results=max_results, root_dir=root_dir)
+    try:
+        await service.start()
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        async with server:
+            print(f"Serving diagram diffs on http://{host}:{port} with {workers} worker(s)", flush=True)
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve diagram comparison, reports and generation over local HTTP')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes (default: 2)')
+    parser.add_argument('--cache-size', type=int, default=16,
+                        help='Parsed diagrams kept in memory per worker (default: 16)')
+    parser.add_argument('--result-cache', type=int, default=64,
+                        help='Responses kept for repeated identical requests (default: 64)')
+    parser.add_argument('--root', metavar='DIR',
+                        help='Allow diagrams given as file paths (originalPath, changedPath) below this directory')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.cache_size, args.result_cache, args.root))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
-import xml.etree.ElementTree as ET
+import argparse
 import json
 import os
-import copy
+from functools import lru_cache
+
+from detect_changes import iter_change_records, read_change_records
+from diagram_index import DiagramIndex, load_index
+from diagram_style import format_style, parse_style
+from instrumentation import add_metrics_arguments, instrument_from_args, span
+from xml_writer import write_documents
 
 # Define colors for different change types
 colors = {
@@ -11,270 +17,318 @@ colors = {
     'added_changed': '#FF45D9'  # Pink for objects that have been added, removed and changed
 }
 
+# Style keys replaced by the change highlighting
+highlight_keys = ('strokeWidth', 'dashed', 'strokeColor')
+
+@lru_cache(maxsize=4096)
 def modify_style(style, color, is_standalone=False):
-    """Add dashed border with specified color to the style."""
-    style_parts = style.split(';') if style else []
-    new_parts = []
+    """
+    Add dashed border with specified color to the style.
+
+    Diagrams repeat a small number of styles, so results are memoized by (style, color, is_standalone).
+    """
+    properties = parse_style(style)
     
     # Remove existing stroke and label border properties if they exist
-    for part in style_parts:
-        if not any(prop in part for prop in ['strokeWidth', 'dashed', 'strokeColor'] + (['labelBorderColor'] if is_standalone else [])):
-            new_parts.append(part)
+    for key in highlight_keys + (('labelBorderColor',) if is_standalone else ()):
+        properties.pop(key, None)
     
     # Add new style properties
-    new_parts.extend([
-        'strokeWidth=3',
-        'dashed=1',
-        f'strokeColor={color}'
-    ])
+    properties['strokeWidth'] = '3'
+    properties['dashed'] = '1'
+    properties['strokeColor'] = color
     
     # Add labelBorderColor only for standalone mxCells
     if is_standalone:
-        new_parts.append(f'labelBorderColor={color}')
+        properties['labelBorderColor'] = color
     
-    return ';'.join(filter(None, new_parts))
+    return format_style(properties)
 
-def get_change_type(obj_id, fact_sheet_id, changes_data):
-    """Determine if an object was added, removed, changed, or unchanged."""
-    # Check in factSheets first using factSheetId
-    if fact_sheet_id:
-        for item in changes_data['removedFactSheets']:
-            if item['factSheetId'] == fact_sheet_id:
-                return 'removed'
-        for item in changes_data['addedFactSheets']:
-            if item['factSheetId'] == fact_sheet_id:
-                return 'added'
-        for item in changes_data['changedFactSheets']:
-            if item['factSheetId'] == fact_sheet_id:
-                return 'changed'
-    
-    # Then check by objectId
-    for category in ['addedFactSheets', 'removedFactSheets', 'changedFactSheets']:
-        for item in changes_data[category]:
-            if item['objectId'] == obj_id:
-                return category.replace('FactSheets', '')
-    
-    # Check in relations
-    for category in ['addedRelations', 'removedRelations', 'changedRelations']:
-        for item in changes_data[category]:
-            if item['objectId'] == obj_id:
-                return category.replace('Relations', '')
-    
-    # Check in generic objects
-    for category in ['addedObjects', 'removedObjects', 'changedObjects']:
-        for item in changes_data[category]:
-            if item['objectId'] == obj_id:
-                return category.replace('Objects', '')
-    
-    # Check in cells
-    for category in ['addedCells', 'removedCells', 'changedCells']:
-        for item in changes_data[category]:
-            if item['id'] == obj_id:
-                return category.replace('Cells', '')
-    
-    return 'unchanged'
+# Id key of the objects and cells of each category (categories are suffixes like 'FactSheets')
+object_id_keys = {
+    'FactSheets': 'objectId',
+    'Relations': 'objectId',
+    'Objects': 'objectId',
+    'Cells': 'id',
+}
 
-def apply_change_style(obj, change_type):
-    """Apply style changes based on the change type."""
-    if change_type == 'unchanged':
-        return
-    
-    # Find or create mxCell element
-    mxcell = obj.find('mxCell')
-    if mxcell is None:
-        return
-    
-    # Modify the style
-    current_style = mxcell.get('style', '')
-    new_style = modify_style(current_style, colors[change_type], is_standalone=False)
-    mxcell.set('style', new_style)
+# factSheetId precedence: removed wins over added over changed
+fact_sheet_precedence = {'removed': 0, 'added': 1, 'changed': 2}
 
-def create_changed_based_diagram(changed_xml_path, changes_json_path, output_path):
-    """Create a diagram based on changed.xml showing additions and changes."""
-    # Load and parse the XML file
-    tree = ET.parse(changed_xml_path)
-    root = tree.getroot()
-    
-    # Load changes data
-    with open(changes_json_path, 'r') as f:
-        changes_data = json.load(f)
-    
-    # Create sets of IDs for quick lookup
-    added_ids = {item['factSheetId'] for item in changes_data['addedFactSheets']}
-    changed_ids = {item['factSheetId'] for item in changes_data['changedFactSheets']}
-    
-    # Process all objects
-    for obj in root.findall('.//object'):
-        obj_id = obj.get('id')
-        fact_sheet_id = obj.get('factSheetId')
-        if obj_id:
-            change_type = get_change_type(obj_id, fact_sheet_id, changes_data)
-            if change_type in ['added', 'changed']:
-                # Check if object is both added and changed
-                if fact_sheet_id and fact_sheet_id in added_ids and fact_sheet_id in changed_ids:
-                    mxcell = obj.find('mxCell')
-                    if mxcell is not None:
-                        current_style = mxcell.get('style', '')
-                        new_style = modify_style(current_style, colors['added_changed'], is_standalone=False)
-                        mxcell.set('style', new_style)
-                else:
-                    # Regular styling for other cases
-                    mxcell = obj.find('mxCell')
-                    if mxcell is not None:
-                        current_style = mxcell.get('style', '')
-                        new_style = modify_style(current_style, colors[change_type], is_standalone=False)
-                        mxcell.set('style', new_style)
-    
-    # Process standalone mxCells (those directly under root)
-    for cell in root.findall('.//root/mxCell[@id!="0"][@id!="1"]'):
-        cell_id = cell.get('id')
-        if cell_id:
-            change_type = get_change_type(cell_id, None, changes_data)
-            if change_type in ['added', 'changed']:
-                current_style = cell.get('style', '')
-                # Check if cell is both added and changed
-                if cell_id in added_ids and cell_id in changed_ids:
-                    new_style = modify_style(current_style, colors['added_changed'], is_standalone=True)
-                else:
-                    new_style = modify_style(current_style, colors[change_type], is_standalone=True)
-                cell.set('style', new_style)
-    
-    # Write the tree to the output file
-    tree.write(output_path, encoding='utf-8', xml_declaration=True)
+class ChangeIndex:
+    """
+    Change types of all changed elements, keyed by factSheetId and by object/cell id.
 
-def create_original_based_diagram(original_xml_path, changes_json_path, output_path):
-    """Create a diagram based on original.xml showing removals and changes."""
-    # Load and parse the XML file
-    tree = ET.parse(original_xml_path)
-    root = tree.getroot()
-    
-    # Load changes data
-    with open(changes_json_path, 'r') as f:
-        changes_data = json.load(f)
-    
-    # Process all objects
-    for obj in root.findall('.//object'):
-        obj_id = obj.get('id')
-        fact_sheet_id = obj.get('factSheetId')
-        if obj_id:
-            change_type = get_change_type(obj_id, fact_sheet_id, changes_data)
-            if change_type in ['removed', 'changed']:
-                mxcell = obj.find('mxCell')
-                if mxcell is not None:
-                    current_style = mxcell.get('style', '')
-                    new_style = modify_style(current_style, colors[change_type], is_standalone=False)
-                    mxcell.set('style', new_style)
-    
-    # Process standalone mxCells (those directly under root)
-    for cell in root.findall('.//root/mxCell[@id!="0"][@id!="1"]'):
-        cell_id = cell.get('id')
-        if cell_id:
-            change_type = get_change_type(cell_id, None, changes_data)
-            if change_type in ['removed', 'changed']:
-                current_style = cell.get('style', '')
-                new_style = modify_style(current_style, colors[change_type], is_standalone=True)
-                cell.set('style', new_style)
-    
-    # Write the tree to the output file
-    tree.write(output_path, encoding='utf-8', xml_declaration=True)
+    Built in one pass from a change set dict or lazily from change records (see
+    detect_changes.iter_changes), which must come in change set category order.
+    """
 
-def combine_diagrams(original_xml_path, changed_xml_path, changes_json_path, output_path):
-    # Load and parse the XML files
-    original_tree = ET.parse(original_xml_path)
-    changed_tree = ET.parse(changed_xml_path)
-    
-    # Load changes data
-    with open(changes_json_path, 'r') as f:
-        changes_data = json.load(f)
-    
-    # Create a new tree starting with the changed diagram
-    combined_tree = copy.deepcopy(changed_tree)
-    combined_root = combined_tree.getroot()
-    
-    # Get all objects from both diagrams
-    original_objects = original_tree.findall('.//object')
-    changed_objects = combined_tree.findall('.//object')
-    
-    # Process all objects in the changed diagram
-    for obj in changed_objects:
-        obj_id = obj.get('id')
-        fact_sheet_id = obj.get('factSheetId')
-        if obj_id:
-            change_type = get_change_type(obj_id, fact_sheet_id, changes_data)
-            apply_change_style(obj, change_type)
+    def __init__(self, changes_data):
+        self.by_fact_sheet_id = {}
+        self.by_object_id = {}
+        added_ids = set()
+        changed_ids = set()
+        
+        records = iter_change_records(changes_data) if isinstance(changes_data, dict) else changes_data
+        for record in records:
+            kind = record['kind']
+            if kind not in fact_sheet_precedence:
+                # Labels and move matches do not change how elements are highlighted
+                continue
+            item = record['item']
+            category = record['category'][len(kind):]
             
-            # If this is an added object, adjust its y-coordinate
-            if change_type == 'added':
-                mxcell = obj.find('mxCell')
-                if mxcell is not None:
-                    geometry = mxcell.find('mxGeometry')
-                    if geometry is not None:
-                        current_y = float(geometry.get('y', 0))
-                        height = float(geometry.get('height', 45))  # Default height is 45 if not specified
-                        new_y = current_y + 15 + height
-                        geometry.set('y', str(new_y))
+            # Object and cell ids, with earlier categories winning over later ones
+            self.by_object_id.setdefault(item.get(object_id_keys[category]), kind)
+            
+            if category == 'FactSheets':
+                fact_sheet_id = item['factSheetId']
+                current = self.by_fact_sheet_id.get(fact_sheet_id)
+                if current is None or fact_sheet_precedence[kind] < fact_sheet_precedence[current]:
+                    self.by_fact_sheet_id[fact_sheet_id] = kind
+                if kind == 'added':
+                    added_ids.add(fact_sheet_id)
+                elif kind == 'changed':
+                    changed_ids.add(fact_sheet_id)
+        
+        # Fact sheets that have been both added and changed
+        self.added_changed_ids = added_ids & changed_ids
+
+    def get_change_type(self, obj_id, fact_sheet_id):
+        if fact_sheet_id:
+            change_type = self.by_fact_sheet_id.get(fact_sheet_id)
+            if change_type is not None:
+                return change_type
+        return self.by_object_id.get(obj_id, 'unchanged')
+
+def load_change_index(changes):
+    """
+    Return a ChangeIndex for a changes JSON or NDJSON path, a changes dict, or an existing ChangeIndex.
+
+    NDJSON change sets are indexed while they are read, without building the change set dict.
+    """
+    if isinstance(changes, ChangeIndex):
+        return changes
+    if isinstance(changes, dict):
+        return ChangeIndex(changes)
+    if changes.endswith(('.ndjson', '.jsonl')):
+        return ChangeIndex(read_change_records(changes))
+    with open(changes, 'r') as f:
+        return ChangeIndex(json.load(f))
+
+def get_change_type(obj_id, fact_sheet_id, change_index):
+    """Determine if an object was added, removed, changed, or unchanged."""
+    return change_index.get_change_type(obj_id, fact_sheet_id)
+
+def override_attribute(overrides, elem, key, value):
+    """Record an attribute value to write instead of the element's own, leaving the element unchanged."""
+    attrib = overrides.get(elem)
+    if attrib is None:
+        attrib = overrides[elem] = dict(elem.attrib)
+    attrib[key] = value
+
+def get_attribute(overrides, elem, key, default=None):
+    """Current value of an attribute, taking recorded overrides into account."""
+    return overrides.get(elem, elem.attrib).get(key, default)
+
+def get_standalone_cells(index):
+    """Standalone mxCells of a diagram with an id, excluding the two default cells, in document order."""
+    return index.standalone_cells
+
+# Generated diagrams and their default file names
+diagram_file_names = {
+    'additions': 'additions_diagram.xml',
+    'removals': 'removals_diagram.xml',
+    'combined': 'combined_diagram.xml',
+}
+
+def collect_overrides(original_index, changed_index, change_index, outputs):
+    """
+    Attribute rewrites of the requested diagrams ('additions', 'removals', 'combined').
+
+    The objects and standalone cells of each diagram are visited once for all requested outputs;
+    neither tree is modified. Returns the overrides per output and the removed objects of the
+    original diagram that the combined diagram appends.
+    """
+    additions = {} if 'additions' in outputs else None
+    removals = {} if 'removals' in outputs else None
+    combined = {} if 'combined' in outputs else None
     
-    # Keep track of which IDs were modified
+    # Keep track of which IDs were modified in the combined diagram
     modified_ids = {}
+    removed_objects = []
     
-    # Add removed objects from the original diagram
-    changed_ids = {obj.get('id') for obj in changed_objects}
-    for obj in original_objects:
-        obj_id = obj.get('id')
-        fact_sheet_id = obj.get('factSheetId')
-        if obj_id:
-            change_type = get_change_type(obj_id, fact_sheet_id, changes_data)
-            if change_type == 'removed':
-                # This is a removed object
-                obj_copy = copy.deepcopy(obj)
+    if removals is not None or combined is not None:
+        changed_ids = {obj.get('id') for obj in changed_index.objects} if combined is not None else set()
+        
+        for obj in original_index.objects:
+            obj_id = obj.get('id')
+            fact_sheet_id = obj.get('factSheetId')
+            if not obj_id:
+                continue
+            change_type = get_change_type(obj_id, fact_sheet_id, change_index)
+            mxcell = obj.find('mxCell')
+            
+            # Removals diagram: removed and changed objects
+            if removals is not None and change_type in ['removed', 'changed'] and mxcell is not None:
+                new_style = modify_style(mxcell.get('style', ''), colors[change_type], is_standalone=False)
+                override_attribute(removals, mxcell, 'style', new_style)
+            
+            # Combined diagram: removed objects are added to the changed diagram
+            if combined is not None and change_type == 'removed':
                 # If this ID exists in the changed diagram, append '_removed'
                 if obj_id in changed_ids:
                     new_id = f"{obj_id}_removed"
-                    obj_copy.set('id', new_id)
+                    override_attribute(combined, obj, 'id', new_id)
                     modified_ids[obj_id] = new_id
                     # Update any references to this ID in mxCell elements
-                    mxcell = obj_copy.find('mxCell')
                     if mxcell is not None:
                         if mxcell.get('source') == obj_id:
-                            mxcell.set('source', new_id)
+                            override_attribute(combined, mxcell, 'source', new_id)
                         if mxcell.get('target') == obj_id:
-                            mxcell.set('target', new_id)
+                            override_attribute(combined, mxcell, 'target', new_id)
                 # Apply red style
-                mxcell = obj_copy.find('mxCell')
                 if mxcell is not None:
-                    current_style = mxcell.get('style', '')
-                    new_style = modify_style(current_style, colors['removed'], is_standalone=False)
-                    mxcell.set('style', new_style)
-                # Add to combined diagram
-                root_one = combined_root.find('.//mxCell[@id="1"]/..')
-                if root_one is not None:
-                    root_one.append(obj_copy)
+                    new_style = modify_style(mxcell.get('style', ''), colors['removed'], is_standalone=False)
+                    override_attribute(combined, mxcell, 'style', new_style)
+                removed_objects.append(obj)
+        
+        if removals is not None:
+            for cell in get_standalone_cells(original_index):
+                cell_id = cell.get('id')
+                if cell_id:
+                    change_type = get_change_type(cell_id, None, change_index)
+                    if change_type in ['removed', 'changed']:
+                        new_style = modify_style(cell.get('style', ''), colors[change_type], is_standalone=True)
+                        override_attribute(removals, cell, 'style', new_style)
     
-    # Update all relation references in the combined diagram
-    for relation in combined_root.findall('.//object[@type="relation"]'):
-        mxcell = relation.find('mxCell')
-        if mxcell is not None:
-            source = mxcell.get('source')
-            target = mxcell.get('target')
-            if source in modified_ids:
-                mxcell.set('source', modified_ids[source])
-            if target in modified_ids:
-                mxcell.set('target', modified_ids[target])
+    if additions is not None or combined is not None:
+        for obj in changed_index.objects:
+            mxcell = obj.find('mxCell')
+            if mxcell is None:
+                continue
+            
+            # Update relation references to renamed removed objects
+            if combined is not None and modified_ids and obj.get('type') == 'relation':
+                update_references(combined, mxcell, modified_ids)
+            
+            obj_id = obj.get('id')
+            fact_sheet_id = obj.get('factSheetId')
+            if not obj_id:
+                continue
+            change_type = get_change_type(obj_id, fact_sheet_id, change_index)
+            
+            # Additions diagram: added and changed objects, pink if both added and changed
+            if additions is not None and change_type in ['added', 'changed']:
+                if fact_sheet_id and fact_sheet_id in change_index.added_changed_ids:
+                    color = colors['added_changed']
+                else:
+                    color = colors[change_type]
+                new_style = modify_style(mxcell.get('style', ''), color, is_standalone=False)
+                override_attribute(additions, mxcell, 'style', new_style)
+            
+            if combined is not None:
+                if change_type != 'unchanged':
+                    new_style = modify_style(mxcell.get('style', ''), colors[change_type], is_standalone=False)
+                    override_attribute(combined, mxcell, 'style', new_style)
+                    
+                    # If this is an added object, adjust its y-coordinate
+                    if change_type == 'added':
+                        geometry = mxcell.find('mxGeometry')
+                        if geometry is not None:
+                            current_y = float(geometry.get('y', 0))
+                            height = float(geometry.get('height', 45))  # Default height is 45 if not specified
+                            new_y = current_y + 15 + height
+                            override_attribute(combined, geometry, 'y', str(new_y))
+        
+        for cell in get_standalone_cells(changed_index):
+            cell_id = cell.get('id')
+            if cell_id:
+                change_type = get_change_type(cell_id, None, change_index)
+                if additions is not None and change_type in ['added', 'changed']:
+                    # Check if cell is both added and changed
+                    if cell_id in change_index.added_changed_ids:
+                        color = colors['added_changed']
+                    else:
+                        color = colors[change_type]
+                    new_style = modify_style(cell.get('style', ''), color, is_standalone=True)
+                    override_attribute(additions, cell, 'style', new_style)
+                if combined is not None and change_type != 'unchanged':
+                    new_style = modify_style(cell.get('style', ''), colors[change_type], is_standalone=True)
+                    override_attribute(combined, cell, 'style', new_style)
     
-    # Process standalone mxCells (those directly under root)
-    for cell in combined_root.findall('.//root/mxCell[@id!="0"][@id!="1"]'):
-        cell_id = cell.get('id')
-        if cell_id:
-            change_type = get_change_type(cell_id, None, changes_data)
-            if change_type != 'unchanged':
-                current_style = cell.get('style', '')
-                new_style = modify_style(current_style, colors[change_type], is_standalone=True)
-                cell.set('style', new_style)
+    # Removed relations are added to the combined diagram as well
+    if combined is not None and changed_index.layer_parent is not None and modified_ids:
+        for obj in removed_objects:
+            mxcell = obj.find('mxCell')
+            if obj.get('type') == 'relation' and mxcell is not None:
+                update_references(combined, mxcell, modified_ids)
     
-    # Write the combined tree to the output file
-    combined_tree.write(output_path, encoding='utf-8', xml_declaration=True)
+    overrides = {'additions': additions, 'removals': removals, 'combined': combined}
+    return {output: overrides[output] for output in outputs}, removed_objects
+
+def update_references(overrides, mxcell, modified_ids):
+    """Point the source and target of a relation's mxCell at renamed objects."""
+    for key in ('source', 'target'):
+        value = get_attribute(overrides, mxcell, key)
+        if value in modified_ids:
+            override_attribute(overrides, mxcell, key, modified_ids[value])
+
+def generate_diagrams(original, changed, changes, output_paths):
+    """
+    Create the additions, removals and combined diagrams in one pass.
+
+    `output_paths` maps the diagrams to create ('additions', 'removals', 'combined') to their output
+    files. Each diagram's objects are visited once, and each tree is serialized once for all of its
+    outputs: the additions and combined diagrams are written side by side from changed.xml, the
+    removals diagram from original.xml. Neither tree is copied or modified.
+    """
+    outputs = [output for output in diagram_file_names if output in output_paths]
+    with span('generate', outputs=','.join(outputs)):
+        original_index = load_index(original) if 'removals' in outputs or 'combined' in outputs else None
+        changed_index = load_index(changed) if 'additions' in outputs or 'combined' in outputs else None
+        
+        # Changes can be passed as a ChangeIndex, a changes dict or a JSON file path
+        change_index = load_change_index(changes)
+        
+        with span('generate.collect'):
+            overrides, removed_objects = collect_overrides(original_index, changed_index, change_index, outputs)
+        with span('generate.write'):
+            write_generated(original_index, changed_index, overrides, removed_objects, output_paths)
+
+def write_generated(original_index, changed_index, overrides, removed_objects, output_paths):
+    """Write the generated diagrams, one tree walk per source diagram."""
+    changed_documents = []
+    if 'additions' in output_paths:
+        changed_documents.append((output_paths['additions'], overrides['additions'], None))
+    if 'combined' in output_paths:
+        # Removed objects are added after the children of the default layer's parent
+        appended = {}
+        if changed_index.layer_parent is not None:
+            appended[changed_index.layer_parent] = removed_objects
+        changed_documents.append((output_paths['combined'], overrides['combined'], appended))
+    if changed_documents:
+        write_documents(changed_index.root, changed_documents)
+    if 'removals' in output_paths:
+        write_documents(original_index.root, [(output_paths['removals'], overrides['removals'], None)])
+
+def create_changed_based_diagram(changed, changes, output_path):
+    """Create a diagram based on changed.xml showing additions and changes."""
+    generate_diagrams(None, changed, changes, {'additions': output_path})
+
+def create_original_based_diagram(original, changes, output_path):
+    """Create a diagram based on original.xml showing removals and changes."""
+    generate_diagrams(original, None, changes, {'removals': output_path})
+
+def combine_diagrams(original, changed, changes, output_path):
+    """Create a diagram based on changed.xml that also contains the removed objects of original.xml."""
+    generate_diagrams(original, changed, changes, {'combined': output_path})
 
 def main():
+    parser = argparse.ArgumentParser(description='Generate diagrams with the detected changes highlighted')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    
     # Get the directory containing the files
     input_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files/input')
     changes_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files')
@@ -285,13 +339,18 @@ def main():
     changed_xml = os.path.join(input_dir, 'changed.xml')
     changes_json = os.path.join(changes_dir, 'diagram_changes.json')
 
-    # Create all three diagrams
-    combine_diagrams(original_xml, changed_xml, changes_json, 
-                    os.path.join(generated_diagrams_dir, 'combined_diagram.xml'))
-    create_changed_based_diagram(changed_xml, changes_json,
-                               os.path.join(generated_diagrams_dir, 'additions_diagram.xml'))
-    create_original_based_diagram(original_xml, changes_json,
-                                os.path.join(generated_diagrams_dir, 'removals_diagram.xml'))
+    with instrument_from_args(args):
+        # Parse both diagrams once and share them between all three outputs
+        original_index = DiagramIndex.from_file(original_xml)
+        changed_index = DiagramIndex.from_file(changed_xml)
+        
+        # Load the changes once and index them for constant-time lookups
+        change_index = load_change_index(changes_json)
+        
+        # Create all three diagrams in one pass
+        generate_diagrams(original_index, changed_index, change_index,
+                          {output: os.path.join(generated_diagrams_dir, file_name)
+                           for output, file_name in diagram_file_names.items()})
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+
+from detect_changes import compare_diagrams, count_changes
+from diagram_records import DiagramRecords
+from history_diff import add_to_timeline
+
+# Bump whenever change detection or the change set format changes so stale change sets are never served
+CACHE_VERSION = 2
+
+default_cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files/cache/git')
+
+class GitBlobReader:
+    """
+    Reads objects from a git repository through long-lived `git cat-file` processes.
+
+    One `--batch-check` process resolves "<rev>:<path>" to blob SHAs and one `--batch` process
+    streams blob contents, so no files are checked out and no process is started per blob.
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._check = self._start('--batch-check')
+        self._batch = self._start('--batch')
+
+    def _start(self, mode):
+        return subprocess.Popen(['git', '-C', self.repo_path, 'cat-file', mode],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    @staticmethod
+    def _request(process, spec):
+        process.stdin.write(spec.encode('utf-8') + b'\n')
+        process.stdin.flush()
+        header = process.stdout.readline().decode('utf-8').rstrip('\n')
+        if not header or header.endswith(' missing') or header.endswith(' ambiguous'):
+            return None
+        sha, object_type, size = header.split(' ')
+        return sha, object_type, int(size)
+
+    def resolve(self, spec):
+        """Return the object SHA of a revision spec like 'HEAD:path/to/diagram.xml', or None."""
+        result = self._request(self._check, spec)
+        return result[0] if result is not None else None
+
+    def read_blob(self, spec):
+        """Return the contents of a blob (by SHA or revision spec), or None if it does not exist."""
+        result = self._request(self._batch, spec)
+        if result is None:
+            return None
+        _, object_type, size = result
+        data = self._batch.stdout.read(size)
+        self._batch.stdout.read(1)  # Trailing newline after the contents
+        if object_type != 'blob':
+            return None
+        return data
+
+    def close(self):
+        for process in (self._check, self._batch):
+            process.stdin.close()
+            process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def list_commits(repo_path, diagram_path, commit_range):
+    """
+    Commits of a range that touch the diagram, oldest first, as (sha, timestamp, subject).
+
+    For an 'A..B' range, the start commit A is included so the first change has a baseline.
+    """
+    output = subprocess.run(
+        ['git', '-C', repo_path, 'log', '--reverse', '--format=%H%x09%ct%x09%s', commit_range, '--', diagram_path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    commits = []
+    for line in output.splitlines():
+        sha, timestamp, subject = line.split('\t', 2)
+        commits.append((sha, int(timestamp), subject))
+
+    if '..' in commit_range:
+        start = commit_range.split('..')[0] or 'HEAD'
+        start_sha = subprocess.run(['git', '-C', repo_path, 'rev-parse', start],
+                                   check=True, capture_output=True, text=True).stdout.strip()
+        if not commits or commits[0][0] != start_sha:
+            commits.insert(0, (start_sha, None, None))
+    return commits
+
+class DiffResultCache:
+    """
+    Change sets on disk, keyed by the pair of blob SHAs they were computed from.
+
+    Entries are evicted least recently used first once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=128 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, from_blob, to_blob):
+        return os.path.join(self.cache_dir, f'{from_blob}_{to_blob}.v{CACHE_VERSION}.json')
+
+    def get(self, from_blob, to_blob):
+        entry_path = self._path(from_blob, to_blob)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                changes = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return changes
+
+    def put(self, from_blob, to_blob, changes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(changes, f)
+        os.replace(tmp_path, self._path(from_blob, to_blob))
+        self._evict()
+
+    def _evict(self):
+        # Entries of other cache versions are never read again and are evicted first
+        suffix = f'.v{CACHE_VERSION}.json'
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.json') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((entry.name.endswith(suffix), stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, _, size, _ in entries)
+        for current, _, size, entry_path in sorted(entries):
+            if current and total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+def compare_git_history(repo_path, diagram_path, commit_range='HEAD', cache=None, streaming=False):
+    """
+    Compare a diagram between consecutive commits of a range.
+
+    Blobs are read through GitBlobReader and each blob is parsed at most once. Commits where the
+    blob did not change are skipped, and change sets for known blob pairs come from the cache.
+    """
+    commits = list_commits(repo_path, diagram_path, commit_range)
+    steps = []
+    timeline = {}
+
+    with GitBlobReader(repo_path) as reader:
+        previous = None  # (commit, blob SHA)
+        previous_records = None  # (blob SHA, records), parsed lazily
+        for sha, timestamp, subject in commits:
+            # './' makes git read the path relative to repo_path like `git log` does, not to the top level
+            blob = reader.resolve(f'{sha}:./{diagram_path}')
+            if blob is None:
+                # Diagram does not exist in this commit
+                continue
+            if previous is not None and previous[1] != blob:
+                changes = cache.get(previous[1], blob) if cache is not None else None
+                if changes is None:
+                    if previous_records is None or previous_records[0] != previous[1]:
+                        previous_records = (previous[1], DiagramRecords.from_bytes(
+                            reader.read_blob(previous[1]), streaming=streaming))
+                    records = DiagramRecords.from_bytes(reader.read_blob(blob), streaming=streaming)
+                    changes = compare_diagrams(previous_records[1], records)
+                    previous_records = (blob, records)
+                    if cache is not None:
+                        cache.put(previous[1], blob, changes)
+                steps.append({
+                    'from': previous[0],
+                    'to': sha,
+                    'fromBlob': previous[1],
+                    'toBlob': blob,
+                    'timestamp': timestamp,
+                    'subject': subject,
+                    'changes': changes,
+                })
+                add_to_timeline(timeline, sha, changes)
+            previous = (sha, blob)
+
+    return {
+        'diagram': diagram_path,
+        'range': commit_range,
+        'steps': steps,
+        'timeline': timeline,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect changes of a draw.io XML diagram across git commits')
+    parser.add_argument('repo', help='Path to the git repository')
+    parser.add_argument('diagram', help='Path of the diagram, relative to the repository path')
+    parser.add_argument('range', nargs='?', default='HEAD', help="Commit range, e.g. 'v1..main' (default: HEAD)")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files/diagram_git_history.json'),
+                        help='Output JSON file (default: files/diagram_git_history.json)')
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help='Directory for change sets cached by blob SHA (default: files/cache/git)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write cached change sets')
+    parser.add_argument('--stream', action='store_true', help='Read the diagrams with a streaming parser')
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else DiffResultCache(args.cache_dir)
+    history = compare_git_history(args.repo, args.diagram, args.range, cache=cache, streaming=args.stream)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+
+    for step in history['steps']:
+        total = count_changes(step['changes'])
+        print(f"{step['to'][:10]} {step['subject'] or ''}: {total} changes")
+    if cache is not None:
+        print(f"Change set cache: {cache.hits} hits, {cache.misses} misses, {cache.evictions} evictions")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+
+from detect_changes import compare_diagrams, count_changes
+from diagram_records import load_records
+from records_cache import RecordsCache
+
+# Change set categories that feed the per-factSheetId timeline
+timeline_categories = {
+    'addedFactSheets': 'added',
+    'removedFactSheets': 'removed',
+    'changedFactSheets': 'changed',
+}
+
+def revision_name(source):
+    """Default name of a revision: its file name without extension."""
+    if isinstance(source, str):
+        return os.path.splitext(os.path.basename(source))[0]
+    return None
+
+def add_to_timeline(timeline, revision, changes):
+    """Record the fact sheet changes of one step under the revision they appeared in."""
+    for category, change in timeline_categories.items():
+        for item in changes[category]:
+            entry = timeline.setdefault(item['factSheetId'], {'label': item['label'], 'events': []})
+            # Keep the most recent label
+            if item['label'] is not None:
+                entry['label'] = item['label']
+            event = {'revision': revision, 'change': change}
+            if 'changes' in item:
+                event['fields'] = sorted(item['changes'])
+            entry['events'].append(event)
+
+def compare_history(revisions, names=None, streaming=False, cache=None):
+    """
+    Compare an ordered list of diagram revisions.
+
+    Every revision is parsed once. Returns the consecutive change sets, the cumulative change set
+    from the first to the last revision and a per-factSheetId timeline of additions, changes and
+    removals. Only the first and the previous revision are kept in memory.
+    """
+    if len(revisions) < 2:
+        raise ValueError("At least two revisions are needed to compare a history")
+    if names is None:
+        names = [revision_name(source) or str(index) for index, source in enumerate(revisions)]
+
+    steps = []
+    timeline = {}
+    first_records = previous_records = None
+    for index, source in enumerate(revisions):
+        records = load_records(source, streaming=streaming, cache=cache)
+        if previous_records is None:
+            first_records = records
+        else:
+            changes = compare_diagrams(previous_records, records)
+            steps.append({'from': names[index - 1], 'to': names[index], 'changes': changes})
+            add_to_timeline(timeline, names[index], changes)
+        previous_records = records
+
+    return {
+        'revisions': names,
+        'steps': steps,
+        'cumulative': {
+            'from': names[0],
+            'to': names[-1],
+            'changes': compare_diagrams(first_records, previous_records),
+        },
+        'timeline': timeline,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect changes across an ordered list of draw.io XML diagram revisions')
+    parser.add_argument('revisions', nargs='+', help='Revision XML files, oldest first')
+    parser.add_argument('--names', nargs='+', help='Names for the revisions (default: file names)')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files/diagram_history.json'),
+                        help='Output JSON file (default: files/diagram_history.json)')
+    parser.add_argument('--stream', action='store_true', help='Read the diagrams with a streaming parser')
+    parser.add_argument('--cache-dir', help='Reuse extracted records from this records cache directory')
+    args = parser.parse_args()
+
+    if args.names and len(args.names) != len(args.revisions):
+        parser.error('--names needs one name per revision')
+
+    cache = RecordsCache(args.cache_dir, streaming=args.stream) if args.cache_dir else None
+    history = compare_history(args.revisions, names=args.names, streaming=args.stream, cache=cache)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+
+    for step in history['steps']:
+        total = count_changes(step['changes'])
+        print(f"{step['from']} -> {step['to']}: {total} changes")
+    print(f"{len(history['timeline'])} fact sheets changed across {len(history['revisions'])} revisions")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Callbacks receiving every metrics event; instrumentation is disabled while the list is empty
+_hooks = []
+_local = threading.local()
+
+def peak_rss(children=False):
+    """Peak resident set size of this process (or of its finished child processes) in bytes, if known."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+def enabled():
+    return bool(_hooks)
+
+def add_hook(hook):
+    """Call `hook(event)` with every metrics event (a dict) until it is removed."""
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+def emit(event):
+    for hook in list(_hooks):
+        hook(event)
+
+class _DisabledSpan:
+    """Shared span used while no hooks are registered; entering and leaving it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+_disabled_span = _DisabledSpan()
+
+class Span:
+    """
+    Times a stage and emits a 'stage' event with its duration, peak RSS and, while tracemalloc is
+    tracing, the peak of traced memory during the stage. Fields set on the span are added to it.
+    """
+
+    def __init__(self, stage, fields):
+        self.stage = stage
+        self.fields = fields
+        self.peak_traced = 0
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if tracemalloc.is_tracing():
+            # The enclosing span keeps its peak so far, as the peak is reset for this one
+            if stack:
+                stack[-1].peak_traced = max(stack[-1].peak_traced, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        event = {'event': 'stage', 'stage': self.stage, 'seconds': seconds, 'peak_rss_bytes': peak_rss()}
+        if tracemalloc.is_tracing():
+            self.peak_traced = max(self.peak_traced, tracemalloc.get_traced_memory()[1])
+            event['peak_traced_bytes'] = self.peak_traced
+            if stack:
+                stack[-1].peak_traced = max(stack[-1].peak_traced, self.peak_traced)
+        if exc_type is not None:
+            event['error'] = exc_type.__name__
+        event.update(self.fields)
+        emit(event)
+        return False
+
+def span(stage, **fields):
+    """Context manager timing a stage; a no-op unless a hook is registered."""
+    if not _hooks:
+        return _disabled_span
+    return Span(stage, fields)
+
+def timed_items(stage, items, **fields):
+    """
+    Pass items through and emit a 'stage' event with the time spent producing them and their count.
+
+    Only the time inside the iterator is measured, not the time the consumer spends on each item.
+    """
+    seconds = 0.0
+    produced = 0
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            seconds += time.perf_counter() - start
+            break
+        seconds += time.perf_counter() - start
+        produced += 1
+        yield item
+    emit(dict(event='stage', stage=stage, seconds=seconds, items=produced, **fields))
+
+# Event fields that are not summed up per stage
+peak_fields = ('peak_rss_bytes', 'peak_traced_bytes', 'peak_child_rss_bytes')
+
+class Metrics:
+    """Hook collecting events and summing them up per stage."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """
+        Totals per stage: seconds, calls, the sum of every count (e.g. elements or items) and the
+        highest peak memory of its events.
+        """
+        stages = {}
+        for event in self.events:
+            totals = stages.setdefault(event['stage'], {'seconds': 0.0, 'calls': 0})
+            totals['seconds'] += event['seconds']
+            totals['calls'] += 1
+            for key, value in event.items():
+                if key in peak_fields:
+                    if value is not None:
+                        totals[key] = max(totals.get(key, 0), value)
+                elif key != 'seconds' and isinstance(value, int) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return {'stages': stages, 'peak_rss_bytes': peak_rss()}
+
+    def write(self, path):
+        """Write the summary and all events as JSON."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.summary(), events=self.events), f, indent=2)
+
+@contextmanager
+def instrument(hook=None, metrics_file=None, trace_memory=False):
+    """
+    Collect metrics of everything run inside the block.
+
+    Yields a Metrics collector; `hook` additionally receives every event as it happens, and the
+    collected metrics are written to `metrics_file` at the end. With trace_memory=True, tracemalloc
+    runs during the block so stages report their peak traced memory (at a noticeable slowdown).
+    """
+    metrics = Metrics()
+    hooks = [metrics] + ([hook] if hook is not None else [])
+    for registered in hooks:
+        add_hook(registered)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield metrics
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        for registered in hooks:
+            remove_hook(registered)
+        if metrics_file:
+            metrics.write(metrics_file)
+
+def add_metrics_arguments(parser):
+    """Add the --metrics and --trace-memory options to a script's argument parser."""
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='Write per-stage timings, element counts and peak memory to this JSON file')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='With --metrics, also record the peak traced memory (tracemalloc) of every stage')
+
+@contextmanager
+def instrument_from_args(args):
+    """Instrument a script run if --metrics was given; otherwise instrumentation stays disabled."""
+    if not args.metrics:
+        yield None
+        return
+    with instrument(metrics_file=args.metrics, trace_memory=args.trace_memory) as metrics:
+        yield metrics
@@ -0,0 +1,200 @@
+import math
+import re
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+from diagram_records import load_records
+from instrumentation import span
+
+# Categories whose removed and added items can be paired, with the record lookup and id key of each
+match_categories = {
+    'FactSheets': ('fact_sheets_by_fs_id', 'factSheetId', 'objectId'),
+    'Objects': ('generic_objects', 'objectId', 'objectId'),
+    'Cells': ('cells', 'id', 'id'),
+}
+
+# A removed or added element with the features used for matching
+Candidate = namedtuple('Candidate', ['item', 'object_id', 'kind', 'label', 'center'])
+
+def normalize_label(label):
+    """Lowercase a label and collapse punctuation and whitespace, for hashing and comparison."""
+    return re.sub(r'\W+', ' ', label.lower()).strip() if label else ''
+
+def get_center(cell):
+    """Center of an mxCell's geometry, or None if it has no absolute position."""
+    geometry = cell.geometry if cell is not None else None
+    if geometry is None or not isinstance(geometry.x, float) or not isinstance(geometry.y, float):
+        return None
+    width = geometry.width if isinstance(geometry.width, float) else 0.0
+    height = geometry.height if isinstance(geometry.height, float) else 0.0
+    return geometry.x + width / 2, geometry.y + height / 2
+
+def make_candidate(category, item, records):
+    """Candidate of a removed (original records) or added (changed records) change set item."""
+    lookup, key, id_key = match_categories[category]
+    record = getattr(records, lookup).get(item.get(key))
+    if category == 'Cells':
+        cell = record
+        kind = 'edge' if item.get('edge') == '1' else 'vertex'
+        label = item.get('value') or item.get('label')
+    else:
+        cell = record.mxcell if record is not None else None
+        kind = item.get('factSheetType', 'object')
+        label = item.get('label')
+    return Candidate(item, item.get(id_key), kind, normalize_label(label), get_center(cell))
+
+def block_keys(candidate, grid_size, neighbours=False):
+    """
+    Blocking keys of a candidate: its object id, label hash, label words and grid bucket.
+
+    Only candidates that share a key are compared. With neighbours=True, the surrounding grid
+    buckets are included, so every pair closer than grid_size shares at least one key.
+    """
+    kind = candidate.kind
+    keys = [('id', kind, candidate.object_id)]
+    if candidate.label:
+        keys.append(('label', kind, candidate.label))
+        keys.extend(('word', kind, word) for word in set(candidate.label.split()) if len(word) > 2)
+    if candidate.center is not None:
+        column = math.floor(candidate.center[0] / grid_size)
+        row = math.floor(candidate.center[1] / grid_size)
+        offsets = (-1, 0, 1) if neighbours else (0,)
+        keys.extend(('grid', kind, column + dx, row + dy) for dx in offsets for dy in offsets)
+    return keys
+
+def label_similarity(matcher, label, other_label, minimum=0.0):
+    """
+    Similarity ratio of two normalized labels, or 0.0 if either is empty or it is below minimum.
+
+    `matcher` is a SequenceMatcher whose second sequence is already set to `label`, so its index is
+    built once per label. Length and character-count upper bounds rule out most dissimilar pairs
+    before the full ratio is computed.
+    """
+    if not label or not other_label:
+        return 0.0
+    if label == other_label:
+        return 1.0
+    if 2.0 * min(len(label), len(other_label)) / (len(label) + len(other_label)) < minimum:
+        return 0.0
+    matcher.set_seq1(other_label)
+    if matcher.quick_ratio() < minimum:
+        return 0.0
+    ratio = matcher.ratio()
+    return ratio if ratio >= minimum else 0.0
+
+def get_distance(candidate, other):
+    """Distance between the centers of two candidates, or None if either has no position."""
+    if candidate.center is None or other.center is None:
+        return None
+    return math.dist(candidate.center, other.center)
+
+def match_candidates(removed, added, max_distance=200.0, min_label_similarity=0.8,
+                     position_tolerance=10.0, max_block_size=50):
+    """
+    Pair removed and added candidates of one category, each at most once.
+
+    Pairs are 'moved' (similar label and type, different position), 'reidentified' (similar label
+    and type at the same position) or 'replaced' (same type at the same object id or position, but
+    a different label). Candidates are only compared within blocks sharing an object id, label,
+    label word or neighbouring grid bucket, instead of comparing all pairs; blocks larger than
+    max_block_size (e.g. very common words) are skipped.
+    """
+    blocks = {}
+    for index, candidate in enumerate(added):
+        for key in block_keys(candidate, max_distance):
+            blocks.setdefault(key, []).append(index)
+
+    scored = []
+    for removed_index, candidate in enumerate(removed):
+        compared = set()
+        matcher = SequenceMatcher(None, '', candidate.label, autojunk=False)
+        for key in block_keys(candidate, max_distance, neighbours=True):
+            block = blocks.get(key, ())
+            if len(block) > max_block_size:
+                continue
+            for added_index in block:
+                if added_index in compared:
+                    continue
+                compared.add(added_index)
+                other = added[added_index]
+                distance = get_distance(candidate, other)
+                same_position = distance is not None and distance <= position_tolerance
+                in_place = same_position or candidate.object_id == other.object_id
+                
+                # Labels only matter below the threshold for pairs that can be replacements
+                similarity = label_similarity(matcher, candidate.label, other.label,
+                                              0.0 if in_place else min_label_similarity)
+                if similarity >= min_label_similarity:
+                    match = 'reidentified' if same_position else 'moved'
+                elif in_place:
+                    match = 'replaced'
+                else:
+                    continue
+                proximity = max(0.0, 1.0 - distance / max_distance) if distance is not None else 0.0
+                score = 0.7 * similarity + 0.3 * proximity
+                scored.append((score, removed_index, added_index, match, similarity, distance))
+
+    # Greedy one-to-one assignment, best pairs first
+    scored.sort(key=lambda entry: (-entry[0], entry[1], entry[2]))
+    used_removed = set()
+    used_added = set()
+    matches = []
+    for score, removed_index, added_index, match, similarity, distance in scored:
+        if removed_index in used_removed or added_index in used_added:
+            continue
+        used_removed.add(removed_index)
+        used_added.add(added_index)
+        matches.append({
+            'match': match,
+            'score': round(score, 3),
+            'labelSimilarity': round(similarity, 3),
+            'distance': round(distance, 1) if distance is not None else None,
+            'removed': removed[removed_index].item,
+            'added': added[added_index].item,
+        })
+    return matches
+
+def match_items(removed_items, added_items, original_records, changed_records, **options):
+    """Matches of removed and added items, given as {category suffix: items}, in category order."""
+    matches = []
+    with span('match') as timing:
+        for category in match_categories:
+            removed = [make_candidate(category, item, original_records) for item in removed_items.get(category, [])]
+            added = [make_candidate(category, item, changed_records) for item in added_items.get(category, [])]
+            if not removed or not added:
+                continue
+            matches.extend(dict(category=category, **match) for match in match_candidates(removed, added, **options))
+        timing.set(matches=len(matches))
+    return matches
+
+def match_moves(changes, original, changed, streaming=False, cache=None, **options):
+    """
+    Pair removed and added elements of a change set that are likely the same element moved or
+    given a new id, or replaced in place. Diagrams can be given like for compare_diagrams.
+    """
+    original_records = load_records(original, streaming=streaming, cache=cache)
+    changed_records = load_records(changed, streaming=streaming, cache=cache)
+    removed_items = {category: changes[f'removed{category}'] for category in match_categories}
+    added_items = {category: changes[f'added{category}'] for category in match_categories}
+    return match_items(removed_items, added_items, original_records, changed_records, **options)
+
+def iter_with_matches(records, original, changed, streaming=False, cache=None, **options):
+    """
+    Pass change records through and append a 'match' record (category 'matchedChanges') per pair.
+
+    Only the removed and added items of the matched categories are kept until the end.
+    """
+    removed_items = {}
+    added_items = {}
+    for record in records:
+        yield record
+        kind = record['kind']
+        category = record['category'][len(kind):]
+        if kind in ('removed', 'added') and category in match_categories:
+            target = removed_items if kind == 'removed' else added_items
+            target.setdefault(category, []).append(record['item'])
+
+    original_records = load_records(original, streaming=streaming, cache=cache)
+    changed_records = load_records(changed, streaming=streaming, cache=cache)
+    for match in match_items(removed_items, added_items, original_records, changed_records, **options):
+        yield {'category': 'matchedChanges', 'kind': 'match', 'item': match}
@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import sys
+
+from detect_changes import compare_cells, compare_objects
+from diagram_index import load_index
+from diagram_records import DiagramRecords, FactSheetRecord, GenericObjectRecord, ObjectRecord, RelationRecord
+from xml_writer import write_document
+
+# Merged element categories: the DiagramIndex/DiagramRecords attribute and the comparison of each
+merge_categories = {
+    'factSheets': ('fact_sheets', compare_objects),
+    'relations': ('relations', compare_objects),
+    'objects': ('generic_objects', compare_objects),
+    'cells': ('cells', compare_cells),
+}
+
+# XML attribute of every object record field
+object_attributes = {cls: dict(zip(cls.json_keys, cls.attributes))
+                     for cls in (FactSheetRecord, RelationRecord, GenericObjectRecord)}
+
+# Business identifiers that make two elements added on both sides the same element
+identity_fields = {'factSheets': 'fact_sheet_id', 'relations': 'relation_id'}
+
+# mxCell attributes holding the ids of other cells
+reference_attributes = ('source', 'target', 'parent')
+
+def collect_elements(index, records):
+    """id -> (category, element, record) of every compared object and standalone cell."""
+    elements = {}
+    for category, (attribute, _) in merge_categories.items():
+        element_map = getattr(index, attribute)
+        for element_id, record in getattr(records, attribute).items():
+            if element_id is not None:
+                elements[element_id] = (category, element_map[element_id], record)
+    return elements
+
+def flatten_changes(changes, prefix=()):
+    """Field path -> (from, to) of the nested changes of compare_objects/compare_cells."""
+    fields = {}
+    for key, value in changes.items():
+        path = prefix + (key,)
+        if isinstance(value, dict) and set(value) == {'from', 'to'}:
+            fields[path] = (value['from'], value['to'])
+        else:
+            fields.update(flatten_changes(value, path))
+    return fields
+
+def changed_fields(category, base_record, record):
+    """
+    Changed field paths of an element relative to its base version, or None if the change cannot
+    be merged field by field (the element changed its type or gained or lost its mxCell).
+    """
+    if type(base_record) is not type(record):
+        return None
+    if isinstance(record, ObjectRecord) and (base_record.mxcell is None) != (record.mxcell is None):
+        return None
+    diff = merge_categories[category][1](base_record, record)
+    return flatten_changes(diff['changes']) if diff else {}
+
+def field_prefixes(paths):
+    return {path[:length] for path in paths for length in range(1, len(path) + 1)}
+
+def set_attribute(elem, key, value):
+    if value is None:
+        elem.attrib.pop(key, None)
+    else:
+        elem.set(key, value)
+
+def apply_field(elem, category, record, path, value, source_elem, renamed):
+    """Set one changed field (a path of compare_objects/compare_cells changes) on an element."""
+    if category != 'cells':
+        if path[0] != 'mxCell':
+            set_attribute(elem, object_attributes[type(record)][path[0]], value)
+            return
+        elem, source_elem, path = elem.find('mxCell'), source_elem.find('mxCell'), path[1:]
+        if elem is None or source_elem is None:
+            return
+
+    key = path[0]
+    if key == 'geometry':
+        geometry, source_geometry = elem.find('mxGeometry'), source_elem.find('mxGeometry')
+        if len(path) > 1 and geometry is not None:
+            set_attribute(geometry, path[1], value)
+            return
+        # The geometry was added or removed as a whole
+        if geometry is not None:
+            elem.remove(geometry)
+        if source_geometry is not None:
+            elem.append(source_geometry)
+    elif key == 'label':
+        edge_label = elem.find('.//mxGeometry//*[@value]')
+        if edge_label is not None:
+            set_attribute(edge_label, 'value', value)
+    else:
+        set_attribute(elem, key, renamed.get(value, value) if key in reference_attributes else value)
+
+def format_path(path):
+    return '.'.join(path)
+
+class DiagramMerge:
+    """
+    Three-way merge of two diagrams (ours, theirs) that were both edited from a common base.
+
+    Objects and standalone cells are matched by id across the three versions through dicts, so the
+    merge runs in linear time. An element changed on one side only takes that side's version;
+    elements changed on both sides are merged field by field from the changes compare_objects and
+    compare_cells report against the base, and fields changed differently on both sides are
+    conflicts. Conflicts are resolved in favour of `prefer` ('ours' or 'theirs') and reported.
+    Elements added on both sides with the same id but a different identity are both kept, theirs
+    with an '_theirs' suffix on its id.
+
+    The merged diagram is built on the ours tree, which is modified in place. Elements taken from
+    theirs are moved into it and renamed where needed, so the theirs tree is modified as well.
+    """
+
+    def __init__(self, base, ours, theirs, prefer='ours'):
+        if prefer not in ('ours', 'theirs'):
+            raise ValueError(f"prefer must be 'ours' or 'theirs', not {prefer!r}")
+        self.prefer = prefer
+        self.base_index, self.ours_index, self.theirs_index = load_index(base), load_index(ours), load_index(theirs)
+        self.base = collect_elements(self.base_index, DiagramRecords.from_index(self.base_index))
+        self.ours = collect_elements(self.ours_index, DiagramRecords.from_index(self.ours_index))
+        self.theirs = collect_elements(self.theirs_index, DiagramRecords.from_index(self.theirs_index))
+
+        self.conflicts = []
+        # Elements taken from ours or theirs, changed the same way on both sides, and merged field by field
+        self.stats = {'ours': 0, 'theirs': 0, 'both': 0, 'merged': 0, 'fields': 0}
+        self.renamed = {}
+        # Ours elements replaced by another element or removed (None), and theirs elements to add
+        self._replaced = {}
+        self._added = []
+        self._field_updates = []
+
+    def conflict(self, kind, category, element_id, record, field=None, base=None, ours=None, theirs=None):
+        entry = {'type': kind, 'category': category, 'id': element_id}
+        label = getattr(record, 'label', None) or getattr(record, 'value', None)
+        if label:
+            entry['label'] = label
+        if field is not None:
+            entry['field'] = field
+        entry.update(base=base, ours=ours, theirs=theirs, resolution=self.prefer)
+        self.conflicts.append(entry)
+
+    def merge(self):
+        """Merge all elements, apply the result to the ours tree and return it as a DiagramIndex."""
+        for element_id in self.base.keys() | self.ours.keys() | self.theirs.keys():
+            self.merge_element(element_id, self.base.get(element_id), self.ours.get(element_id),
+                               self.theirs.get(element_id))
+        self.apply()
+        self.conflicts.sort(key=lambda conflict: (conflict['category'], conflict['id'], conflict.get('field', '')))
+        return self.ours_index
+
+    def merge_element(self, element_id, base, ours, theirs):
+        base_record = base[2] if base is not None else None
+        ours_record = ours[2] if ours is not None else None
+        theirs_record = theirs[2] if theirs is not None else None
+
+        if ours_record == theirs_record:
+            if ours_record != base_record:
+                self.stats['both'] += 1
+            return
+        if ours_record == base_record:
+            self.take_theirs(element_id, ours, theirs)
+            self.stats['theirs'] += 1
+            return
+        if theirs_record == base_record:
+            self.stats['ours'] += 1
+            return
+
+        # Changed differently on both sides
+        category = (ours or theirs)[0]
+        if base is None:
+            self.merge_added(element_id, category, ours, theirs)
+        elif ours is None or theirs is None:
+            self.conflict('delete/modify', category, element_id, base_record,
+                          ours='deleted' if ours is None else 'modified',
+                          theirs='deleted' if theirs is None else 'modified')
+            if self.prefer == 'theirs':
+                self.take_theirs(element_id, ours, theirs)
+        else:
+            self.merge_fields(element_id, base, ours, theirs)
+
+    def take_theirs(self, element_id, ours, theirs):
+        if ours is None:
+            self._added.append(theirs[1])
+        else:
+            self._replaced[ours[1]] = theirs[1] if theirs is not None else None
+
+    def merge_added(self, element_id, category, ours, theirs):
+        identity = identity_fields.get(category)
+        same_element = (ours[0] == theirs[0] and identity is not None
+                        and getattr(ours[2], identity) == getattr(theirs[2], identity))
+        if not same_element:
+            # Unrelated elements that happen to get the same id: keep both
+            new_id = f'{element_id}_theirs'
+            self.renamed[element_id] = new_id
+            theirs[1].set('id', new_id)
+            self._added.append(theirs[1])
+            self.stats['theirs'] += 1
+            return
+        diff = merge_categories[category][1](ours[2], theirs[2])
+        fields = flatten_changes(diff['changes']) if diff else {}
+        for path, (ours_value, theirs_value) in fields.items():
+            self.conflict('add/add', category, element_id, ours[2], field=format_path(path),
+                          ours=ours_value, theirs=theirs_value)
+        if not fields:
+            self.conflict('add/add', category, element_id, ours[2], field='element',
+                          ours='added', theirs='added')
+        if self.prefer == 'theirs':
+            self._replaced[ours[1]] = theirs[1]
+
+    def merge_fields(self, element_id, base, ours, theirs):
+        category = ours[0]
+        ours_fields = changed_fields(category, base[2], ours[2])
+        theirs_fields = changed_fields(category, base[2], theirs[2])
+        if ours_fields is None or theirs_fields is None or ours[0] != theirs[0]:
+            self.conflict('modify/modify', category, element_id, base[2], field='element',
+                          ours='modified', theirs='modified')
+            if self.prefer == 'theirs':
+                self._replaced[ours[1]] = theirs[1]
+            return
+
+        ours_prefixes = field_prefixes(ours_fields)
+        updates = []
+        for path, (base_value, value) in theirs_fields.items():
+            # Fields changed on both sides, or inside a geometry added or removed as a whole on one side
+            overlap = [other for other in (path[:length] for length in range(1, len(path) + 1)) if other in ours_fields]
+            if not overlap and path not in ours_prefixes:
+                updates.append((path, value))
+            elif overlap and overlap[-1] == path and ours_fields[path][1] == value:
+                continue
+            else:
+                ours_value = ours_fields[overlap[-1]][1] if overlap else 'modified'
+                self.conflict('modify/modify', category, element_id, base[2], field=format_path(path),
+                              base=base_value, ours=ours_value, theirs=value)
+                if self.prefer == 'theirs':
+                    updates.append((path, value))
+        self._field_updates.append((ours[1], category, ours[2], theirs[1], updates))
+        self.stats['fields'] += len(updates)
+        self.stats['merged'] += 1
+
+    def apply(self):
+        """Apply the merge decisions to the ours tree, rebuilding each affected parent once."""
+        for elem, category, record, source_elem, updates in self._field_updates:
+            for path, value in updates:
+                apply_field(elem, category, record, path, value, source_elem, self.renamed)
+
+        # Theirs elements taken into the merged diagram may point at renamed ids
+        if self.renamed:
+            taken = self._added + [elem for elem in self._replaced.values() if elem is not None]
+            for elem in taken:
+                mxcell = elem if elem.tag == 'mxCell' else elem.find('mxCell')
+                if mxcell is None:
+                    continue
+                for key in reference_attributes:
+                    value = mxcell.get(key)
+                    if value in self.renamed:
+                        mxcell.set(key, self.renamed[value])
+
+        parents = {}
+        for elem in self._replaced:
+            parent = self.ours_index.get_parent(elem)
+            if parent is not None:
+                parents[id(parent)] = parent
+        for parent in parents.values():
+            children = []
+            for child in parent:
+                replacement = self._replaced.get(child, child)
+                if replacement is None:
+                    # Keep the whitespace that followed the removed element
+                    if children:
+                        children[-1].tail = child.tail
+                    continue
+                if replacement is not child:
+                    replacement.tail = child.tail
+                children.append(replacement)
+            parent[:] = children
+
+        layer_parent = self.ours_index.layer_parent
+        if self._added and layer_parent is not None:
+            # Added elements follow the document order of theirs
+            order = {elem: position for position, elem in enumerate(self.theirs_index.root.iter())}
+            self._added.sort(key=lambda elem: order.get(elem, 0))
+            last_tail = layer_parent[-1].tail if len(layer_parent) else None
+            inner_tail = layer_parent[-2].tail if len(layer_parent) > 1 else last_tail
+            for elem in self._added:
+                if len(layer_parent):
+                    layer_parent[-1].tail = inner_tail
+                elem.tail = last_tail
+                layer_parent.append(elem)
+
+    def result(self):
+        """Summary of the merge: merged element counts, renamed ids and conflicts."""
+        return {'merged': dict(self.stats), 'renamed': dict(sorted(self.renamed.items())), 'conflicts': self.conflicts}
+
+def merge_diagrams(base, ours, theirs, output_path=None, prefer='ours'):
+    """
+    Three-way merge of diagrams given as XML file paths or DiagramIndex instances.
+
+    Writes the merged mxGraphModel to output_path, if given, and returns the merge summary with
+    the conflicts. DiagramIndex instances passed as ours or theirs are modified by the merge.
+    """
+    merge = DiagramMerge(base, ours, theirs, prefer=prefer)
+    merged = merge.merge()
+    if output_path:
+        write_document(output_path, merged.root)
+    return merge.result()
+
+def print_merge_report(result):
+    merged = result['merged']
+    print(f"Took {merged['ours']} elements changed in ours and {merged['theirs']} changed in theirs; "
+          f"{merged['both']} were changed the same way in both")
+    print(f"Merged {merged['merged']} elements changed in both field by field ({merged['fields']} fields from theirs)")
+    for old_id, new_id in result['renamed'].items():
+        print(f"• Added in both with id {old_id}; theirs was renamed to {new_id}")
+    if not result['conflicts']:
+        print("No conflicts")
+        return
+    print(f"{len(result['conflicts'])} conflicts:")
+    for conflict in result['conflicts']:
+        name = f"{conflict['category']} {conflict['id']}"
+        if conflict.get('label'):
+            name += f" ('{conflict['label']}')"
+        field = f" field {conflict['field']}" if conflict.get('field') else ''
+        print(f"• {conflict['type']} on {name}{field}: kept {conflict['resolution']}")
+        if conflict['ours'] is not None or conflict['theirs'] is not None:
+            print(f"    base:   {conflict['base']!r}")
+            print(f"    ours:   {conflict['ours']!r}")
+            print(f"    theirs: {conflict['theirs']!r}")
+
+def main():
+    files_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+    parser = argparse.ArgumentParser(description='Three-way merge of draw.io XML diagrams edited from a common base')
+    parser.add_argument('base', help='Common base XML file')
+    parser.add_argument('ours', help='Our edited XML file')
+    parser.add_argument('theirs', help='Their edited XML file')
+    parser.add_argument('--output', default=os.path.join(files_dir, 'merged_diagram.xml'),
+                        help='Merged XML file (default: files/merged_diagram.xml)')
+    parser.add_argument('--report', default=os.path.join(files_dir, 'diagram_merge.json'),
+                        help='Merge summary and conflicts as JSON (default: files/diagram_merge.json)')
+    parser.add_argument('--prefer', choices=['ours', 'theirs'], default='ours',
+                        help='Side whose version is kept on conflicts (default: ours)')
+    args = parser.parse_args()
+
+    result = merge_diagrams(args.base, args.ours, args.theirs, args.output, prefer=args.prefer)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print_merge_report(result)
+    print(f"Wrote {args.output}")
+    if result['conflicts']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import binascii
+import urllib.parse
+import xml.etree.ElementTree as ET
+import zlib
+from collections import namedtuple
+
+# One page of a draw.io file; xml holds the page's <mxGraphModel> as bytes
+DiagramPage = namedtuple('DiagramPage', ['id', 'name', 'xml'])
+
+# Compressed page contents are inflated in chunks of this size
+INFLATE_CHUNK_SIZE = 256 * 1024
+
+def is_mxfile_bytes(data):
+    """Whether XML bytes are a draw.io <mxfile> rather than a bare <mxGraphModel>."""
+    head = bytes(data[:1024]).lstrip()
+    if head.startswith(b'<?xml'):
+        head = head[head.find(b'?>') + 2:].lstrip()
+    return head.startswith(b'<mxfile')
+
+def is_mxfile(path):
+    """Whether an XML file is a draw.io <mxfile> rather than a bare <mxGraphModel>."""
+    with open(path, 'rb') as f:
+        return is_mxfile_bytes(f.read(1024))
+
+def inflate(data):
+    """Inflate raw deflate data, feeding the decompressor slices of a memoryview instead of copies."""
+    view = memoryview(data)
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    output = bytearray()
+    for start in range(0, len(view), INFLATE_CHUNK_SIZE):
+        output += decompressor.decompress(view[start:start + INFLATE_CHUNK_SIZE])
+    output += decompressor.flush()
+    return output
+
+def decode_diagram_text(text):
+    """
+    Decode the text of a compressed <diagram> element into <mxGraphModel> XML bytes.
+
+    draw.io stores compressed pages as base64(deflate(encodeURIComponent(xml))).
+    """
+    inflated = inflate(binascii.a2b_base64(text))
+    if inflated[:1] == b'%':
+        return urllib.parse.unquote_to_bytes(bytes(inflated))
+    return bytes(inflated)
+
+def read_pages_from_root(mxfile_root):
+    """Pages of a parsed <mxfile> element, in document order."""
+    pages = []
+    for diagram in mxfile_root.iter('diagram'):
+        model = diagram.find('mxGraphModel')
+        if model is not None:
+            xml = ET.tostring(model)
+        elif diagram.text and diagram.text.strip():
+            xml = decode_diagram_text(diagram.text.strip())
+        else:
+            continue
+        pages.append(DiagramPage(diagram.get('id'), diagram.get('name'), xml))
+    return pages
+
+def read_pages_from_bytes(data):
+    """Pages of a draw.io file given as bytes; a bare <mxGraphModel> is a single unnamed page."""
+    if not is_mxfile_bytes(data):
+        return [DiagramPage(None, None, bytes(data))]
+    return read_pages_from_root(ET.fromstring(data))
+
+def read_pages(path):
+    """Pages of a draw.io file; a bare <mxGraphModel> is a single unnamed page."""
+    with open(path, 'rb') as f:
+        return read_pages_from_bytes(f.read())
+
+def select_page(pages, page=None):
+    """
+    Select a page by index, id or name (the first page by default).
+    """
+    if not pages:
+        raise ValueError("Diagram file does not contain any pages")
+    if page is None:
+        return pages[0]
+    if isinstance(page, int):
+        return pages[page]
+    for candidate in pages:
+        if candidate.id == page:
+            return candidate
+    for candidate in pages:
+        if candidate.name == page:
+            return candidate
+    raise ValueError(f"Page not found: {page}")
+
+def match_pages(original_pages, changed_pages):
+    """
+    Pair pages of two files by id, then by name.
+
+    Returns (original page or None, changed page or None) pairs, in the order of the changed file
+    followed by pages that only exist in the original.
+    """
+    unmatched_original = list(original_pages)
+    pairs = []
+    for changed_page in changed_pages:
+        match = None
+        for key in ('id', 'name'):
+            value = getattr(changed_page, key)
+            if value is None:
+                continue
+            match = next((page for page in unmatched_original if getattr(page, key) == value), None)
+            if match is not None:
+                break
+        # Bare diagrams on both sides are a single unnamed page
+        if match is None and changed_page.id is None and changed_page.name is None and unmatched_original:
+            if unmatched_original[0].id is None and unmatched_original[0].name is None:
+                match = unmatched_original[0]
+        if match is not None:
+            unmatched_original.remove(match)
+        pairs.append((match, changed_page))
+    pairs.extend((page, None) for page in unmatched_original)
+    return pairs
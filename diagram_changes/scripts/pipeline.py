@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from detect_changes import compare_diagrams, load_changes
+from diagram_index import DiagramIndex
+from diagram_records import load_records
+from generate_new_diagrams import ChangeIndex, diagram_file_names, generate_diagrams
+from instrumentation import add_metrics_arguments, instrument_from_args
+from print_changes import print_report
+from render_diagram import RenderCache, render_diagrams
+
+files_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+
+# Stages in the order they run; 'match' is optional and not part of the default stages
+stages = ['detect', 'match', 'report', 'generate', 'render']
+default_stages = ['detect', 'report', 'generate']
+
+class Pipeline:
+    """
+    Runs detect -> match -> report -> generate -> render in one process.
+
+    Both diagrams are parsed once and the change set is handed from stage to stage in memory; writing
+    it to diagram_changes.json is optional. The duration of every stage is recorded in `timings`.
+    """
+
+    def __init__(self, original_xml, changed_xml, files_dir=files_dir):
+        self.original_xml = original_xml
+        self.changed_xml = changed_xml
+        self.changes_json = os.path.join(files_dir, 'diagram_changes.json')
+        self.generated_dir = os.path.join(files_dir, 'generated_diagrams')
+        self.rendered_dir = os.path.join(files_dir, 'rendered_diagrams')
+        self.timings = {}
+        self.changes = None
+        self._original_index = None
+        self._changed_index = None
+        self._original_records = None
+        self._changed_records = None
+        self._change_index = None
+        self._render_cache = None
+
+    @property
+    def original_index(self):
+        if self._original_index is None:
+            self._original_index = self._timed('parse', DiagramIndex.from_file, self.original_xml)
+        return self._original_index
+
+    @property
+    def changed_index(self):
+        if self._changed_index is None:
+            self._changed_index = self._timed('parse', DiagramIndex.from_file, self.changed_xml)
+        return self._changed_index
+
+    @property
+    def original_records(self):
+        if self._original_records is None:
+            self._original_records = self._timed('extract', load_records, self.original_index)
+        return self._original_records
+
+    @property
+    def changed_records(self):
+        if self._changed_records is None:
+            self._changed_records = self._timed('extract', load_records, self.changed_index)
+        return self._changed_records
+
+    def _timed(self, stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def _require_changes(self):
+        # Without the detect stage, fall back to the change set of a previous run
+        if self.changes is None:
+            self.changes = load_changes(self.changes_json)
+        return self.changes
+
+    def output_path(self, name):
+        return os.path.join(self.generated_dir, diagram_file_names[name])
+
+    def detect(self, write_json=False):
+        """Compare the diagrams; optionally write the change set to diagram_changes.json."""
+        original_records, changed_records = self.original_records, self.changed_records
+        self.changes = self._timed('detect', compare_diagrams, original_records, changed_records)
+        self._change_index = None
+        if write_json:
+            self.write_changes()
+        return self.changes
+
+    def match(self, **options):
+        """Pair removed and added elements that were moved, re-identified or replaced (see match_moves)."""
+        # Imported here so runs without the match stage do not depend on it
+        from match_moves import match_moves
+        changes = self._require_changes()
+        original_records, changed_records = self.original_records, self.changed_records
+        changes['matchedChanges'] = self._timed('match', match_moves, changes, original_records, changed_records,
+                                                **options)
+        return changes['matchedChanges']
+
+    def write_changes(self):
+        """Write the change set to diagram_changes.json."""
+        with open(self.changes_json, 'w', encoding='utf-8') as f:
+            json.dump(self._require_changes(), f, indent=2)
+
+    def report(self):
+        """Print the changelog."""
+        # Change sets carry the labels the report needs; the diagrams are only parsed for older ones
+        changes = self._require_changes()
+        self._timed('report', print_report, changes,
+                    self._original_index or self.original_xml, self._changed_index or self.changed_xml)
+
+    def generate(self):
+        """Write the additions, removals and combined diagrams."""
+        if self._change_index is None:
+            self._change_index = ChangeIndex(self._require_changes())
+        original_index, changed_index = self.original_index, self.changed_index
+        output_paths = {name: self.output_path(name) for name in diagram_file_names}
+        self._timed('generate', generate_diagrams, original_index, changed_index, self._change_index, output_paths)
+
+    def render(self, names=None, format='png', native=False, cache=True, drawio_path=None, max_workers=2):
+        """
+        Render generated diagrams (all of them by default) to files/rendered_diagrams.
+
+        All diagrams are rendered in one batch, so pass every name needed in a single call. draw.io
+        renders go through the render cache in files/cache/renders by default; `cache` can also be
+        another RenderCache, or False to always run draw.io. Returns the output paths by name.
+        """
+        names = names or list(diagram_file_names)
+        if cache is True and not native:
+            if self._render_cache is None:
+                self._render_cache = RenderCache()
+            cache = self._render_cache
+        extension = 'svg' if native else format
+        paths = {name: os.path.join(self.rendered_dir, os.path.splitext(diagram_file_names[name])[0] + '.' + extension)
+                 for name in names}
+
+        def render_all():
+            if native:
+                from svg_renderer import render_svg
+                for name in names:
+                    render_svg(self.output_path(name), paths[name])
+                return
+            jobs = [(self.output_path(name), paths[name], format) for name in names]
+            for result in render_diagrams(jobs, format, drawio_path=drawio_path, max_workers=max_workers,
+                                          cache=cache or None):
+                if not result['ok']:
+                    raise RuntimeError(f"Error rendering {result['input']}: {result['error']}")
+
+        self._timed('render', render_all)
+        return paths
+
+    def run(self, selected=default_stages, write_json=False, **render_options):
+        """Run the selected stages in pipeline order."""
+        # The change set is written once it is complete, after the last of detect and match
+        change_stages = [stage for stage in ('detect', 'match') if stage in selected]
+        for stage in stages:
+            if stage not in selected:
+                continue
+            if stage == 'render':
+                self.render(**render_options)
+            else:
+                getattr(self, stage)()
+            if write_json and change_stages and stage == change_stages[-1]:
+                self.write_changes()
+        return self.timings
+
+def print_timings(timings):
+    width = max(len(stage) for stage in timings)
+    print()
+    for stage, seconds in timings.items():
+        print(f"{stage:<{width}}  {seconds * 1000:9.1f} ms")
+    print(f"{'total':<{width}}  {sum(timings.values()) * 1000:9.1f} ms")
+
+def main():
+    input_dir = os.path.join(files_dir, 'input')
+    parser = argparse.ArgumentParser(description='Detect, report, generate and render diagram changes in one process')
+    parser.add_argument('--stages', default=','.join(default_stages),
+                        help=f"Comma-separated stages to run, out of {','.join(stages)} (default: {','.join(default_stages)})")
+    parser.add_argument('--original', default=os.path.join(input_dir, 'original.xml'),
+                        help='Original XML file (default: files/input/original.xml)')
+    parser.add_argument('--changed', default=os.path.join(input_dir, 'changed.xml'),
+                        help='Changed XML file (default: files/input/changed.xml)')
+    parser.add_argument('--write-json', action='store_true',
+                        help='Write the detected changes to files/diagram_changes.json')
+    parser.add_argument('--format', choices=['png', 'jpg', 'pdf', 'svg'], default='png',
+                        help='Render output format (default: png)')
+    parser.add_argument('--native', action='store_true',
+                        help='Render SVG with the built-in renderer instead of draw.io')
+    parser.add_argument('--no-render-cache', action='store_true', help='Always run draw.io when rendering')
+    parser.add_argument('--quiet', action='store_true', help='Do not print the stage timings')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    selected = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in selected if stage not in stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    pipeline = Pipeline(args.original, args.changed)
+    try:
+        with instrument_from_args(args):
+            timings = pipeline.run(selected, write_json=args.write_json,
+                                   format=args.format, native=args.native, cache=not args.no_render_cache)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not args.quiet:
+        print_timings(timings)
+
+if __name__ == '__main__':
+    main()
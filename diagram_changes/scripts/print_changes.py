@@ -1,15 +1,34 @@
+import argparse
 import json
-import xml.etree.ElementTree as ET
 import os
+from itertools import groupby
 
-def get_label_for_id(factsheet_id, original_root, changed_root):
-    # Search in both XML files for the factsheet
-    for root in [original_root, changed_root]:
-        # Find all factSheet objects
-        for obj in root.findall(".//object[@type='factSheet']"):
-            if obj.get('factSheetId') == factsheet_id and obj.get('label'):
-                return obj.get('label')
-    return factsheet_id  # Return the ID if no label is found
+from detect_changes import read_change_records
+from diagram_index import load_index
+from instrumentation import add_metrics_arguments, instrument_from_args, span
+
+def build_label_index(original_index, changed_index):
+    """factSheetId -> label of all labelled fact sheets, preferring the original diagram."""
+    labels = {}
+    for index in [original_index, changed_index]:
+        for obj in index.objects_by_type.get('factSheet', []):
+            label = obj.get('label')
+            if label:
+                labels.setdefault(obj.get('factSheetId'), label)
+    return labels
+
+# Headlines of the pairs found by the optional move matching (see match_moves.py)
+match_descriptions = {
+    'moved': 'Moved',
+    'reidentified': 'Re-identified',
+    'replaced': 'Replaced in place',
+}
+
+def describe_item(item):
+    return item.get('objectId') or item.get('id')
+
+def get_label_for_id(factsheet_id, labels):
+    return labels.get(factsheet_id, factsheet_id)  # Return the ID if no label is found
 
 def format_changes(changes):
     formatted_changes = []
@@ -52,126 +71,172 @@ def print_header(text):
     print(f"{text}")
     print("-" * len(text))
 
-def read_changes(json_file, original_xml='original.xml', changed_xml='changed.xml'):
-    # Parse XML files
-    original_tree = ET.parse(original_xml)
-    changed_tree = ET.parse(changed_xml)
-    original_root = original_tree.getroot()
-    changed_root = changed_tree.getroot()
+def read_changes(json_file, original='original.xml', changed='changed.xml'):
+    # NDJSON change sets are printed while they are read
+    if json_file.endswith(('.ndjson', '.jsonl')):
+        with span('report', ndjson=True):
+            print_change_records(read_change_records(json_file))
+        return
     
-    with open(json_file, 'r') as f:
-        changes = json.load(f)
+    with span('report.read'):
+        with open(json_file, 'r') as f:
+            changes = json.load(f)
     
-    # Process each change type if it has entries
-    for change_type, items in changes.items():
-        if items:  # Only process non-empty lists
-            if change_type == "addedFactSheets":
-                print_header("Added Fact Sheets")
-                for item in items:
-                    print(f"• {item['label']} ({item['factSheetType']})")
-            
-            elif change_type == "removedFactSheets":
-                print_header("Removed Fact Sheets")
-                for item in items:
-                    print(f"• {item['label']} ({item['factSheetType']})")
-            
-            elif change_type == "changedFactSheets":
-                print_header("Changed Fact Sheets")
-                for item in items:
-                    print(f"• {item['label']} ({item['factSheetType']}) was modified:")
-                    if 'changes' in item:
-                        for field, value in format_changes(item['changes']):
-                            print_change(field, value)
-                    print()
-            
-            elif change_type == "addedRelations":
-                print_header("Added Relations")
-                for item in items:
-                    source_label = get_label_for_id(item['sourceFactSheetId'], original_root, changed_root)
-                    target_label = get_label_for_id(item['targetFactSheetId'], original_root, changed_root)
-                    print(f"• Added {item['dependencyRelation']} relation:")
-                    print(f"    from: '{source_label}'")
-                    print(f"    to:   '{target_label}'")
-                    print()
-            
-            elif change_type == "removedRelations":
-                print_header("Removed Relations")
-                for item in items:
-                    source_label = get_label_for_id(item['sourceFactSheetId'], original_root, changed_root)
-                    target_label = get_label_for_id(item['targetFactSheetId'], original_root, changed_root)
-                    print(f"• Removed {item['dependencyRelation']} relation:")
-                    print(f"    from: '{source_label}'")
-                    print(f"    to:   '{target_label}'")
-                    print()
-
-            elif change_type == "changedRelations":
-                print_header("Changed Relations")
-                for item in items:
-                    source_label = get_label_for_id(item['sourceFactSheetId'], original_root, changed_root)
-                    target_label = get_label_for_id(item['targetFactSheetId'], original_root, changed_root)
-                    print(f"• Modified {item['dependencyRelation']} relation:")
-                    print(f"    from: '{source_label}'")
-                    print(f"    to:   '{target_label}'")
-                    if 'changes' in item:
-                        for field, value in format_changes(item['changes']):
-                            print_change(field, value)
-                    print()
-            
-            elif change_type == "addedObjects":
-                print_header("Added Objects")
-                for item in items:
-                    print(f"• {item['label']}")
-            
-            elif change_type == "removedObjects":
-                print_header("Removed Objects")
-                for item in items:
-                    print(f"• {item['label']}")
-
-            elif change_type == "changedObjects":
-                print_header("Changed Objects")
-                for item in items:
-                    print(f"• {item['label']} was modified:")
-                    if 'changes' in item:
-                        for field, value in format_changes(item['changes']):
-                            print_change(field, value)
-                    print()
-            
-            elif change_type == "addedCells":
-                print_header("Added Cells")
-                for item in items:
-                    if 'value' in item:
-                        print(f"• Added cell with value: '{item['value']}'")
-                    else:
-                        print(f"• Added new connection or shape")
-
-            elif change_type == "removedCells":
-                print_header("Removed Cells")
-                for item in items:
-                    if 'value' in item:
-                        print(f"• Removed cell with value: '{item['value']}'")
-                    else:
-                        print(f"• Removed connection or shape")
-
-            elif change_type == "changedCells":
-                print_header("Changed Cells")
-                for item in items:
-                    cell_desc = "Cell"
-                    if 'value' in item:
-                        cell_desc += f" with value: '{item['value']}'"
-                    print(f"• {cell_desc} was modified:")
-                    if 'changes' in item:
-                        for field, value in format_changes(item['changes']):
-                            print_change(field, value)
-                    print()
+    print_report(changes, original, changed)
+
+def print_report(changes, original=None, changed=None):
+    # Relation labels come with the change set; older change sets need the diagrams to look them up.
+    # Diagrams can be passed as DiagramIndex instances or XML file paths
+    with span('report'):
+        labels = changes.get('factSheetLabels')
+        if labels is None:
+            labels = build_label_index(load_index(original), load_index(changed)) if original and changed else {}
+        
+        # Process each change type if it has entries
+        for change_type, items in changes.items():
+            if items:  # Only process non-empty lists
+                print_items(change_type, items, labels)
+
+def print_change_records(records):
+    """Print the changelog of change records (see detect_changes.iter_changes) while they are consumed."""
+    labels = {}
+    
+    def without_labels():
+        # Label records come before the relations that need them
+        for record in records:
+            if record['kind'] == 'label':
+                labels[record['item']['factSheetId']] = record['item']['label']
+            else:
+                yield record
+    
+    for change_type, group in groupby(without_labels(), key=lambda record: record['category']):
+        print_items(change_type, (record['item'] for record in group), labels)
+
+def print_items(change_type, items, labels):
+    if change_type == "addedFactSheets":
+        print_header("Added Fact Sheets")
+        for item in items:
+            print(f"• {item['label']} ({item['factSheetType']})")
+    
+    elif change_type == "removedFactSheets":
+        print_header("Removed Fact Sheets")
+        for item in items:
+            print(f"• {item['label']} ({item['factSheetType']})")
+    
+    elif change_type == "changedFactSheets":
+        print_header("Changed Fact Sheets")
+        for item in items:
+            print(f"• {item['label']} ({item['factSheetType']}) was modified:")
+            if 'changes' in item:
+                for field, value in format_changes(item['changes']):
+                    print_change(field, value)
+            print()
+    
+    elif change_type == "addedRelations":
+        print_header("Added Relations")
+        for item in items:
+            source_label = get_label_for_id(item['sourceFactSheetId'], labels)
+            target_label = get_label_for_id(item['targetFactSheetId'], labels)
+            print(f"• Added {item['dependencyRelation']} relation:")
+            print(f"    from: '{source_label}'")
+            print(f"    to:   '{target_label}'")
+            print()
+    
+    elif change_type == "removedRelations":
+        print_header("Removed Relations")
+        for item in items:
+            source_label = get_label_for_id(item['sourceFactSheetId'], labels)
+            target_label = get_label_for_id(item['targetFactSheetId'], labels)
+            print(f"• Removed {item['dependencyRelation']} relation:")
+            print(f"    from: '{source_label}'")
+            print(f"    to:   '{target_label}'")
+            print()
+
+    elif change_type == "changedRelations":
+        print_header("Changed Relations")
+        for item in items:
+            source_label = get_label_for_id(item['sourceFactSheetId'], labels)
+            target_label = get_label_for_id(item['targetFactSheetId'], labels)
+            print(f"• Modified {item['dependencyRelation']} relation:")
+            print(f"    from: '{source_label}'")
+            print(f"    to:   '{target_label}'")
+            if 'changes' in item:
+                for field, value in format_changes(item['changes']):
+                    print_change(field, value)
+            print()
+    
+    elif change_type == "addedObjects":
+        print_header("Added Objects")
+        for item in items:
+            print(f"• {item['label']}")
+    
+    elif change_type == "removedObjects":
+        print_header("Removed Objects")
+        for item in items:
+            print(f"• {item['label']}")
+
+    elif change_type == "changedObjects":
+        print_header("Changed Objects")
+        for item in items:
+            print(f"• {item['label']} was modified:")
+            if 'changes' in item:
+                for field, value in format_changes(item['changes']):
+                    print_change(field, value)
+            print()
+    
+    elif change_type == "addedCells":
+        print_header("Added Cells")
+        for item in items:
+            if 'value' in item:
+                print(f"• Added cell with value: '{item['value']}'")
+            else:
+                print(f"• Added new connection or shape")
+
+    elif change_type == "removedCells":
+        print_header("Removed Cells")
+        for item in items:
+            if 'value' in item:
+                print(f"• Removed cell with value: '{item['value']}'")
+            else:
+                print(f"• Removed connection or shape")
+
+    elif change_type == "changedCells":
+        print_header("Changed Cells")
+        for item in items:
+            cell_desc = "Cell"
+            if 'value' in item:
+                cell_desc += f" with value: '{item['value']}'"
+            print(f"• {cell_desc} was modified:")
+            if 'changes' in item:
+                for field, value in format_changes(item['changes']):
+                    print_change(field, value)
+            print()
+
+    elif change_type == "matchedChanges":
+        print_header("Moved, Re-identified and Replaced Elements")
+        for item in items:
+            removed_label = item['removed'].get('label') or item['removed'].get('value') or describe_item(item['removed'])
+            added_label = item['added'].get('label') or item['added'].get('value') or describe_item(item['added'])
+            print(f"• {match_descriptions[item['match']]} (score {item['score']}):")
+            print(f"    from: '{removed_label}'")
+            print(f"    to:   '{added_label}'")
+            print()
 
 if __name__ == "__main__":
     # Get the directory containing the files
     input_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files/input')
     changes_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files')
     
-    # Read changes with proper file paths
-    read_changes(
-        os.path.join(changes_dir, 'diagram_changes.json'),
-        os.path.join(input_dir, 'original.xml'),
-        os.path.join(input_dir, 'changed.xml')
-    )
+    parser = argparse.ArgumentParser(description='Print detected diagram changes as a changelog')
+    parser.add_argument('changes', nargs='?', default=os.path.join(changes_dir, 'diagram_changes.json'),
+                        help='Change set as JSON or NDJSON (default: files/diagram_changes.json)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    
+    # Read changes with proper file paths; the diagrams are only parsed for change sets without labels
+    with instrument_from_args(args):
+        read_changes(
+            args.changes,
+            os.path.join(input_dir, 'original.xml'),
+            os.path.join(input_dir, 'changed.xml')
+        )
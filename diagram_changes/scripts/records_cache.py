@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from diagram_records import DiagramRecords
+
+# Bump whenever the pickled record layout changes so stale entries are never loaded
+CACHE_VERSION = 2
+
+default_cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files/cache/records')
+
+class RecordsCache:
+    """
+    On-disk cache of extracted DiagramRecords, keyed by the SHA-256 of the XML bytes.
+    
+    Entries are evicted least recently used first once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=512 * 1024 * 1024, streaming=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.streaming = streaming
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.v{CACHE_VERSION}.pickle')
+
+    @staticmethod
+    def key_for_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def load(self, path):
+        """Return the records of an XML file, extracting and storing them on a cache miss."""
+        with open(path, 'rb') as f:
+            return self.load_bytes(f.read())
+
+    def load_bytes(self, data):
+        """Return the records of XML bytes, extracting and storing them on a cache miss."""
+        key = self.key_for_bytes(data)
+        records = self._read(key)
+        if records is not None:
+            self.hits += 1
+            return records
+        
+        self.misses += 1
+        records = DiagramRecords.from_bytes(data, streaming=self.streaming)
+        self._write(key, records)
+        return records
+
+    def _read(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                records = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Corrupt or incompatible entry, drop it and re-extract
+            self._remove(entry_path)
+            return None
+        
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return records
+
+    def _write(self, key, records):
+        # Write to a temporary file first so concurrent readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def _entries(self):
+        """Cache entries as (last use, size, path)."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.pickle') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(entry_path)
+            total -= size
+            self.evictions += 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, path):
+        """Remove the cached records of an XML file."""
+        with open(path, 'rb') as f:
+            key = self.key_for_bytes(f.read())
+        self._remove(self._entry_path(key))
+
+    def clear(self):
+        """Remove all cached records."""
+        for _, _, entry_path in self._entries():
+            self._remove(entry_path)
+
+    def stats(self):
+        """Hit/miss/eviction counters and the current size of the cache."""
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
@@ -1,10 +1,24 @@
 import argparse
+import hashlib
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import add_metrics_arguments, instrument_from_args, peak_rss, span
 
 def ensure_drawio_installed():
     """Check if draw.io desktop is installed and accessible."""
+    # An explicit executable (e.g. a local stand-in for testing) takes precedence
+    override = os.environ.get('DRAWIO_EXECUTABLE')
+    if override:
+        if os.path.exists(override):
+            return override
+        raise RuntimeError(f"DRAWIO_EXECUTABLE does not exist: {override}")
+    
     # Common paths for draw.io installation
     drawio_paths = {
         'darwin': ['/Applications/draw.io.app/Contents/MacOS/draw.io'],
@@ -22,7 +36,92 @@ def ensure_drawio_installed():
             
     raise RuntimeError("draw.io is not installed. Please install it from https://www.drawio.com/")
 
-def render_diagram(input_xml_path, output_path, format='png'):
+default_cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files/cache/renders')
+
+def renderer_version(executable):
+    """
+    Identify a renderer build without starting it (draw.io's --version launches Electron).
+    
+    Path, size and modification time of the executable change whenever it is upgraded.
+    """
+    path = os.path.realpath(executable)
+    stat = os.stat(path)
+    return f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+
+class RenderCache:
+    """
+    Rendered images on disk, keyed by the hash of (XML bytes, format, renderer version).
+    
+    Entries are evicted least recently used first once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(input_xml_path, format, version):
+        digest = hashlib.sha256()
+        with open(input_xml_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0' + format.encode() + b'\0' + version.encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key, format):
+        return os.path.join(self.cache_dir, f'{key}.{format}')
+
+    def fetch(self, key, format, output_path):
+        """Copy a cached render to output_path; returns False on a miss."""
+        entry_path = self._entry_path(key, format)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            shutil.copyfile(entry_path, output_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        # Mark as recently used for LRU eviction
+        os.utime(entry_path)
+        self.hits += 1
+        return True
+
+    def store(self, key, format, rendered_path):
+        """Add a freshly rendered file to the cache."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(rendered_path, tmp_path)
+        os.replace(tmp_path, self._entry_path(key, format))
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.tmp') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(entry_path)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all cached renders."""
+        for _, _, entry_path in self._entries():
+            os.remove(entry_path)
+
+def render_diagram(input_xml_path, output_path, format='png', drawio_path=None, cache=None):
     """
     Render a draw.io XML diagram as an image.
     
@@ -30,13 +129,21 @@ def render_diagram(input_xml_path, output_path, format='png'):
         input_xml_path (str): Path to the input XML file
         output_path (str): Path where the output image should be saved
         format (str): Output format (png, jpg, pdf, svg)
+        drawio_path (str): draw.io executable to use instead of the detected installation
+        cache (RenderCache): Reuse a previous render of identical XML instead of running draw.io
     """
-    drawio_path = ensure_drawio_installed()
+    drawio_path = drawio_path or ensure_drawio_installed()
     
     # Ensure input file exists
     if not os.path.exists(input_xml_path):
         raise FileNotFoundError(f"Input file not found: {input_xml_path}")
     
+    if cache is not None:
+        key = cache.key(input_xml_path, format, renderer_version(drawio_path))
+        if cache.fetch(key, format, output_path):
+            print(f"Reused cached render for: {output_path}")
+            return
+    
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
     
@@ -50,21 +157,212 @@ def render_diagram(input_xml_path, output_path, format='png'):
     ]
     
     try:
-        subprocess.run(cmd, check=True, capture_output=True)
+        with span('render.subprocess', format=format, jobs=1) as timing:
+            subprocess.run(cmd, check=True, capture_output=True)
+            timing.set(peak_child_rss_bytes=peak_rss(children=True))
         print(f"Successfully rendered diagram to: {output_path}")
+        if cache is not None:
+            cache.store(key, format, output_path)
     except subprocess.CalledProcessError as e:
         print(f"Error rendering diagram: {e.stderr.decode()}")
         raise
 
+class RendererPool:
+    """
+    Renders batches of diagrams with a bounded number of concurrent draw.io exports.
+    
+    The draw.io desktop CLI has no server mode, so instead of one Electron start per diagram each
+    export process converts a whole directory of diagrams that share an output format. At most
+    max_workers export processes run at the same time, each handling up to batch_size diagrams.
+    The executable can be any program following the draw.io export CLI, e.g. a local stand-in.
+    With a RenderCache, jobs whose XML was rendered before are copied from the cache instead.
+    """
+
+    def __init__(self, executable=None, max_workers=2, batch_size=16, cache=None):
+        self.executable = executable or ensure_drawio_installed()
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.cache = cache
+        self._version = renderer_version(self.executable) if cache is not None else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def render(self, jobs):
+        """
+        Render (input_xml_path, output_path, format) jobs and return one result per job, in order.
+        
+        Each result has the job's input, output and format, whether it succeeded ('ok'), the wall
+        time of its export process ('batch_seconds') and that time divided over the jobs of the
+        batch ('seconds'), and whether it came from the cache ('cached'). Failures are reported in
+        'error' instead of raised.
+        """
+        jobs = [tuple(job) if len(job) == 3 else (job[0], job[1], 'png') for job in jobs]
+        results = [None] * len(jobs)
+        
+        # Serve cache hits without starting draw.io
+        keys = {}
+        if self.cache is not None:
+            for position, (input_xml_path, output_path, format) in enumerate(jobs):
+                if not os.path.exists(input_xml_path):
+                    continue
+                start = time.perf_counter()
+                key = self.cache.key(input_xml_path, format, self._version)
+                if self.cache.fetch(key, format, output_path):
+                    seconds = time.perf_counter() - start
+                    results[position] = {
+                        'input': input_xml_path,
+                        'output': output_path,
+                        'format': format,
+                        'ok': True,
+                        'cached': True,
+                        'seconds': seconds,
+                        'batch_seconds': seconds,
+                    }
+                else:
+                    keys[position] = key
+        
+        # Group the remaining jobs by format, then split into batches handled by one export process each
+        by_format = {}
+        for position, job in enumerate(jobs):
+            if results[position] is None:
+                by_format.setdefault(job[2], []).append((position, job))
+        batches = []
+        for format_jobs in by_format.values():
+            for start in range(0, len(format_jobs), self.batch_size):
+                batches.append(format_jobs[start:start + self.batch_size])
+        
+        for batch_results in self._executor.map(self._render_batch, batches):
+            for position, result in batch_results:
+                if result['ok'] and position in keys:
+                    self.cache.store(keys[position], result['format'], result['output'])
+                results[position] = result
+        return results
+
+    def _render_batch(self, batch):
+        format = batch[0][1][2]
+        start = time.perf_counter()
+        errors = {}
+        with tempfile.TemporaryDirectory(prefix='render_') as work_dir:
+            input_dir = os.path.join(work_dir, 'in')
+            output_dir = os.path.join(work_dir, 'out')
+            os.makedirs(input_dir)
+            os.makedirs(output_dir)
+            
+            # Stage inputs under unique names so outputs can be mapped back to their jobs
+            for position, (input_xml_path, _, _) in batch:
+                if not os.path.exists(input_xml_path):
+                    errors[position] = f"Input file not found: {input_xml_path}"
+                    continue
+                shutil.copyfile(input_xml_path, os.path.join(input_dir, f'job{position}.xml'))
+            
+            process_error = None
+            if len(errors) < len(batch):
+                cmd = [
+                    self.executable,
+                    '--export',
+                    '--format', format,
+                    '--output', output_dir,
+                    input_dir
+                ]
+                try:
+                    with span('render.subprocess', format=format, jobs=len(batch) - len(errors)) as timing:
+                        subprocess.run(cmd, check=True, capture_output=True)
+                        timing.set(peak_child_rss_bytes=peak_rss(children=True))
+                except subprocess.CalledProcessError as e:
+                    process_error = f"Error rendering diagrams: {e.stderr.decode(errors='replace')}"
+                except OSError as e:
+                    process_error = f"Error starting renderer: {e}"
+            
+            # Move rendered files to their requested output paths
+            for position, (_, output_path, _) in batch:
+                if position in errors:
+                    continue
+                rendered = os.path.join(output_dir, f'job{position}.{format}')
+                if os.path.exists(rendered):
+                    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                    shutil.move(rendered, output_path)
+                else:
+                    errors[position] = process_error or f"Renderer produced no output for job {position}"
+        
+        batch_seconds = time.perf_counter() - start
+        results = []
+        for position, (input_xml_path, output_path, _) in batch:
+            result = {
+                'input': input_xml_path,
+                'output': output_path,
+                'format': format,
+                'ok': position not in errors,
+                'cached': False,
+                'seconds': batch_seconds / len(batch),
+                'batch_seconds': batch_seconds,
+            }
+            if position in errors:
+                result['error'] = errors[position]
+            results.append((position, result))
+        return results
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def render_diagrams(jobs, format='png', drawio_path=None, max_workers=2, batch_size=16, cache=None):
+    """Render several (input, output[, format]) jobs through a RendererPool and return its results."""
+    jobs = [job if len(job) == 3 else (job[0], job[1], format) for job in jobs]
+    with RendererPool(drawio_path, max_workers=max_workers, batch_size=batch_size, cache=cache) as pool:
+        return pool.render(jobs)
+
 def main():
     parser = argparse.ArgumentParser(description='Render draw.io XML diagram as image')
-    parser.add_argument('input', help='Input XML file path')
-    parser.add_argument('output', help='Output image file path')
+    parser.add_argument('files', nargs='+', metavar='INPUT OUTPUT',
+                        help='Input XML file path followed by output image file path; repeat to render several diagrams')
     parser.add_argument('--format', choices=['png', 'jpg', 'pdf', 'svg'], 
                       default='png', help='Output format (default: png)')
+    parser.add_argument('--drawio', help='draw.io executable to use (default: detected installation or $DRAWIO_EXECUTABLE)')
+    parser.add_argument('--workers', type=int, default=2, help='Maximum concurrent export processes (default: 2)')
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help='Directory of the render cache (default: files/cache/renders)')
+    parser.add_argument('--no-cache', action='store_true', help='Always run draw.io, even for unchanged diagrams')
+    parser.add_argument('--native', action='store_true',
+                        help='Render SVG with the built-in renderer instead of draw.io (implies --format svg)')
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
-    render_diagram(args.input, args.output, args.format)
+    if len(args.files) % 2:
+        parser.error('expected pairs of INPUT OUTPUT paths')
+    pairs = list(zip(args.files[::2], args.files[1::2]))
+    with instrument_from_args(args):
+        render_pairs(args, pairs)
+
+def render_pairs(args, pairs):
+    """Render INPUT OUTPUT pairs as selected by the command line arguments."""
+    if args.native:
+        # Imported here so rendering through draw.io does not depend on the diagram modules
+        from svg_renderer import render_svg
+        for input_xml_path, output_path in pairs:
+            render_svg(input_xml_path, output_path)
+            print(f"Successfully rendered diagram to: {output_path}")
+        return
+    cache = None if args.no_cache else RenderCache(args.cache_dir)
+    
+    if len(pairs) == 1:
+        render_diagram(pairs[0][0], pairs[0][1], args.format, drawio_path=args.drawio, cache=cache)
+        return
+    
+    failed = False
+    for result in render_diagrams(pairs, args.format, drawio_path=args.drawio, max_workers=args.workers, cache=cache):
+        if result['ok'] and result['cached']:
+            print(f"Reused cached render for: {result['output']}")
+        elif result['ok']:
+            print(f"Successfully rendered diagram to: {result['output']} ({result['seconds']:.2f}s)")
+        else:
+            print(f"Error rendering {result['input']}: {result['error']}")
+            failed = True
+    if failed:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,321 @@
+import argparse
+import html
+import os
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+from diagram_index import load_index
+from diagram_style import parse_style
+from instrumentation import span
+
+# Fill colors of the LeanIX fact sheet styles (leanix_fs_<type>)
+fact_sheet_fills = {
+    'Application': '#0F7EB5',
+    'BusinessCapability': '#003399',
+    'BusinessContext': '#FE6690',
+    'DataObject': '#774FCC',
+    'Interface': '#02AFA4',
+    'ITComponent': '#D29270',
+    'Organization': '#2889FF',
+    'Platform': '#28B7C2',
+    'Process': '#4B8C2F',
+    'Project': '#FA9C2D',
+    'Provider': '#FF6E2E',
+    'TechnicalStack': '#A6566D',
+    'UserGroup': '#FFA31F',
+}
+
+default_vertex_style = {'fillColor': '#FFFFFF', 'strokeColor': '#4A4A4A', 'fontColor': '#000000'}
+default_edge_style = {'strokeColor': '#4A4A4A'}
+
+tag_pattern = re.compile(r'<[^>]+>')
+line_break_pattern = re.compile(r'<br\s*/?>|<div>|</div>|\n', re.IGNORECASE)
+
+def split_style(style):
+    """Split a draw.io style string into named styles and key=value properties."""
+    names = []
+    properties = {}
+    for key, value in parse_style(style).items():
+        if value is None:
+            names.append(key)
+        else:
+            properties[key] = value
+    return names, properties
+
+def resolve_style(style, is_edge):
+    """Effective style properties, with defaults for the named LeanIX styles."""
+    names, properties = split_style(style)
+    resolved = dict(default_edge_style if is_edge else default_vertex_style)
+    for name in names:
+        if name.startswith('leanix_fs_'):
+            resolved['fillColor'] = fact_sheet_fills.get(name[len('leanix_fs_'):], '#6E6E6E')
+            resolved['strokeColor'] = resolved['fillColor']
+            resolved['fontColor'] = '#FFFFFF'
+            resolved['rounded'] = '1'
+        elif name == 'ellipse':
+            resolved['shape'] = 'ellipse'
+        elif name == 'edgeLabel':
+            resolved['fillColor'] = '#FFFFFF'
+            resolved['strokeColor'] = 'none'
+            resolved['edgeLabel'] = '1'
+    resolved.update(properties)
+    return resolved
+
+def label_lines(label, is_html):
+    """Plain text lines of a (possibly HTML) draw.io label."""
+    if not label:
+        return []
+    if is_html:
+        label = tag_pattern.sub('', line_break_pattern.sub('\n', label))
+        label = html.unescape(label)
+    return [line for line in label.split('\n') if line.strip()]
+
+def to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+class Shape:
+    """A cell to draw: its mxCell, label and resolved style."""
+    __slots__ = ('id', 'mxcell', 'label', 'style', 'is_edge', 'box')
+
+    def __init__(self, shape_id, mxcell, label):
+        self.id = shape_id
+        self.mxcell = mxcell
+        self.label = label
+        self.is_edge = mxcell.get('edge') == '1'
+        self.style = resolve_style(mxcell.get('style'), self.is_edge)
+        self.box = None  # Absolute (x, y, width, height) of vertices
+
+def collect_shapes(index):
+    """Shapes in drawing order (document order of the cells under <root>)."""
+    shapes = []
+    container = index.layer_parent
+    if container is None:
+        return shapes
+    for elem in container:
+        if elem.tag == 'object':
+            mxcell = elem.find('mxCell')
+            if mxcell is not None:
+                shapes.append(Shape(elem.get('id'), mxcell, elem.get('label')))
+        elif elem.tag == 'mxCell':
+            if elem.get('vertex') == '1' or elem.get('edge') == '1':
+                shapes.append(Shape(elem.get('id'), elem, elem.get('value')))
+    return shapes
+
+def layout_vertices(shapes_by_id):
+    """Compute absolute boxes of vertices, offsetting children by their container's position."""
+    def absolute_box(shape, visiting):
+        if shape.box is not None:
+            return shape.box
+        geometry = shape.mxcell.find('mxGeometry')
+        if geometry is None or geometry.get('relative') == '1':
+            return None
+        x = to_float(geometry.get('x'))
+        y = to_float(geometry.get('y'))
+        parent = shapes_by_id.get(shape.mxcell.get('parent'))
+        if parent is not None and not parent.is_edge and parent.id not in visiting:
+            visiting.add(shape.id)
+            parent_box = absolute_box(parent, visiting)
+            if parent_box is not None:
+                x += parent_box[0]
+                y += parent_box[1]
+        shape.box = (x, y, to_float(geometry.get('width')), to_float(geometry.get('height')))
+        return shape.box
+
+    for shape in shapes_by_id.values():
+        if not shape.is_edge:
+            absolute_box(shape, set())
+
+def clip_to_box(inside, outside, box):
+    """Point where the segment from the center of a box towards another point leaves the box."""
+    x, y, width, height = box
+    dx = outside[0] - inside[0]
+    dy = outside[1] - inside[1]
+    if (dx == 0 and dy == 0) or width == 0 or height == 0:
+        return inside
+    scale = min(abs(width / 2 / dx) if dx else float('inf'), abs(height / 2 / dy) if dy else float('inf'))
+    return (inside[0] + dx * scale, inside[1] + dy * scale)
+
+def edge_points(shape, shapes_by_id):
+    """Polyline of an edge: terminal points plus waypoints."""
+    geometry = shape.mxcell.find('mxGeometry')
+    waypoints = []
+    fixed_points = {}
+    if geometry is not None:
+        for point in geometry.iter('mxPoint'):
+            role = point.get('as')
+            if role in ('sourcePoint', 'targetPoint'):
+                fixed_points[role] = (to_float(point.get('x')), to_float(point.get('y')))
+        points_array = geometry.find("Array[@as='points']")
+        if points_array is not None:
+            waypoints = [(to_float(p.get('x')), to_float(p.get('y'))) for p in points_array.findall('mxPoint')]
+
+    ends = []
+    for terminal, role, prefix in (('source', 'sourcePoint', 'exit'), ('target', 'targetPoint', 'entry')):
+        terminal_shape = shapes_by_id.get(shape.mxcell.get(terminal))
+        box = terminal_shape.box if terminal_shape is not None else None
+        if box is None:
+            ends.append((fixed_points.get(role), None, False))
+        elif f'{prefix}X' in shape.style and f'{prefix}Y' in shape.style:
+            # Fixed connection point on the terminal's border
+            point = (box[0] + to_float(shape.style[f'{prefix}X']) * box[2],
+                     box[1] + to_float(shape.style[f'{prefix}Y']) * box[3])
+            ends.append((point, box, True))
+        else:
+            ends.append(((box[0] + box[2] / 2, box[1] + box[3] / 2), box, False))
+
+    (source, source_box, source_fixed), (target, target_box, target_fixed) = ends
+    if source is None or target is None:
+        return None
+    points = [source] + waypoints + [target]
+    if source_box is not None and not source_fixed:
+        points[0] = clip_to_box(source, points[1], source_box)
+    if target_box is not None and not target_fixed:
+        points[-1] = clip_to_box(target, points[-2], target_box)
+    return points
+
+def point_along(points, fraction):
+    """Point at a fraction (0..1) of a polyline's length."""
+    lengths = [((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) ** 0.5 for a, b in zip(points, points[1:])]
+    remaining = sum(lengths) * min(max(fraction, 0.0), 1.0)
+    for (a, b), length in zip(zip(points, points[1:]), lengths):
+        if remaining <= length and length > 0:
+            t = remaining / length
+            return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+        remaining -= length
+    return points[-1]
+
+def stroke_attributes(style):
+    """SVG stroke attributes, including the dashed highlight strokes added by modify_style."""
+    stroke = style.get('strokeColor', 'none')
+    attributes = f' stroke={quoteattr(stroke)}'
+    if stroke != 'none':
+        attributes += f' stroke-width="{to_float(style.get("strokeWidth"), 1.0):g}"'
+        if style.get('dashed') == '1':
+            attributes += ' stroke-dasharray="6 4"'
+    return attributes
+
+def write_text(out, lines, center_x, center_y, style, border_color=None):
+    """Write centered label lines, with an optional border like draw.io's labelBorderColor."""
+    font_size = to_float(style.get('fontSize'), 12.0)
+    line_height = font_size * 1.2
+    top = center_y - line_height * (len(lines) - 1) / 2
+    if border_color:
+        width = max(len(line) for line in lines) * font_size * 0.6 + 6
+        height = line_height * len(lines) + 4
+        dashes = ' stroke-dasharray="6 4"' if style.get('dashed') == '1' else ''
+        out.write(f'<rect x="{center_x - width / 2:g}" y="{center_y - height / 2:g}" width="{width:g}" '
+                  f'height="{height:g}" fill="none" stroke={quoteattr(border_color)}{dashes}/>\n')
+    out.write(f'<text x="{center_x:g}" y="{top:g}" font-size="{font_size:g}" fill={quoteattr(style.get("fontColor", "#000000"))} '
+              f'text-anchor="middle" dominant-baseline="middle" font-family="Helvetica, Arial, sans-serif">')
+    for position, line in enumerate(lines):
+        dy = 0 if position == 0 else line_height
+        out.write(f'<tspan x="{center_x:g}" dy="{dy:g}">{escape(line)}</tspan>')
+    out.write('</text>\n')
+
+def render_svg(source, output_path, margin=20):
+    """
+    Render an mxGraphModel to SVG without draw.io.
+
+    Draws vertices from their mxGeometry, edges from source/target (with waypoints and fixed
+    connection points), labels, and the dashed colored strokes of highlighted cells. The SVG is
+    written element by element as the cells are visited.
+    """
+    with span('render.native'):
+        draw_svg(source, output_path, margin)
+
+def draw_svg(source, output_path, margin):
+    index = load_index(source)
+    shapes = collect_shapes(index)
+    shapes_by_id = {shape.id: shape for shape in shapes}
+    layout_vertices(shapes_by_id)
+
+    # Edge geometry is needed up front for the bounds and for edge labels
+    edge_paths = {shape.id: edge_points(shape, shapes_by_id) for shape in shapes if shape.is_edge}
+
+    xs = []
+    ys = []
+    for shape in shapes:
+        if shape.box is not None:
+            xs.extend((shape.box[0], shape.box[0] + shape.box[2]))
+            ys.extend((shape.box[1], shape.box[1] + shape.box[3]))
+    for points in edge_paths.values():
+        for x, y in points or ():
+            xs.append(x)
+            ys.append(y)
+    if not xs:
+        xs, ys = [0.0], [0.0]
+    min_x, min_y = min(xs) - margin, min(ys) - margin
+    width, height = max(xs) - min(xs) + 2 * margin, max(ys) - min(ys) + 2 * margin
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}" height="{height:g}" '
+                  f'viewBox="{min_x:g} {min_y:g} {width:g} {height:g}">\n')
+        out.write('<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" '
+                  'markerHeight="8" orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" '
+                  'fill="context-stroke"/></marker></defs>\n')
+        out.write(f'<rect x="{min_x:g}" y="{min_y:g}" width="{width:g}" height="{height:g}" fill="#FFFFFF"/>\n')
+
+        for shape in shapes:
+            style = shape.style
+            is_html = style.get('html') == '1'
+            if shape.is_edge:
+                points = edge_paths.get(shape.id)
+                if not points:
+                    continue
+                path = ' '.join(f'{x:g},{y:g}' for x, y in points)
+                marker = '' if style.get('endArrow') == 'none' else ' marker-end="url(#arrow)"'
+                out.write(f'<polyline points="{path}" fill="none"{stroke_attributes(style)}{marker}/>\n')
+                lines = label_lines(shape.label, is_html)
+                if lines:
+                    center = point_along(points, 0.5)
+                    write_text(out, lines, center[0], center[1], style, style.get('labelBorderColor'))
+                continue
+
+            parent = shapes_by_id.get(shape.mxcell.get('parent'))
+            if shape.box is None and parent is not None and parent.is_edge:
+                # Edge label: relative x runs from -1 (source) to 1 (target), plus an offset
+                points = edge_paths.get(parent.id)
+                lines = label_lines(shape.label, is_html)
+                if not points or not lines:
+                    continue
+                geometry = shape.mxcell.find('mxGeometry')
+                center = point_along(points, (to_float(geometry.get('x')) + 1) / 2 if geometry is not None else 0.5)
+                offset = geometry.find("mxPoint[@as='offset']") if geometry is not None else None
+                if offset is not None:
+                    center = (center[0] + to_float(offset.get('x')), center[1] + to_float(offset.get('y')))
+                write_text(out, lines, center[0], center[1], style, style.get('labelBorderColor'))
+                continue
+
+            if shape.box is None:
+                continue
+            x, y, box_width, box_height = shape.box
+            fill = style.get('fillColor', 'none')
+            if style.get('shape') == 'ellipse':
+                out.write(f'<ellipse cx="{x + box_width / 2:g}" cy="{y + box_height / 2:g}" rx="{box_width / 2:g}" '
+                          f'ry="{box_height / 2:g}" fill={quoteattr(fill)}{stroke_attributes(style)}/>\n')
+            else:
+                radius = min(box_width, box_height) * 0.15 if style.get('rounded') == '1' else 0
+                out.write(f'<rect x="{x:g}" y="{y:g}" width="{box_width:g}" height="{box_height:g}" rx="{radius:g}" '
+                          f'fill={quoteattr(fill)}{stroke_attributes(style)}/>\n')
+            lines = label_lines(shape.label, is_html)
+            if lines:
+                write_text(out, lines, x + box_width / 2, y + box_height / 2, style, style.get('labelBorderColor'))
+
+        out.write('</svg>\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a draw.io XML diagram as SVG without draw.io')
+    parser.add_argument('input', help='Input XML file path')
+    parser.add_argument('output', help='Output SVG file path')
+    args = parser.parse_args()
+
+    render_svg(args.input, args.output)
+    print(f"Successfully rendered diagram to: {args.output}")
+
+if __name__ == '__main__':
+    main()
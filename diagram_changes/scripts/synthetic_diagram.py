@@ -0,0 +1,236 @@
+import argparse
+import os
+import random
+import uuid
+from xml.sax.saxutils import quoteattr
+
+# Fact sheet types used for generated fact sheets, with the relation types between them
+fact_sheet_types = ['Application', 'BusinessCapability', 'ITComponent', 'Interface', 'DataObject', 'Process']
+relation_types = ['RelToChild', 'RelBusinessCapabilityToApplication', 'RelApplicationToITComponent',
+                  'RelApplicationToDataObject']
+
+label_words = ['Customer', 'Order', 'Billing', 'Content', 'Creation', 'Video', 'Image', 'Training', 'Plan',
+               'Recruiting', 'Management', 'Portal', 'Analytics', 'Payroll', 'Identity', 'Search', 'Archive',
+               'Inventory', 'Shipping', 'Support', 'Hub', 'Gateway', 'Reporting', 'Planning', 'Service']
+
+edge_style = 'rounded=0;orthogonalLoop=1;jettySize=auto;html=1;'
+edge_label_style = 'edgeLabel;html=1;align=center;verticalAlign=middle;resizable=0;points=[];'
+
+# Share of each element kind in a generated diagram
+default_mix = {'factSheet': 0.4, 'relation': 0.35, 'generic': 0.05, 'edge': 0.1, 'edgeLabel': 0.1}
+
+class DiagramGenerator:
+    """
+    Generates LeanIX-style draw.io diagrams of a given size, and changed versions of them.
+
+    Elements are kept as plain dicts (one per object or standalone cell) and laid out on a grid, so
+    the same seed always gives the same diagram.
+    """
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.next_id = 2  # 0 and 1 are the default cells
+
+    def new_id(self):
+        self.next_id += 1
+        return str(self.next_id - 1)
+
+    def new_uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def label(self):
+        return ' '.join(self.rng.sample(label_words, self.rng.choice((1, 2, 2, 3))))
+
+    def fact_sheet(self, position):
+        column, row = position % 100, position // 100
+        fact_sheet_type = self.rng.choice(fact_sheet_types)
+        return {'kind': 'factSheet', 'id': self.new_id(), 'label': self.label(), 'type': fact_sheet_type,
+                'factSheetId': self.new_uuid(), 'style': f'leanix_fs_{fact_sheet_type}',
+                'x': column * 140, 'y': row * 90, 'width': 120, 'height': 45}
+
+    def generic(self, position):
+        column, row = position % 100, position // 100
+        return {'kind': 'generic', 'id': self.new_id(), 'label': self.label(), 'style': 'leanix_fs_Application',
+                'x': column * 140 + 20, 'y': row * 90 + 60, 'width': 80, 'height': 45}
+
+    def relation(self, source, target):
+        return {'kind': 'relation', 'id': self.new_id(), 'type': self.rng.choice(relation_types),
+                'relationId': self.new_uuid(), 'source': source, 'target': target}
+
+    def edge(self, source, target):
+        return {'kind': 'edge', 'id': self.new_id(), 'source': source['id'], 'target': target['id'],
+                'style': edge_style}
+
+    def edge_label(self, edge):
+        return {'kind': 'edgeLabel', 'id': self.new_id(), 'parent': edge['id'], 'value': self.label(),
+                'x': round(self.rng.uniform(-0.5, 0.5), 4), 'y': self.rng.randint(-3, 3)}
+
+    def generate(self, size, mix=None):
+        """A diagram with about `size` objects and standalone cells, as a list of element dicts."""
+        mix = mix or default_mix
+        counts = {kind: int(size * share) for kind, share in mix.items()}
+        counts['factSheet'] = max(counts['factSheet'], 2)
+
+        fact_sheets = [self.fact_sheet(position) for position in range(counts['factSheet'])]
+        elements = list(fact_sheets)
+        elements.extend(self.generic(position) for position in range(counts['generic']))
+        for _ in range(counts['relation']):
+            source, target = self.rng.sample(fact_sheets, 2)
+            elements.append(self.relation(source, target))
+        edges = []
+        for _ in range(counts['edge']):
+            source, target = self.rng.sample(fact_sheets, 2)
+            edges.append(self.edge(source, target))
+        elements.extend(edges)
+        if edges:
+            elements.extend(self.edge_label(self.rng.choice(edges)) for _ in range(counts['edgeLabel']))
+        self.rng.shuffle(elements)
+        return elements
+
+    def change(self, elements, added_ratio=0.05, removed_ratio=0.05, changed_ratio=0.05):
+        """
+        A changed copy of a diagram: a share of the elements is removed, modified (label, position
+        or style) or added. Added relations and edges connect existing fact sheets.
+        """
+        count = len(elements)
+        indexes = list(range(count))
+        self.rng.shuffle(indexes)
+        removed = set(indexes[:int(count * removed_ratio)])
+        modified = set(indexes[len(removed):len(removed) + int(count * changed_ratio)])
+
+        changed = []
+        for index, element in enumerate(elements):
+            if index in removed:
+                continue
+            element = dict(element)
+            if index in modified:
+                self.modify(element)
+            changed.append(element)
+
+        fact_sheets = [element for element in changed if element['kind'] == 'factSheet']
+        position = len(fact_sheets) + 100
+        for _ in range(int(count * added_ratio)):
+            kind = self.rng.choice(('factSheet', 'factSheet', 'relation', 'generic', 'edge'))
+            if kind == 'factSheet' or len(fact_sheets) < 2:
+                element = self.fact_sheet(position)
+                fact_sheets.append(element)
+                position += 1
+            elif kind == 'generic':
+                element = self.generic(position)
+                position += 1
+            elif kind == 'relation':
+                element = self.relation(*self.rng.sample(fact_sheets, 2))
+            else:
+                element = self.edge(*self.rng.sample(fact_sheets, 2))
+            changed.append(element)
+        return changed
+
+    def modify(self, element):
+        kind = element['kind']
+        if kind in ('factSheet', 'generic'):
+            change = self.rng.choice(('label', 'move', 'style'))
+            if change == 'label':
+                element['label'] = self.label()
+            elif change == 'move':
+                element['x'] += self.rng.choice((-20, 10, 30))
+                element['y'] += self.rng.choice((-10, 10, 20))
+            else:
+                element['style'] += ';fillColor=#FFE599'
+        elif kind == 'relation':
+            element['type'] = self.rng.choice(relation_types)
+        elif kind == 'edge':
+            element['style'] = edge_style + 'dashed=1;'
+        else:
+            element['value'] = self.label()
+
+def element_xml(element):
+    """XML lines of one element, indented like draw.io exports."""
+    kind = element['kind']
+    if kind in ('factSheet', 'generic'):
+        if kind == 'factSheet':
+            attributes = (f'type="factSheet" label={quoteattr(element["label"])} '
+                          f'factSheetType="{element["type"]}" factSheetId="{element["factSheetId"]}"')
+        else:
+            attributes = f'label={quoteattr(element["label"])}'
+        return [
+            f'    <object {attributes} id="{element["id"]}">',
+            f'      <mxCell style={quoteattr(element["style"])} parent="1" vertex="1">',
+            f'        <mxGeometry x="{element["x"]}" y="{element["y"]}" width="{element["width"]}" '
+            f'height="{element["height"]}" as="geometry" />',
+            '      </mxCell>',
+            '    </object>',
+        ]
+    if kind == 'relation':
+        source, target = element['source'], element['target']
+        return [
+            f'    <object type="relation" dependencyRelation="{element["type"]}" relationId="{element["relationId"]}" '
+            f'sourceFactSheetId="{source["factSheetId"]}" targetFactSheetId="{target["factSheetId"]}" '
+            f'id="{element["id"]}">',
+            f'      <mxCell style="leanix_dependency" parent="1" source="{source["id"]}" '
+            f'target="{target["id"]}" edge="1">',
+            '        <mxGeometry relative="1" as="geometry" />',
+            '      </mxCell>',
+            '    </object>',
+        ]
+    if kind == 'edge':
+        return [
+            f'    <mxCell id="{element["id"]}" style={quoteattr(element["style"])} parent="1" '
+            f'source="{element["source"]}" target="{element["target"]}" edge="1">',
+            '      <mxGeometry relative="1" as="geometry" />',
+            '    </mxCell>',
+        ]
+    return [
+        f'    <mxCell id="{element["id"]}" value={quoteattr(element["value"])} style="{edge_label_style}" '
+        f'parent="{element["parent"]}" vertex="1" connectable="0">',
+        f'      <mxGeometry x="{element["x"]}" y="{element["y"]}" relative="1" as="geometry">',
+        '        <mxPoint as="offset" />',
+        '      </mxGeometry>',
+        '    </mxCell>',
+    ]
+
+def write_diagram(elements, path):
+    """Write elements as a LeanIX draw.io <mxGraphModel> file."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<mxGraphModel dx="1454" dy="1373" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" '
+                'arrows="1" fold="1" page="0" pageScale="1" pageWidth="850" pageHeight="1100" math="0" '
+                'shadow="0" lxXmlVersion="1">\n')
+        f.write('  <root>\n')
+        f.write('    <lx-settings mappingTemplate="leanix-default" id="0">\n')
+        f.write('      <mxCell />\n')
+        f.write('    </lx-settings>\n')
+        f.write('    <mxCell id="1" parent="0" />\n')
+        for element in elements:
+            f.write('\n'.join(element_xml(element)))
+            f.write('\n')
+        f.write('  </root>\n')
+        f.write('</mxGraphModel>\n')
+
+def generate_diagram_pair(size, original_path, changed_path, seed=0, added_ratio=0.05, removed_ratio=0.05,
+                          changed_ratio=0.05, mix=None):
+    """Write a synthetic original diagram of about `size` elements and a changed version of it."""
+    generator = DiagramGenerator(seed)
+    original = generator.generate(size, mix=mix)
+    changed = generator.change(original, added_ratio=added_ratio, removed_ratio=removed_ratio,
+                               changed_ratio=changed_ratio)
+    write_diagram(original, original_path)
+    write_diagram(changed, changed_path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic LeanIX draw.io diagram and a changed version of it')
+    parser.add_argument('size', type=int, help='Number of objects and standalone cells in the original diagram')
+    parser.add_argument('--output-dir', default='.', help='Directory for original.xml and changed.xml (default: .)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--added', type=float, default=0.05, help='Share of elements added (default: 0.05)')
+    parser.add_argument('--removed', type=float, default=0.05, help='Share of elements removed (default: 0.05)')
+    parser.add_argument('--changed', type=float, default=0.05, help='Share of elements modified (default: 0.05)')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    original_path = os.path.join(args.output_dir, 'original.xml')
+    changed_path = os.path.join(args.output_dir, 'changed.xml')
+    generate_diagram_pair(args.size, original_path, changed_path, seed=args.seed, added_ratio=args.added,
+                          removed_ratio=args.removed, changed_ratio=args.changed)
+    print(f"Wrote {original_path} and {changed_path}")
+
+if __name__ == '__main__':
+    main()
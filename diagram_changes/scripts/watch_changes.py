@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+
+from detect_changes import change_categories, change_kind, compare_diagrams
+from diagram_index import DiagramIndex
+from diagram_records import DiagramRecords, content_digest
+from generate_new_diagrams import ChangeIndex, collect_overrides, diagram_file_names, write_generated
+from print_changes import print_report
+
+files_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+
+class WatchedDiagram:
+    """A diagram file kept parsed in memory, reloaded only when its content changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = None
+        self.content_hash = None
+        self.index = None
+        self.records = None
+
+    def poll(self):
+        """
+        Reload the diagram if the file was saved with different content.
+
+        A cheap stat check comes first, so unchanged files are not read. If the new content does not
+        parse (e.g. while it is being written), the previous version stays loaded and ET.ParseError
+        is raised; the file is read again on its next save.
+        """
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self.stat:
+            return
+        self.stat = signature
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        content_hash = content_digest(data)
+        if content_hash == self.content_hash:
+            return
+
+        index = DiagramIndex.from_string(data)
+        self.index = index
+        self.records = DiagramRecords.from_index(index)
+        self.content_hash = content_hash
+
+class WatchSession:
+    """
+    Re-diffs two diagrams whenever one of them is saved.
+
+    The unchanged side stays parsed, so a save of changed.xml only parses and extracts changed.xml.
+    Only the outputs a save can affect are regenerated: the additions and combined diagrams are
+    based on changed.xml, and the removals diagram is only rewritten if the original diagram or its
+    highlighting changed.
+    """
+
+    def __init__(self, original_xml, changed_xml, generated_dir=None, changes_json=None,
+                 rendered_dir=None, report=False):
+        self.original = WatchedDiagram(original_xml)
+        self.changed = WatchedDiagram(changed_xml)
+        self.generated_dir = generated_dir
+        self.changes_json = changes_json
+        self.rendered_dir = rendered_dir
+        self.report = report
+        self.changes = None
+        self._compared = (None, None)
+        self._removals_overrides = None
+
+    def update(self):
+        """
+        Run one cycle if a file changed since the last one.
+
+        Returns None if nothing changed, otherwise a summary with the changed files, the change
+        counts, the regenerated outputs and the time spent per step.
+        """
+        timings = {}
+        start = time.perf_counter()
+        self.original.poll()
+        self.changed.poll()
+        original_changed = self.original.content_hash != self._compared[0]
+        changed_changed = self.changed.content_hash != self._compared[1]
+        if not original_changed and not changed_changed:
+            return None
+        self._compared = (self.original.content_hash, self.changed.content_hash)
+        timings['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if original_changed:
+            # The removals diagram has to be rewritten for a new original tree
+            self._removals_overrides = None
+        self.changes = compare_diagrams(self.original.records, self.changed.records)
+        timings['detect'] = time.perf_counter() - start
+
+        if self.changes_json:
+            with open(self.changes_json, 'w', encoding='utf-8') as f:
+                json.dump(self.changes, f, indent=2)
+
+        regenerated = []
+        if self.generated_dir:
+            start = time.perf_counter()
+            regenerated = self.generate()
+            timings['generate'] = time.perf_counter() - start
+
+        if self.rendered_dir and regenerated:
+            start = time.perf_counter()
+            self.render(regenerated)
+            timings['render'] = time.perf_counter() - start
+
+        if self.report:
+            print_report(self.changes)
+
+        changed_files = [diagram.path for diagram, changed in ((self.original, original_changed),
+                                                               (self.changed, changed_changed)) if changed]
+        counts = {'added': 0, 'removed': 0, 'changed': 0}
+        for category in change_categories:
+            counts[change_kind(category)] += len(self.changes[category])
+        return {'files': changed_files, 'counts': counts,
+                'regenerated': regenerated, 'timings': timings}
+
+    def output_path(self, name):
+        return os.path.join(self.generated_dir, diagram_file_names[name])
+
+    def generate(self):
+        """Write the outputs affected by the last change and return their names."""
+        change_index = ChangeIndex(self.changes)
+        overrides, removed_objects = collect_overrides(self.original.index, self.changed.index, change_index,
+                                                       list(diagram_file_names))
+
+        # The removals diagram only depends on the original tree and on the styles its elements get
+        outputs = ['additions', 'combined']
+        if overrides['removals'] != self._removals_overrides:
+            outputs.insert(1, 'removals')
+            self._removals_overrides = overrides['removals']
+        os.makedirs(self.generated_dir, exist_ok=True)
+        write_generated(self.original.index, self.changed.index, overrides, removed_objects,
+                        {name: self.output_path(name) for name in outputs})
+        return outputs
+
+    def render(self, names):
+        # Imported here so watching without rendering does not load the renderer
+        from svg_renderer import render_svg
+        for name in names:
+            output_path = os.path.join(self.rendered_dir, os.path.splitext(diagram_file_names[name])[0] + '.svg')
+            render_svg(self.output_path(name), output_path)
+
+def print_summary(summary):
+    counts = summary['counts']
+    files = ', '.join(os.path.basename(path) for path in summary['files'])
+    total = sum(summary['timings'].values())
+    steps = ', '.join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in summary['timings'].items())
+    print(f"[{time.strftime('%H:%M:%S')}] {files} saved: {counts['added']} added, {counts['removed']} removed, "
+          f"{counts['changed']} changed", flush=True)
+    regenerated = ', '.join(summary['regenerated']) or 'nothing'
+    print(f"  regenerated {regenerated} in {total * 1000:.0f} ms ({steps})", flush=True)
+
+def watch(session, interval=0.5, once=False):
+    """Run a cycle now and then after every save, polling the files every `interval` seconds."""
+    while True:
+        try:
+            summary = session.update()
+        except ET.ParseError as e:
+            print(f"[{time.strftime('%H:%M:%S')}] Could not parse the saved diagram ({e}); "
+                  f"waiting for the next save", flush=True)
+            summary = None
+        except FileNotFoundError as e:
+            print(f"[{time.strftime('%H:%M:%S')}] {e}; waiting for the file to appear", flush=True)
+            summary = None
+        if summary is not None:
+            print_summary(summary)
+        if once:
+            return
+        time.sleep(interval)
+
+def main():
+    input_dir = os.path.join(files_dir, 'input')
+    parser = argparse.ArgumentParser(description='Re-detect changes and regenerate the highlighted diagrams on every save')
+    parser.add_argument('--original', default=os.path.join(input_dir, 'original.xml'),
+                        help='Original XML file (default: files/input/original.xml)')
+    parser.add_argument('--changed', default=os.path.join(input_dir, 'changed.xml'),
+                        help='Changed XML file (default: files/input/changed.xml)')
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between file checks (default: 0.5)')
+    parser.add_argument('--write-json', action='store_true',
+                        help='Write the detected changes to files/diagram_changes.json after every save')
+    parser.add_argument('--render', action='store_true',
+                        help='Render the regenerated diagrams to SVG with the built-in renderer')
+    parser.add_argument('--report', action='store_true', help='Print the changelog after every save')
+    parser.add_argument('--once', action='store_true', help='Run a single cycle and exit')
+    args = parser.parse_args()
+
+    session = WatchSession(
+        args.original, args.changed,
+        generated_dir=os.path.join(files_dir, 'generated_diagrams'),
+        changes_json=os.path.join(files_dir, 'diagram_changes.json') if args.write_json else None,
+        rendered_dir=os.path.join(files_dir, 'rendered_diagrams') if args.render else None,
+        report=args.report,
+    )
+    if not args.once:
+        print(f"Watching {args.original} and {args.changed} (Ctrl+C to stop)", flush=True)
+    try:
+        watch(session, interval=args.interval, once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
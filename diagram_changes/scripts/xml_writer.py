@@ -0,0 +1,104 @@
+import xml.etree.ElementTree as ET
+from contextlib import ExitStack
+
+# Escaping is the same as ElementTree.write's, so written documents are byte-identical to it
+def escape_cdata(text):
+    """Escape element text and tails."""
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+def escape_attribute(value):
+    """Escape an attribute value, including the line breaks and tabs that XML would normalize."""
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#09;')
+    return value
+
+def format_attributes(attrib):
+    return ''.join(f' {key}="{escape_attribute(value)}"' for key, value in attrib.items())
+
+def write_element(targets, elem):
+    """
+    Serialize an element the way ElementTree.write does, to several outputs in one walk.
+
+    Every target is a (write, overrides, appended) tuple: `overrides` maps elements to the attributes
+    to write instead of their own, and `appended` maps elements to extra children written after their
+    own, so several variants of a document are written without copying or modifying its tree.
+    """
+    tag = elem.tag
+    text = elem.text
+    if tag is ET.Comment or tag is ET.ProcessingInstruction:
+        markup = f'<!--{text}-->' if tag is ET.Comment else f'<?{text}?>'
+        for write, _, _ in targets:
+            write(markup)
+    else:
+        # Elements without overrides are formatted once for all targets
+        attributes = None
+        for write, overrides, _ in targets:
+            attrib = overrides.get(elem)
+            if attrib is None:
+                if attributes is None:
+                    attributes = format_attributes(elem.attrib)
+                write('<' + tag + attributes)
+            else:
+                write('<' + tag + format_attributes(attrib))
+
+        if text or len(elem):
+            for write, _, _ in targets:
+                write('>')
+                if text:
+                    write(escape_cdata(text))
+            for child in elem:
+                write_element(targets, child)
+            for target in targets:
+                for child in target[2].get(elem, ()):
+                    write_element([target], child)
+                target[0]('</' + tag + '>')
+        else:
+            for target in targets:
+                extra = target[2].get(elem)
+                if extra:
+                    target[0]('>')
+                    for child in extra:
+                        write_element([target], child)
+                    target[0]('</' + tag + '>')
+                else:
+                    target[0](' />')
+    if elem.tail:
+        tail = escape_cdata(elem.tail)
+        for write, _, _ in targets:
+            write(tail)
+
+def write_documents(root, documents):
+    """
+    Write variants of one tree like ElementTree.write(encoding='utf-8', xml_declaration=True).
+
+    `documents` is a list of (output path, overrides, appended) tuples; the tree is walked once for all.
+    """
+    with ExitStack() as stack:
+        targets = []
+        for output_path, overrides, appended in documents:
+            f = stack.enter_context(open(output_path, 'w', encoding='utf-8', errors='xmlcharrefreplace'))
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            targets.append((f.write, overrides or {}, appended or {}))
+        write_element(targets, root)
+
+def write_document(output_path, root, overrides=None, appended=None):
+    """Write a document like ElementTree.write(encoding='utf-8', xml_declaration=True)."""
+    write_documents(root, [(output_path, overrides, appended)])
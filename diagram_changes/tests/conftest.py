@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+
+import pytest
+
+from helpers import files_dir
+
+# The scripts import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(files_dir), 'scripts'))
+
+@pytest.fixture
+def original_xml():
+    return os.path.join(files_dir, 'input', 'original.xml')
+
+@pytest.fixture
+def changed_xml():
+    return os.path.join(files_dir, 'input', 'changed.xml')
+
+@pytest.fixture
+def expected_changes():
+    """Change set of the sample diagrams as committed, i.e. as detected by the original scripts."""
+    with open(os.path.join(files_dir, 'diagram_changes.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@pytest.fixture
+def expected_diagrams_dir():
+    """Highlighted diagrams of the sample diagrams as committed, i.e. as written by the original scripts."""
+    return os.path.join(files_dir, 'generated_diagrams')
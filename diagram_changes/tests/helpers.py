@@ -0,0 +1,9 @@
+import json
+import os
+
+files_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+
+def normalize_changes(changes):
+    """A change set with the items of every category in a fixed order, without the fact sheet labels."""
+    return {category: sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+            for category, items in changes.items() if category != 'factSheetLabels'}
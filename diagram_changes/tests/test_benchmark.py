@@ -0,0 +1,24 @@
+import pytest
+
+import benchmark
+
+@pytest.mark.parametrize('stages, expected_runs', [
+    (['parse'], ['parse']),
+    (['report'], ['parse', 'detect', 'report']),
+    (['detect', 'generate'], ['parse', 'detect', 'report', 'generate']),
+])
+def test_only_stages_up_to_the_last_selected_one_run(monkeypatch, stages, expected_runs):
+    runs = []
+    for stage in benchmark.benchmark_stages:
+        name = stage.replace('-', '_')
+        method = getattr(benchmark.BenchmarkCase, name)
+
+        def recorded(case, method=method, stage=stage):
+            runs.append(stage)
+            return method(case)
+        monkeypatch.setattr(benchmark.BenchmarkCase, name, recorded)
+
+    results = benchmark.run_benchmarks([200], repeat=1, stages=stages)
+
+    assert list(results['200']['stages']) == stages
+    assert list(dict.fromkeys(runs)) == expected_runs
@@ -0,0 +1,28 @@
+from detect_changes import compare_diagrams, count_changes
+from diagram_records import DiagramRecords
+from helpers import normalize_changes
+
+def test_sample_changes_match_committed_change_set(original_xml, changed_xml, expected_changes):
+    changes = compare_diagrams(original_xml, changed_xml)
+    assert normalize_changes(changes) == normalize_changes(expected_changes)
+
+def test_streaming_extraction_gives_the_same_changes(original_xml, changed_xml):
+    changes = compare_diagrams(original_xml, changed_xml)
+    streamed = compare_diagrams(original_xml, changed_xml, streaming=True)
+    assert normalize_changes(streamed) == normalize_changes(changes)
+
+def test_identical_diagrams_have_no_changes(original_xml):
+    assert count_changes(compare_diagrams(original_xml, original_xml)) == 0
+
+def test_equal_records_share_their_content_hash(original_xml, changed_xml):
+    original = DiagramRecords.from_file(original_xml)
+    again = DiagramRecords.from_file(original_xml)
+    changed = DiagramRecords.from_file(changed_xml)
+    assert again.content_hash == original.content_hash
+    assert changed.content_hash != original.content_hash
+    for object_id, record in original.fact_sheets.items():
+        assert again.fact_sheets[object_id] == record
+        assert again.fact_sheets[object_id].content_hash == record.content_hash
+        other = changed.fact_sheets.get(object_id)
+        if other is not None and other != record:
+            assert other.content_hash != record.content_hash
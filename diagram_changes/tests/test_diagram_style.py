@@ -0,0 +1,35 @@
+import pytest
+
+from diagram_style import format_style, parse_style
+from generate_new_diagrams import modify_style
+
+@pytest.mark.parametrize('style', [
+    '',
+    'ellipse',
+    'leanix_fs_Application;html=1;whiteSpace=wrap',
+    'text;html=1;align=center;verticalAlign=middle;fontFamily=',
+    'shape=image;image=data:image/png,iVBORw0KGgo=;aspect=fixed',
+])
+def test_styles_round_trip(style):
+    assert format_style(parse_style(style)) == style
+
+def test_parse_keeps_empty_values_and_skips_empty_parts():
+    properties = parse_style('rounded=1;;fillColor=;ellipse;')
+    assert properties == {'rounded': '1', 'fillColor': '', 'ellipse': None}
+    assert format_style(properties) == 'rounded=1;fillColor=;ellipse'
+
+def test_parse_keeps_the_last_value_of_repeated_keys():
+    assert parse_style('dashed=0;rounded=1;dashed=1') == {'dashed': '1', 'rounded': '1'}
+    assert parse_style(None) == {}
+
+def test_modify_style_replaces_only_the_highlight_keys():
+    style = 'edgeStyle=orthogonal;dashed=0;dashedPattern=8 8;strokeColor=#000000;strokeWidthScale=2;'
+    assert modify_style(style, '#ff0000') == ('edgeStyle=orthogonal;dashedPattern=8 8;strokeWidthScale=2;'
+                                             'strokeWidth=3;dashed=1;strokeColor=#ff0000')
+
+def test_modify_style_sets_the_label_border_of_standalone_cells():
+    style = 'text;labelBorderColor=#000000;labelBorderColorScheme=1'
+    assert modify_style(style, '#00ff00') == (
+        'text;labelBorderColor=#000000;labelBorderColorScheme=1;strokeWidth=3;dashed=1;strokeColor=#00ff00')
+    assert modify_style(style, '#00ff00', is_standalone=True) == (
+        'text;labelBorderColorScheme=1;strokeWidth=3;dashed=1;strokeColor=#00ff00;labelBorderColor=#00ff00')
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+
+import pytest
+
+from detect_changes import compare_diagrams
+from diff_service import DiffService
+from helpers import files_dir, normalize_changes
+from print_changes import print_report
+
+@pytest.fixture(scope='module')
+def service():
+    service = DiffService(workers=1, root_dir=files_dir)
+    yield service
+    service.close()
+
+def request(service, path, body):
+    status, content_type, payload, headers = asyncio.run(service.respond('POST', path, json.dumps(body).encode()))
+    return status, payload, headers
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def test_compare_returns_the_cli_change_set(service, original_xml, changed_xml):
+    status, payload, headers = request(service, '/compare',
+                                       {'original': read_text(original_xml), 'changed': read_text(changed_xml)})
+    assert status == 200
+    expected = normalize_changes(compare_diagrams(original_xml, changed_xml))
+    assert normalize_changes(json.loads(payload)) == expected
+
+    # Diagrams sent before can be referred to by their keys
+    status, payload, _ = request(service, '/compare', {'originalKey': headers['X-Original-Key'],
+                                                       'changedKey': headers['X-Changed-Key']})
+    assert status == 200
+    assert normalize_changes(json.loads(payload)) == expected
+
+def test_report_returns_the_cli_changelog(service, original_xml, changed_xml):
+    status, payload, _ = request(service, '/report', {'originalPath': 'input/original.xml',
+                                                      'changedPath': 'input/changed.xml'})
+    assert status == 200
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        print_report(compare_diagrams(original_xml, changed_xml))
+    # Items within a section may come in another order
+    assert sorted(payload.decode('utf-8').splitlines()) == sorted(output.getvalue().splitlines())
+
+@pytest.mark.parametrize('path', ['../../../etc/passwd', '/etc/passwd', 'input/../../scripts/diff_service.py'])
+def test_paths_outside_of_the_root_are_rejected(service, path):
+    status, payload, _ = request(service, '/compare', {'originalPath': path, 'changedPath': 'input/changed.xml'})
+    assert status == 403
+
+def test_paths_are_rejected_without_a_root(original_xml, changed_xml):
+    service = DiffService(workers=1)
+    try:
+        status, _, _ = request(service, '/compare', {'originalPath': original_xml, 'changedPath': changed_xml})
+    finally:
+        service.close()
+    assert status == 403
+
+def test_compare_over_http(service, original_xml, changed_xml):
+    async def round_trip():
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        def post():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            body = json.dumps({'originalPath': 'input/original.xml', 'changedPath': 'input/changed.xml'})
+            connection.request('POST', '/compare', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            result = response.status, response.read()
+            connection.close()
+            return result
+
+        async with server:
+            return await asyncio.to_thread(post)
+
+    status, payload = asyncio.run(round_trip())
+    assert status == 200
+    assert normalize_changes(json.loads(payload)) == normalize_changes(compare_diagrams(original_xml, changed_xml))
+
+@pytest.mark.parametrize('key', ['0' * 63, 'A' * 64, 'é' * 64, '0' * 62 + '\r\n', 'x\r\nSet-Cookie: a=b', 64])
+def test_malformed_keys_are_rejected(service, key):
+    status, payload, headers = request(service, '/compare', {'originalKey': key, 'changedKey': '0' * 64})
+    assert status == 400
+    assert 'originalKey' in json.loads(payload)['error']
+    assert headers == {}
+
+async def exchange(service, data):
+    """Raw HTTP response of the service to the raw request bytes."""
+    server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(data)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+@pytest.mark.parametrize('length', ['abc', '-1', '1.5', '²'])
+def test_invalid_content_length_is_rejected(service, length):
+    data = f'POST /compare HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}'.encode('latin-1')
+    response = asyncio.run(exchange(service, data))
+    assert response.startswith(b'HTTP/1.1 400 ')
+    assert b'Invalid Content-Length' in response
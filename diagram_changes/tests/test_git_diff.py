@@ -0,0 +1,65 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from detect_changes import compare_diagrams
+from git_diff import CACHE_VERSION, DiffResultCache, compare_git_history
+from helpers import normalize_changes
+
+def git(repo_path, *args):
+    subprocess.run(['git', '-C', str(repo_path), *args], check=True, capture_output=True)
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch, original_xml, changed_xml):
+    """A repository with the sample diagram at docs/diagram.xml, first original.xml, then changed.xml."""
+    for name in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        monkeypatch.setenv(name, 'Test')
+    for name in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        monkeypatch.setenv(name, 'test@example.com')
+    repo_path = tmp_path / 'repo'
+    (repo_path / 'docs').mkdir(parents=True)
+    git(repo_path, 'init', '-q')
+    for message, source in (('Original', original_xml), ('Changed', changed_xml)):
+        shutil.copy(source, repo_path / 'docs' / 'diagram.xml')
+        git(repo_path, 'add', '.')
+        git(repo_path, 'commit', '-q', '-m', message)
+    (repo_path / 'README').write_text('Unrelated\n')
+    git(repo_path, 'add', '.')
+    git(repo_path, 'commit', '-q', '-m', 'Unrelated')
+    return repo_path
+
+@pytest.mark.parametrize('repo_dir, diagram_path', [('.', 'docs/diagram.xml'), ('docs', 'diagram.xml')])
+def test_history_matches_comparing_the_commits(repo, original_xml, changed_xml, repo_dir, diagram_path):
+    history = compare_git_history(str(repo / repo_dir), diagram_path)
+
+    assert [step['subject'] for step in history['steps']] == ['Changed']
+    expected = compare_diagrams(original_xml, changed_xml)
+    assert normalize_changes(history['steps'][0]['changes']) == normalize_changes(expected)
+
+def test_cached_change_sets_are_reused(repo, tmp_path):
+    cache = DiffResultCache(str(tmp_path / 'cache'))
+    first = compare_git_history(str(repo), 'docs/diagram.xml', cache=cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    second = compare_git_history(str(repo), 'docs/diagram.xml', cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second == first
+
+def test_cache_evicts_old_versions_and_least_recently_used_entries(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache = DiffResultCache(str(cache_dir), max_bytes=250)
+    stale = cache_dir / f'a_b.v{CACHE_VERSION - 1}.json'
+    stale.write_text('{}')
+
+    changes = {'addedCells': [{'id': 'x' * 50}]}
+    for index, blob in enumerate(('1', '2', '3')):
+        cache.put(blob, 'z', changes)
+        os.utime(cache_dir / f'{blob}_z.v{CACHE_VERSION}.json', (index, index))
+    assert cache.get('1', 'z') == changes
+
+    cache.put('4', 'z', changes)
+    assert not stale.exists()
+    # '1' was read last and survives, '2' is the least recently used entry
+    assert sorted(os.listdir(cache_dir)) == [f'{blob}_z.v{CACHE_VERSION}.json' for blob in ('1', '3', '4')]
+    assert cache.evictions == 2
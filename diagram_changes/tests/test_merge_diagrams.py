@@ -0,0 +1,82 @@
+import pytest
+
+from diagram_index import DiagramIndex
+from merge_diagrams import merge_diagrams
+
+fact_sheet = '''
+    <object type="factSheet" label="{label}" factSheetType="Application" factSheetId="fs-1" id="2">
+      <mxCell style="leanix_fs_Application" parent="1" vertex="1">
+        <mxGeometry x="{x}" y="40" width="80" height="45" as="geometry" />
+      </mxCell>
+    </object>'''
+
+def diagram(*elements):
+    return ('<mxGraphModel dx="800" dy="600" grid="1">\n  <root>\n    <mxCell id="0" />\n'
+            '    <mxCell id="1" parent="0" />' + ''.join(elements) + '\n  </root>\n</mxGraphModel>\n')
+
+def text_cell(cell_id, value, x):
+    return f'''
+    <mxCell id="{cell_id}" value="{value}" style="text;html=1;" parent="1" vertex="1">
+      <mxGeometry x="{x}" y="200" width="60" height="30" as="geometry" />
+    </mxCell>'''
+
+def edge_cell(cell_id, source, target):
+    return f'''
+    <mxCell id="{cell_id}" style="endArrow=classic;" parent="1" source="{source}" target="{target}" edge="1">
+      <mxGeometry relative="1" as="geometry" />
+    </mxCell>'''
+
+def elements_by_id(path):
+    return {elem.get('id'): elem for elem in DiagramIndex.from_file(path).root.iter() if elem.get('id') is not None}
+
+@pytest.fixture
+def write(tmp_path):
+    def write(name, text):
+        path = tmp_path / f'{name}.xml'
+        path.write_text(text, encoding='utf-8')
+        return str(path)
+    return write
+
+def test_fields_changed_on_different_sides_are_merged(write, tmp_path):
+    base = write('base', diagram(fact_sheet.format(label='CRM', x=10)))
+    ours = write('ours', diagram(fact_sheet.format(label='Customer CRM', x=10)))
+    theirs = write('theirs', diagram(fact_sheet.format(label='CRM', x=50)))
+    output = str(tmp_path / 'merged.xml')
+
+    result = merge_diagrams(base, ours, theirs, output)
+
+    assert result['conflicts'] == []
+    assert result['merged']['merged'] == 1
+    fact_sheet_elem = elements_by_id(output)['2']
+    assert fact_sheet_elem.get('label') == 'Customer CRM'
+    assert fact_sheet_elem.find('mxCell/mxGeometry').get('x') == '50'
+
+def test_fields_changed_differently_on_both_sides_conflict(write, tmp_path):
+    base = write('base', diagram(fact_sheet.format(label='CRM', x=10)))
+    ours = write('ours', diagram(fact_sheet.format(label='Customer CRM', x=10)))
+    theirs = write('theirs', diagram(fact_sheet.format(label='Sales CRM', x=50)))
+    output = str(tmp_path / 'merged.xml')
+
+    result = merge_diagrams(base, ours, theirs, output, prefer='theirs')
+
+    assert [(conflict['type'], conflict['id'], conflict['ours'], conflict['theirs'])
+            for conflict in result['conflicts']] == [('modify/modify', '2', 'Customer CRM', 'Sales CRM')]
+    fact_sheet_elem = elements_by_id(output)['2']
+    assert fact_sheet_elem.get('label') == 'Sales CRM'
+    assert fact_sheet_elem.find('mxCell/mxGeometry').get('x') == '50'
+
+def test_ids_added_on_both_sides_are_renamed(write, tmp_path):
+    base = write('base', diagram(fact_sheet.format(label='CRM', x=10)))
+    ours = write('ours', diagram(fact_sheet.format(label='CRM', x=10), text_cell('10', 'Ours', 0)))
+    theirs = write('theirs', diagram(fact_sheet.format(label='CRM', x=10), text_cell('10', 'Theirs', 100),
+                                     edge_cell('11', '10', '2')))
+    output = str(tmp_path / 'merged.xml')
+
+    result = merge_diagrams(base, ours, theirs, output)
+
+    assert result['conflicts'] == []
+    assert result['renamed'] == {'10': '10_theirs'}
+    cells = elements_by_id(output)
+    assert cells['10'].get('value') == 'Ours'
+    assert cells['10_theirs'].get('value') == 'Theirs'
+    assert (cells['11'].get('source'), cells['11'].get('target')) == ('10_theirs', '2')
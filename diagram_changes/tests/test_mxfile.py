@@ -0,0 +1,68 @@
+import base64
+import urllib.parse
+import zlib
+from pathlib import Path
+
+import pytest
+
+from compare_pages import compare_mxfiles
+from detect_changes import compare_diagrams
+from diagram_records import DiagramRecords
+from helpers import normalize_changes
+from mxfile import decode_diagram_text, read_pages
+
+def compress(xml):
+    """Page text as draw.io stores it: base64(deflate(encodeURIComponent(xml)))."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    encoded = urllib.parse.quote(xml, safe="-_.!~*'()").encode('ascii')
+    return base64.b64encode(compressor.compress(encoded) + compressor.flush()).decode('ascii')
+
+def page(page_id, name, xml, compressed=False):
+    content = compress(xml) if compressed else xml
+    return f'  <diagram id="{page_id}" name="{name}">{content}</diagram>\n'
+
+def write_mxfile(path, *pages):
+    path.write_text('<mxfile host="app.diagrams.net">\n' + ''.join(pages) + '</mxfile>\n', encoding='utf-8')
+    return str(path)
+
+def test_compressed_page_round_trip(original_xml):
+    xml = Path(original_xml).read_text(encoding='utf-8')
+    assert decode_diagram_text(compress(xml)) == xml.encode('utf-8')
+
+def test_compressed_page_is_read_like_the_bare_diagram(tmp_path, original_xml, changed_xml):
+    xml = Path(original_xml).read_text(encoding='utf-8')
+    mxfile = write_mxfile(tmp_path / 'original.drawio', page('p1', 'Landscape', xml, compressed=True))
+
+    (read,) = read_pages(mxfile)
+    assert (read.id, read.name, read.xml) == ('p1', 'Landscape', xml.encode('utf-8'))
+    assert DiagramRecords.from_file(mxfile).content_hash == DiagramRecords.from_file(original_xml).content_hash
+    assert normalize_changes(compare_diagrams(mxfile, changed_xml)) == normalize_changes(
+        compare_diagrams(original_xml, changed_xml))
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_pages_are_matched_by_id_then_name(tmp_path, original_xml, changed_xml, workers):
+    original, changed = (Path(path).read_text(encoding='utf-8') for path in (original_xml, changed_xml))
+    original_file = write_mxfile(tmp_path / 'original.drawio',
+                                 page('p1', 'Landscape', original),
+                                 page('p2', 'Capabilities', original, compressed=True),
+                                 page('p3', 'Old', original),
+                                 page('p4', 'Renamed before', original))
+    changed_file = write_mxfile(tmp_path / 'changed.drawio',
+                                page('p9', 'New', changed),
+                                page('p1', 'Landscape', changed, compressed=True),
+                                page('p2', 'Capabilities', original),
+                                page('p5', 'Renamed before', changed))
+
+    result = compare_mxfiles(original_file, changed_file, workers=workers)
+
+    assert [(entry['id'], entry['name'], entry['status']) for entry in result['pages']] == [
+        ('p9', 'New', 'added'),
+        ('p1', 'Landscape', 'changed'),
+        ('p2', 'Capabilities', 'unchanged'),
+        ('p5', 'Renamed before', 'changed'),
+        ('p3', 'Old', 'removed'),
+    ]
+    expected = normalize_changes(compare_diagrams(original_xml, changed_xml))
+    for entry in result['pages']:
+        if entry['status'] == 'changed':
+            assert normalize_changes(entry['changes']) == expected
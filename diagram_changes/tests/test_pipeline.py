@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+from helpers import files_dir
+
+def run_python(code):
+    scripts_dir = os.path.join(os.path.dirname(files_dir), 'scripts')
+    return subprocess.run([sys.executable, '-c', code], cwd=scripts_dir, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+def test_match_stage_is_only_loaded_when_used(original_xml, changed_xml):
+    code = ("import sys\nfrom pipeline import Pipeline\n"
+            f"pipeline = Pipeline({original_xml!r}, {changed_xml!r})\n"
+            "pipeline.detect()\nprint('match_moves' in sys.modules)\n"
+            "pipeline.match()\nprint('match_moves' in sys.modules)")
+    assert run_python(code).splitlines()[-2:] == ['False', 'True']
@@ -0,0 +1,135 @@
+import json
+import os
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+
+from render_diagram import RenderCache, RendererPool
+
+# Stand-in for the draw.io export CLI: converts every diagram of the input directory, logs each
+# run, skips diagrams containing FAIL and exits with an error for diagrams containing CRASH
+fake_exporter = '''
+import json, os, sys, time
+args = sys.argv[1:]
+format, output_dir, input_dir = args[args.index('--format') + 1], args[args.index('--output') + 1], args[-1]
+start = time.time()
+names = sorted(os.listdir(input_dir))
+contents = {name: open(os.path.join(input_dir, name)).read() for name in names}
+if any('CRASH' in content for content in contents.values()):
+    sys.exit('renderer crashed')
+time.sleep(0.05)
+for name, content in contents.items():
+    if 'FAIL' not in content:
+        with open(os.path.join(output_dir, os.path.splitext(name)[0] + '.' + format), 'w') as f:
+            f.write(format + ':' + content)
+with open(os.environ['FAKE_EXPORTER_LOG'], 'a') as f:
+    f.write(json.dumps({'format': format, 'jobs': len(names), 'start': start, 'end': time.time()}) + '\\n')
+'''
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    path = tmp_path / 'fake_drawio'
+    path.write_text(f'#!{sys.executable}\n{fake_exporter}')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv('FAKE_EXPORTER_LOG', str(tmp_path / 'exports.log'))
+    return str(path)
+
+def exporter_runs(tmp_path):
+    log_path = tmp_path / 'exports.log'
+    return [json.loads(line) for line in log_path.read_text().splitlines()] if log_path.exists() else []
+
+def make_jobs(tmp_path, contents, format='png'):
+    jobs = []
+    for index, content in enumerate(contents):
+        input_path = tmp_path / f'{format}{index}.xml'
+        input_path.write_text(content)
+        jobs.append((str(input_path), str(tmp_path / 'out' / f'{format}{index}.{format}'), format))
+    return jobs
+
+def max_concurrent(runs):
+    events = sorted([(run['start'], 1) for run in runs] + [(run['end'], -1) for run in runs])
+    current = peak = 0
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+def test_jobs_are_batched_per_format(exporter, tmp_path):
+    jobs = make_jobs(tmp_path, [f'<mxGraphModel id="{index}"/>' for index in range(5)])
+    jobs.insert(2, make_jobs(tmp_path, ['<mxGraphModel id="svg"/>'], format='svg')[0])
+
+    with RendererPool(exporter, max_workers=2, batch_size=2) as pool:
+        results = pool.render(jobs)
+
+    assert [result['ok'] for result in results] == [True] * 6
+    assert [result['output'] for result in results] == [job[1] for job in jobs]
+    for input_path, output_path, format in jobs:
+        assert Path(output_path).read_text() == f'{format}:{Path(input_path).read_text()}'
+    assert sorted((run['format'], run['jobs']) for run in exporter_runs(tmp_path)) == [
+        ('png', 1), ('png', 2), ('png', 2), ('svg', 1)]
+
+def test_failures_are_reported_per_job(exporter, tmp_path):
+    jobs = make_jobs(tmp_path, ['<ok/>', '<FAIL/>', '<ok/>', '<CRASH/>'])
+    jobs.append((str(tmp_path / 'missing.xml'), str(tmp_path / 'out' / 'missing.png'), 'png'))
+
+    with RendererPool(exporter, max_workers=2, batch_size=2) as pool:
+        results = pool.render(jobs)
+
+    assert [result['ok'] for result in results] == [True, False, False, False, False]
+    assert 'error' not in results[0]
+    assert 'no output' in results[1]['error']
+    # The whole batch of a crashed export fails with the renderer's error
+    assert 'renderer crashed' in results[2]['error']
+    assert 'renderer crashed' in results[3]['error']
+    assert 'Input file not found' in results[4]['error']
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_concurrent_exports_are_bounded_by_max_workers(exporter, tmp_path, max_workers):
+    jobs = make_jobs(tmp_path, [f'<mxGraphModel id="{index}"/>' for index in range(8)])
+
+    with RendererPool(exporter, max_workers=max_workers, batch_size=1) as pool:
+        results = pool.render(jobs)
+
+    assert all(result['ok'] for result in results)
+    runs = exporter_runs(tmp_path)
+    assert len(runs) == 8
+    assert max_concurrent(runs) == max_workers
+
+def test_render_cache_is_keyed_by_content_format_and_renderer(exporter, tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'))
+    (job,) = make_jobs(tmp_path, ['<mxGraphModel id="cached"/>'])
+    copy = tmp_path / 'copy.xml'
+    copy.write_text('<mxGraphModel id="cached"/>')
+
+    with RendererPool(exporter, cache=cache) as pool:
+        assert [result['cached'] for result in pool.render([job])] == [False]
+        # The same content under another path is served from the cache
+        results = pool.render([job, (str(copy), str(tmp_path / 'out' / 'copy.png'), 'png')])
+        assert [result['cached'] for result in results] == [True, True]
+        assert Path(results[1]['output']).read_text() == 'png:<mxGraphModel id="cached"/>'
+        # Another format is rendered again
+        assert [result['cached'] for result in pool.render([(job[0], job[1] + '.svg', 'svg')])] == [False]
+    assert len(exporter_runs(tmp_path)) == 2
+
+    # Upgrading the renderer changes its version, so earlier renders are not reused
+    stat = Path(exporter).stat()
+    os.utime(exporter, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    with RendererPool(exporter, cache=cache) as pool:
+        assert [result['cached'] for result in pool.render([job])] == [False]
+    assert len(exporter_runs(tmp_path)) == 3
+    assert (cache.hits, cache.misses) == (2, 3)
+
+def test_render_cache_evicts_least_recently_used_renders(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), max_bytes=25)
+    rendered = tmp_path / 'rendered.png'
+    rendered.write_bytes(b'x' * 10)
+    for index, key in enumerate(('a', 'b')):
+        cache.store(key, 'png', str(rendered))
+        os.utime(tmp_path / 'cache' / f'{key}.png', (index, index))
+    assert cache.fetch('a', 'png', str(tmp_path / 'a.png'))
+
+    cache.store('c', 'png', str(rendered))
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['a.png', 'c.png']
+    assert cache.evictions == 1
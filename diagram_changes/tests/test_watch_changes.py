@@ -0,0 +1,81 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from detect_changes import compare_diagrams
+from generate_new_diagrams import diagram_file_names, generate_diagrams
+from helpers import normalize_changes
+from synthetic_diagram import generate_diagram_pair
+from watch_changes import WatchSession
+
+def save(path, old, new):
+    """Edit a diagram file the way an editor saves it."""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    assert old in text
+    stat = os.stat(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text.replace(old, new, 1))
+    # Make sure the save is seen even on file systems with a coarse mtime
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+@pytest.fixture
+def session(tmp_path, original_xml, changed_xml):
+    shutil.copy(original_xml, tmp_path / 'original.xml')
+    shutil.copy(changed_xml, tmp_path / 'changed.xml')
+    return WatchSession(str(tmp_path / 'original.xml'), str(tmp_path / 'changed.xml'),
+                        generated_dir=str(tmp_path / 'watched'))
+
+def assert_full_run_matches(session, tmp_path):
+    original, changed = session.original.path, session.changed.path
+    changes = compare_diagrams(original, changed)
+    assert normalize_changes(session.changes) == normalize_changes(changes)
+
+    full_dir = tmp_path / 'full'
+    full_dir.mkdir(exist_ok=True)
+    output_paths = {name: str(full_dir / file_name) for name, file_name in diagram_file_names.items()}
+    generate_diagrams(original, changed, changes, output_paths)
+    for name, output_path in output_paths.items():
+        assert Path(session.output_path(name)).read_bytes() == Path(output_path).read_bytes(), name
+
+@pytest.mark.parametrize('edited, old, new', [
+    ('changed.xml', 'value="This relation doesn&#39;t make sense"', 'value="This relation makes sense"'),
+    ('changed.xml', '<mxGeometry x="0.0612" y="3"', '<mxGeometry x="0.5" y="3"'),
+    ('original.xml', 'dependencyRelation="RelToChild"', 'dependencyRelation="RelToParent"'),
+])
+def test_rediff_after_a_save_equals_a_full_run(session, tmp_path, edited, old, new):
+    assert session.update() is not None
+    assert session.update() is None
+
+    save(str(tmp_path / edited), old, new)
+    summary = session.update()
+    assert summary['files'] == [str(tmp_path / edited)]
+    assert_full_run_matches(session, tmp_path)
+
+def test_unchanged_content_is_not_rediffed(session, tmp_path):
+    session.update()
+    changed = str(tmp_path / 'changed.xml')
+    save(changed, '<mxGraphModel', '<mxGraphModel')
+    assert session.update() is None
+
+def test_rediff_is_not_slower_than_an_uncached_diff(tmp_path):
+    original, changed = str(tmp_path / 'original.xml'), str(tmp_path / 'changed.xml')
+    generate_diagram_pair(5000, original, changed, changed_ratio=0.2)
+    session = WatchSession(original, changed)
+    session.update()
+
+    # Saves with new content are diffed again, even if no element changed
+    rediffs = []
+    for old, new in [('</mxGraphModel>\n', '</mxGraphModel>\n\n'), ('</mxGraphModel>\n\n', '</mxGraphModel>\n')] * 2:
+        save(changed, old, new)
+        rediffs.append(session.update()['timings']['detect'])
+
+    full_diffs = []
+    for _ in range(len(rediffs)):
+        start = time.perf_counter()
+        compare_diagrams(session.original.records, session.changed.records)
+        full_diffs.append(time.perf_counter() - start)
+    assert min(rediffs) <= min(full_diffs) * 1.5 + 0.005
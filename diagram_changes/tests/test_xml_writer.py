@@ -0,0 +1,56 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from detect_changes import compare_diagrams
+from diagram_index import DiagramIndex
+from generate_new_diagrams import ChangeIndex, diagram_file_names, generate_diagrams
+from xml_writer import write_document, write_documents
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write_with_elementtree(root, path):
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+def test_sample_diagram_is_written_like_elementtree(original_xml, tmp_path):
+    root = ET.parse(original_xml).getroot()
+    write_document(tmp_path / 'written.xml', root)
+    write_with_elementtree(root, tmp_path / 'expected.xml')
+    assert read_bytes(tmp_path / 'written.xml') == read_bytes(tmp_path / 'expected.xml')
+
+@pytest.mark.parametrize('value', ['a & b', '<b>"quoted"</b>', 'line\nbreak\r\ttab', 'ünïcödé ✓', ''])
+def test_escaping_matches_elementtree(value, tmp_path):
+    root = ET.Element('mxGraphModel', {'label': value})
+    child = ET.SubElement(root, 'object', {'value': value})
+    child.text = value
+    child.tail = value
+    ET.SubElement(root, 'mxCell')
+    write_document(tmp_path / 'written.xml', root)
+    write_with_elementtree(root, tmp_path / 'expected.xml')
+    assert read_bytes(tmp_path / 'written.xml') == read_bytes(tmp_path / 'expected.xml')
+
+def test_overrides_and_appended_children_leave_the_tree_unchanged(tmp_path):
+    root = ET.fromstring('<root><mxCell id="2" style="a" /></root>')
+    cell = root[0]
+    extra = ET.Element('mxCell', {'id': '3'})
+    write_documents(root, [(tmp_path / 'variant.xml', {cell: {'id': '2', 'style': 'b'}}, {root: [extra]}),
+                           (tmp_path / 'plain.xml', None, None)])
+
+    expected = ET.fromstring('<root><mxCell id="2" style="b" /><mxCell id="3" /></root>')
+    write_with_elementtree(expected, tmp_path / 'expected.xml')
+    assert read_bytes(tmp_path / 'variant.xml') == read_bytes(tmp_path / 'expected.xml')
+    assert cell.get('style') == 'a' and len(root) == 1
+    write_with_elementtree(root, tmp_path / 'expected_plain.xml')
+    assert read_bytes(tmp_path / 'plain.xml') == read_bytes(tmp_path / 'expected_plain.xml')
+
+def test_generated_diagrams_match_committed_diagrams(original_xml, changed_xml, expected_diagrams_dir, tmp_path):
+    original_index = DiagramIndex.from_file(original_xml)
+    changed_index = DiagramIndex.from_file(changed_xml)
+    changes = compare_diagrams(original_index, changed_index)
+    output_paths = {name: os.path.join(tmp_path, file_name) for name, file_name in diagram_file_names.items()}
+    generate_diagrams(original_index, changed_index, ChangeIndex(changes), output_paths)
+    for name, file_name in diagram_file_names.items():
+        assert read_bytes(output_paths[name]) == read_bytes(os.path.join(expected_diagrams_dir, file_name)), name